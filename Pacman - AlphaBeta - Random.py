@@ -1,9 +1,19 @@
 import numpy as np
 import random
-import os
-import platform
-from time import sleep
+from math import inf, nextafter
+from collections import Counter
+from itertools import product
+from time import perf_counter
 from random import choice
+from pacman_layouts import layout_tables, parse_layout
+from pacman_maze import maze_distance
+from pacman_mcts import MCTS
+from pacman_parallel import ParallelSearch, Ponderer
+from pacman_pellets import PelletIndex
+from pacman_render import make_renderer
+from pacman_stats import SearchStats, record
+from pacman_trace import TraceWriter
+from pacman_transposition import TranspositionTable, EXACT, LOWER, UPPER
 
 # Constants for the game
 WALL = '#'
@@ -22,23 +32,10 @@ DIRECTIONS = [UP, DOWN, LEFT, RIGHT]
 # Initial Game Board Setup
 def create_board(width, height):
     board = np.full((height, width), PELLET)
-    for i in range(height):
-        for j in range(width):
-            if i == 0 or i == height - 1 or j == 0 or j == width - 1:
-                board[i, j] = WALL
+    board[[0, -1], :] = WALL
+    board[:, [0, -1]] = WALL
     return board
 
-# Function to display the game board
-def display_board(board, pacman_pos, ghost_pos):
-    os.system('cls' if platform.system() == 'Windows' else 'clear')
-    temp_board = np.copy(board)
-    temp_board[pacman_pos] = PACMAN
-    for pos in ghost_pos:
-        temp_board[pos] = GHOST
-    for row in temp_board:
-        print(' '.join(row))
-
-
 # Function to count the number of pellets remaining
 def count_pellets(board):
     return np.sum(board == PELLET)
@@ -54,130 +51,678 @@ def move_character(position, direction, board):
 def is_game_over(pacman_pos, ghost_pos):
     return pacman_pos in ghost_pos
 
-# Function to create a custom layout
+# Function to create a custom layout (see parse_layout(); generate_layout() makes new ones)
 def create_custom_layout(layout):
-    height = len(layout)
-    width = len(layout[0])
-    board = np.full((height, width), EMPTY)
-    pacman_pos = None
-    ghost_pos = []
-
-    for i, row in enumerate(layout):
-        for j, cell in enumerate(row):
-            if cell == WALL:
-                board[i, j] = WALL
-            elif cell == PELLET:
-                board[i, j] = PELLET
-            elif cell == PACMAN:
-                pacman_pos = (i, j)
-            elif cell == GHOST:
-                ghost_pos.append((i, j))
-            # Empty space is already the default
-
-    return board, pacman_pos, ghost_pos
+    return parse_layout(layout)
+
+# Distance from Pac-Man to the closest ghost, through the maze when distances is given
+def nearest_ghost_distance(pacman_pos, ghost_pos, distances=None):
+    return min(maze_distance(pacman_pos, pos, distances) for pos in ghost_pos)
+
+# Move ordering strategies for the AlphaBeta search. Each one receives the children of a
+# node as (move, pacman_pos, ghost_pos, key) tuples plus the pellets left at that node and
+# returns the children in the order to search them. Good moves first means earlier cutoffs.
+def order_ghost_distance_first(board, children, is_max, pellets):
+    # Pac-Man tries to run away first, ghosts try to close in first
+    if is_max:
+        return sorted(children, key=lambda child: -nearest_ghost_distance(child[1], child[2]))
+    return sorted(children, key=lambda child: nearest_ghost_distance(child[1], child[2]))
+
+def order_pellet_first(board, children, is_max, pellets):
+    # Pac-Man tries moves onto pellets first, ghosts still chase first
+    if is_max:
+        return sorted(children, key=lambda child: child[1] not in pellets)
+    return order_ghost_distance_first(board, children, is_max, pellets)
+
+# Function to list the (move, new_pos) pairs that leave pos, from the layout's MoveTable when
+# one is given and by trying every direction on the board otherwise
+def legal_moves(pos, board, moves=None):
+    if moves is not None:
+        return moves.moves[pos]
+    legal = []
+    for move in DIRECTIONS:
+        new_pos = move_character(pos, move, board)
+        if new_pos != pos:
+            legal.append((move, new_pos))
+    return legal
+
+# Function to generate the children of a search node as (move, pacman_pos, ghost_pos, key).
+# key is the child's Zobrist key when a hasher is given, None otherwise; it includes the
+# pellet Pac-Man eats by moving when pellets is given.
+def generate_children(board, pacman_pos, ghost_pos, is_max, zobrist=None, key=None, pellets=None, moves=None):
+    children = []
+    if is_max:
+        for move, new_pos in legal_moves(pacman_pos, board, moves):
+            child_key = None
+            if zobrist:
+                child_key = zobrist.pacman_move(key, pacman_pos, new_pos)
+                if pellets is not None and new_pos in pellets:
+                    child_key = zobrist.toggle_pellet(child_key, new_pos)
+            children.append((move, new_pos, ghost_pos, child_key))
+    else:
+        for i, pos in enumerate(ghost_pos):
+            for move, new_pos in legal_moves(pos, board, moves):
+                new_ghost_pos = list(ghost_pos)
+                new_ghost_pos[i] = new_pos
+                child_key = zobrist.ghost_move(key, ghost_pos, pos, new_pos) if zobrist else None
+                children.append((move, pacman_pos, new_ghost_pos, child_key))
+    return children
+
+# Smallest number of leaves worth scoring with evaluate_batch() instead of one evaluate() each
+BATCH_MIN_CHILDREN = 8
+
+# Raised by alphabeta() when its deadline has passed
+class SearchTimeout(Exception):
+    pass
 
 # AlphaBeta algorithm implementation
-def alphabeta(board, pacman_pos, ghost_pos, depth, is_max, max_depth=3):
+# alpha is the score Pac-Man is already guaranteed, beta the score the ghosts are already
+# guaranteed; once they cross, the rest of the node cannot change the result and is pruned.
+# With a transposition table, positions already searched deep enough are answered from the
+# table and the best child found last time is searched first.
+# pellets is the PelletIndex of the board; Pac-Man eats from it while searching a line and
+# the pellets are put back when the search returns. One is built from the board if not given.
+# distances is the layout's DistanceTable; without it evaluate() falls back to Manhattan distance.
+# moves is the layout's MoveTable; without it successors are found with move_character().
+# Past the perf_counter() deadline the search gives up by raising SearchTimeout.
+# With batch_leaves, nodes at the last ply with at least BATCH_MIN_CHILDREN children score them
+# together with evaluate_batch(). Only ghost nodes get that wide, and below a ghost move all
+# children share Pac-Man's cell; for Pac-Man's four moves plain evaluate() is cheaper.
+# stats is a SearchStats to count nodes, cutoffs and table hits and to time evaluate() and
+# successor generation; without one none of that is done.
+# weights are the evaluate() weights of the side searching, WEIGHTS when not given.
+# With pvs (principal variation search) only the first child of a node gets the full window;
+# the others are searched with a null window that only tells whether they beat it, and are
+# searched again with the full window when one does.
+# pv is a predicted line of Pac-Man's moves (see principal_variation()): its first move is
+# tried first at Pac-Man's nodes, and the rest is passed down the first child, so the line
+# is followed as long as it matches. The table's best child still goes before it.
+def alphabeta(board, pacman_pos, ghost_pos, depth, is_max, max_depth=3,
+              alpha=float('-inf'), beta=float('inf'), order_moves=order_pellet_first, tt=None, key=None,
+              pellets=None, distances=None, deadline=None, batch_leaves=False, moves=None, stats=None,
+              weights=None, pvs=False, pv=None):
+    if deadline is not None and perf_counter() > deadline:
+        raise SearchTimeout
+    if pellets is None:
+        pellets = PelletIndex(board)
+    if stats is not None:
+        stats.node(depth)
     if depth == max_depth or is_game_over(pacman_pos, ghost_pos):
-        return None, evaluate(pacman_pos, ghost_pos, board)
-
+        if stats is None:
+            return None, evaluate(pacman_pos, ghost_pos, board, pellets, distances, weights)
+        start = perf_counter()
+        score = evaluate(pacman_pos, ghost_pos, board, pellets, distances, weights)
+        stats.evaluate_time += perf_counter() - start
+        stats.leaves += 1
+        return None, score
+
+    best_child_key = None
+    if tt is not None:
+        if key is None:
+            key = tt.zobrist.hash(pacman_pos, ghost_pos, is_max)
+        entry = tt.probe(key)
+        if stats is not None:
+            stats.tt_probes += 1
+        if entry is not None:
+            value, entry_depth, flag, entry_move, best_child_key = entry
+            if entry_depth >= max_depth - depth:
+                if flag == EXACT or (flag == LOWER and value >= beta) or (flag == UPPER and value <= alpha):
+                    if stats is not None:
+                        stats.tt_hits += 1
+                    return entry_move, value
+
+    if stats is not None:
+        start = perf_counter()
+    children = generate_children(board, pacman_pos, ghost_pos, is_max, tt.zobrist if tt is not None else None, key,
+                                 pellets, moves)
+    if order_moves is not None:
+        children = order_moves(board, children, is_max, pellets)
+    if pv and is_max:
+        children.sort(key=lambda child: child[0] != pv[0])
+    if best_child_key is not None:
+        children.sort(key=lambda child: child[3] != best_child_key)
+    if stats is not None:
+        stats.successor_time += perf_counter() - start
+    if pv and is_max:
+        pv = pv[1:] if children and children[0][0] == pv[0] else None  # Followed down the first child only
+    null_windows = pvs and depth + 1 < max_depth  # A leaf's score is exact, so it is never searched twice
+
+    leaf_scores = None
+    if batch_leaves and depth + 1 == max_depth and len(children) >= BATCH_MIN_CHILDREN:
+        if stats is not None:
+            start = perf_counter()
+        leaf_scores = evaluate_batch(children, pellets, distances, weights)
+        if stats is not None:
+            stats.evaluate_time += perf_counter() - start
+            stats.leaves += len(children)
+            for _ in children:
+                stats.node(depth + 1)
+
+    alpha_orig, beta_orig = alpha, beta
+    best_move = None
     if is_max:
-        best_move = None
         best_score = float('-inf')
-        for move in DIRECTIONS:
-            new_pos = move_character(pacman_pos, move, board)
-            if new_pos != pacman_pos:
-                _, score = alphabeta(board, new_pos, ghost_pos, depth + 1, False, max_depth)
-                if score > best_score:
-                    best_score = score
-                    best_move = move
-        return best_move, best_score
+        for i, (move, new_pacman_pos, new_ghost_pos, child_key) in enumerate(children):
+            if leaf_scores is not None:
+                score = leaf_scores[i]
+            else:
+                eats = new_pacman_pos in pellets
+                if eats:
+                    pellets.eat(new_pacman_pos)
+                if null_windows and i > 0:
+                    _, score = alphabeta(board, new_pacman_pos, new_ghost_pos, depth + 1, False, max_depth,
+                                         alpha, nextafter(alpha, inf), order_moves, tt, child_key, pellets,
+                                         distances, deadline, batch_leaves, moves, stats, weights, pvs)
+                    if alpha < score < beta:  # Better than the first child: find out by how much
+                        if stats is not None:
+                            stats.researches += 1
+                        _, score = alphabeta(board, new_pacman_pos, new_ghost_pos, depth + 1, False, max_depth,
+                                             alpha, beta, order_moves, tt, child_key, pellets, distances, deadline,
+                                             batch_leaves, moves, stats, weights, pvs)
+                else:
+                    _, score = alphabeta(board, new_pacman_pos, new_ghost_pos, depth + 1, False, max_depth,
+                                         alpha, beta, order_moves, tt, child_key, pellets, distances, deadline,
+                                         batch_leaves, moves, stats, weights, pvs, pv if i == 0 else None)
+                if eats:
+                    pellets.restore(new_pacman_pos)
+            if score > best_score:
+                best_score = score
+                best_move = move
+                best_child_key = child_key
+            alpha = max(alpha, best_score)
+            if alpha >= beta:
+                if stats is not None:
+                    stats.cutoff(depth)
+                break  # The ghosts will never allow this line
     else:
+        best_score = float('inf')
+        for i, (move, new_pacman_pos, new_ghost_pos, child_key) in enumerate(children):
+            if leaf_scores is not None:
+                score = leaf_scores[i]
+            elif null_windows and i > 0:
+                _, score = alphabeta(board, new_pacman_pos, new_ghost_pos, depth + 1, True, max_depth,
+                                     nextafter(beta, -inf), beta, order_moves, tt, child_key, pellets, distances,
+                                     deadline, batch_leaves, moves, stats, weights, pvs)
+                if alpha < score < beta:  # Worse for Pac-Man than the first child: find out by how much
+                    if stats is not None:
+                        stats.researches += 1
+                    _, score = alphabeta(board, new_pacman_pos, new_ghost_pos, depth + 1, True, max_depth,
+                                         alpha, beta, order_moves, tt, child_key, pellets, distances, deadline,
+                                         batch_leaves, moves, stats, weights, pvs)
+            else:
+                _, score = alphabeta(board, new_pacman_pos, new_ghost_pos, depth + 1, True, max_depth,
+                                     alpha, beta, order_moves, tt, child_key, pellets, distances, deadline,
+                                     batch_leaves, moves, stats, weights, pvs, pv if i == 0 else None)
+            if score < best_score:
+                best_score = score
+                best_move = move
+                best_child_key = child_key
+            beta = min(beta, best_score)
+            if alpha >= beta:
+                if stats is not None:
+                    stats.cutoff(depth)
+                break  # Pac-Man will never allow this line
+
+    if tt is not None:
+        if best_score <= alpha_orig:
+            flag = UPPER
+        elif best_score >= beta_orig:
+            flag = LOWER
+        else:
+            flag = EXACT
+        tt.store(key, best_score, max_depth - depth, flag, best_move, best_child_key)
+    return best_move, best_score
+
+# Joint ghost decision: one search from the ghosts' side that picks a move for every ghost,
+# instead of one identical search per ghost. The root's children are searched ghost by ghost,
+# each ghost with a window of its own so the best move of one ghost cannot cut off the moves
+# of the next; below the root these are ordinary alphabeta() searches.
+# Returns the list of each ghost's best move (None for a ghost that cannot move) and the list
+# of the scores those moves lead to. stats, weights and pvs are used as by alphabeta().
+def alphabeta_ghost_moves(board, pacman_pos, ghost_pos, max_depth=3, order_moves=order_pellet_first, tt=None,
+                          pellets=None, distances=None, deadline=None, batch_leaves=False, moves=None, stats=None,
+                          weights=None, pvs=False):
+    if pellets is None:
+        pellets = PelletIndex(board)
+    if stats is not None:
+        stats.node(0)
+    zobrist = tt.zobrist if tt is not None else None
+    key = zobrist.hash(pacman_pos, ghost_pos, False) if zobrist else None
+
+    ghost_moves = []
+    ghost_scores = []
+    for i, pos in enumerate(ghost_pos):
+        if stats is not None:
+            start = perf_counter()
+        children = []
+        for move, new_pos in legal_moves(pos, board, moves):
+            new_ghost_pos = list(ghost_pos)
+            new_ghost_pos[i] = new_pos
+            child_key = zobrist.ghost_move(key, ghost_pos, pos, new_pos) if zobrist else None
+            children.append((move, pacman_pos, new_ghost_pos, child_key))
+        if order_moves is not None:
+            children = order_moves(board, children, False, pellets)
+        if stats is not None:
+            stats.successor_time += perf_counter() - start
+
         best_move = None
         best_score = float('inf')
-        for pos in ghost_pos:
-            for move in DIRECTIONS:
-                new_pos = move_character(pos, move, board)
-                if new_pos != pos:
-                    _, score = alphabeta(board, pacman_pos, [new_pos if x == pos else x for x in ghost_pos], depth + 1, True, max_depth)
-                    if score < best_score:
-                        best_score = score
-                        best_move = move
+        for move, new_pacman_pos, new_ghost_pos, child_key in children:
+            _, score = alphabeta(board, new_pacman_pos, new_ghost_pos, 1, True, max_depth, float('-inf'), best_score,
+                                 order_moves, tt, child_key, pellets, distances, deadline, batch_leaves, moves, stats,
+                                 weights, pvs)
+            if score < best_score:
+                best_score = score
+                best_move = move
+        ghost_moves.append(best_move)
+        ghost_scores.append(best_score)
+    return ghost_moves, ghost_scores
+
+# Aspiration windows around alphabeta() at the root: instead of an open window the search
+# starts from guess - delta, guess + delta, where guess is the score it is expected to find
+# (the last turn's or the last iteration's). A score outside the window only bounds the real
+# one, so the search is run again with that side of the window twice as wide, then open.
+# Without a guess this is a plain alphabeta() search. Returns (move, score); the other
+# options are passed on to alphabeta().
+def aspiration_search(board, pacman_pos, ghost_pos, is_max, max_depth, guess=None, delta=None, stats=None,
+                      **options):
+    if guess is None or delta is None:
+        return alphabeta(board, pacman_pos, ghost_pos, 0, is_max, max_depth, stats=stats, **options)
+    low = high = delta
+    while True:
+        alpha, beta = guess - low, guess + high
+        move, score = alphabeta(board, pacman_pos, ghost_pos, 0, is_max, max_depth, alpha, beta, stats=stats,
+                                **options)
+        if score <= alpha:
+            low = 2 * low if low == delta else inf
+        elif score >= beta:
+            high = 2 * high if high == delta else inf
+        else:
+            return move, score
+        if stats is not None:
+            stats.researches += 1
+
+# Function to read Pac-Man's predicted line from the table after a search: the best move
+# stored for the position with this key, then for its best child, and so on, keeping the
+# moves made on Pac-Man's turns (the first, third, ...). Stops at length moves or where the
+# table has lost the line.
+def principal_variation(tt, key, length):
+    line = []
+    ply = 0
+    while key is not None and len(line) < length:
+        entry = tt.probe(key)
+        if entry is None or entry[3] is None:
+            break
+        if ply % 2 == 0:
+            line.append(entry[3])
+        key = entry[4]
+        ply += 1
+    return line
+
+# Iterative deepening around alphabeta(): searches depth 1, 2, 3, ... until budget_ms
+# milliseconds have passed and returns (move, score, depth) from the deepest search that
+# finished. Depth 1 always finishes. The transposition table hands each iteration's best
+# moves to the next one, where they are searched first.
+# With joint_ghosts the ghosts' side is searched with alphabeta_ghost_moves(), and move and
+# score are its lists with one entry per ghost. stats adds up over all the iterations;
+# weights, pvs and pv are passed on to the searches.
+# With aspiration, each iteration after the first searches an aspiration window of that
+# half-width around the last iteration's score (see aspiration_search()). batch_leaves is
+# passed on as well.
+def iterative_deepening(board, pacman_pos, ghost_pos, is_max, budget_ms, tt=None, pellets=None,
+                        distances=None, order_moves=order_pellet_first, max_depth=64, moves=None,
+                        joint_ghosts=False, stats=None, weights=None, pvs=False, aspiration=None, pv=None,
+                        batch_leaves=False):
+    if tt is None:
+        tt = TranspositionTable(board.shape, len(ghost_pos))
+    if pellets is None:
+        pellets = PelletIndex(board)
+    deadline = perf_counter() + budget_ms / 1000
+    pellet_positions = set(pellets.slots)
+    best_move, best_score, completed_depth = None, None, 0
+    for depth in range(1, max_depth + 1):
+        try:
+            if joint_ghosts and not is_max:
+                move, score = alphabeta_ghost_moves(board, pacman_pos, ghost_pos, depth, order_moves, tt, pellets,
+                                                    distances, deadline if depth > 1 else None, moves=moves, stats=stats,
+                                                    weights=weights, pvs=pvs, batch_leaves=batch_leaves)
+            else:
+                move, score = aspiration_search(board, pacman_pos, ghost_pos, is_max, depth, best_score, aspiration,
+                                                stats, order_moves=order_moves, tt=tt, pellets=pellets,
+                                                distances=distances, deadline=deadline if depth > 1 else None,
+                                                batch_leaves=batch_leaves, moves=moves, weights=weights, pvs=pvs,
+                                                pv=pv)
+        except SearchTimeout:
+            # Put back the pellets the interrupted line had eaten
+            for pos in pellet_positions - pellets.slots.keys():
+                pellets.restore(pos)
+            break
+        best_move, best_score, completed_depth = move, score, depth
+        if perf_counter() >= deadline:
+            break
+    return best_move, best_score, completed_depth
+
+# Ghost positions one random move away from pos, with their probabilities. The ghosts of this
+# game pick one of the four directions uniformly and stay put when it runs into a wall.
+def ghost_outcomes(pos, board, moves=None):
+    legal = legal_moves(pos, board, moves)
+    outcomes = [(new_pos, 1 / len(DIRECTIONS)) for _, new_pos in legal]
+    if len(legal) < len(DIRECTIONS):
+        outcomes.append((pos, (len(DIRECTIONS) - len(legal)) / len(DIRECTIONS)))
+    return outcomes
+
+# Expectimax algorithm implementation for the random ghosts
+# Pac-Man's layer maximizes as in minimax. The ghosts' layer is a chance node: every ghost
+# moves at once, as in the game, and the node is worth the expected score over their joint
+# random moves, up to 4 ** ghosts outcomes. With samples the expectation is estimated from that
+# many joint moves drawn with rng (a random.Random, the random module if not given), so a
+# chance node costs at most samples searches whatever the number of ghosts.
+# pellets, distances, moves and weights are used as in minimax().
+def expectimax(board, pacman_pos, ghost_pos, depth, is_max, max_depth=3, samples=None, rng=None, pellets=None,
+               distances=None, moves=None, weights=None):
+    if pellets is None:
+        pellets = PelletIndex(board)
+    if depth == max_depth or is_game_over(pacman_pos, ghost_pos):
+        return None, evaluate(pacman_pos, ghost_pos, board, pellets, distances, weights)
+
+    if is_max:
+        best_move = None
+        best_score = float('-inf')
+        for move, new_pos in legal_moves(pacman_pos, board, moves):
+            eats = new_pos in pellets
+            if eats:
+                pellets.eat(new_pos)
+            _, score = expectimax(board, new_pos, ghost_pos, depth + 1, False, max_depth, samples, rng, pellets,
+                                  distances, moves, weights)
+            if eats:
+                pellets.restore(new_pos)
+            if score > best_score:
+                best_score = score
+                best_move = move
         return best_move, best_score
 
-def evaluate(pacman_pos, ghost_pos, board):
-    pellet_count = count_pellets(board)
-    ghost_distance = min(abs(pacman_pos[0] - pos[0]) + abs(pacman_pos[1] - pos[1]) for pos in ghost_pos)
+    outcomes = [ghost_outcomes(pos, board, moves) for pos in ghost_pos]
+    if samples is None:
+        joint_moves = []
+        for combination in product(*outcomes):
+            probability = 1.0
+            for _, p in combination:
+                probability *= p
+            joint_moves.append(([pos for pos, _ in combination], probability))
+    else:
+        # Identical draws are searched once and weighted by how often they came up
+        rng = rng or random
+        population = [([pos for pos, _ in ghost], [p for _, p in ghost]) for ghost in outcomes]
+        draws = Counter(tuple(rng.choices(positions, odds)[0] for positions, odds in population)
+                        for _ in range(samples))
+        joint_moves = [(list(new_ghost_pos), count / samples) for new_ghost_pos, count in draws.items()]
+
+    expected_score = 0.0
+    for new_ghost_pos, probability in joint_moves:
+        _, score = expectimax(board, pacman_pos, new_ghost_pos, depth + 1, True, max_depth, samples, rng, pellets,
+                              distances, moves, weights)
+        expected_score += probability * score
+    return None, expected_score
+
+# Weights of evaluate(), in order: pellets (times 1 / (1 + pellets left)), proximity (times
+# 1 / (1 + distance to the nearest pellet)), penalty when the nearest ghost is closer than radius,
+# penalty for each ghost closer than radius, and radius. The same five weights in every script;
+# pacman_tuner searches them.
+WEIGHTS = (20, 10, -200, 0, 4)
+
+# pellets is the PelletIndex of the board, built from the board when not given.
+# Distances are maze distances when a DistanceTable is given, Manhattan distances otherwise.
+# weights are five weights as in WEIGHTS, WEIGHTS when not given.
+def evaluate(pacman_pos, ghost_pos, board, pellets=None, distances=None, weights=None):
+    if pellets is None:
+        pellets = PelletIndex(board)
+    pellet_weight, proximity_weight, ghost_weight, each_ghost_weight, radius = weights or WEIGHTS
+    pellet_count = pellets.count
+    ghost_distance = nearest_ghost_distance(pacman_pos, ghost_pos, distances)
 
     # Increase the penalty for being close to ghosts
-    ghost_penalty = -200 if ghost_distance < 4 else 0  # Larger penalty if a ghost is too close
+    ghost_penalty = ghost_weight if ghost_distance < radius else 0  # Larger penalty if a ghost is too close
+    if each_ghost_weight:
+        ghost_penalty += each_ghost_weight * sum(maze_distance(pacman_pos, pos, distances) < radius
+                                                 for pos in ghost_pos)
 
     # Find the distance to the nearest pellet
-    pellet_positions = np.argwhere(board == PELLET)
-    if pellet_positions.size > 0:
-        nearest_pellet_distance = min(np.sum(np.abs(pacman_pos - pellet_pos)) for pellet_pos in pellet_positions)
-    else:
+    nearest_pellet_distance = pellets.nearest_distance(pacman_pos, distances)
+    if nearest_pellet_distance is None:
         nearest_pellet_distance = 0
 
     # Reward for eating pellets and being close to the nearest pellet
-    pellet_reward = 20 * (1 / (1 + pellet_count))  # Increase the weight of pellet count
-    pellet_proximity_reward = 10 / (1 + nearest_pellet_distance)  # Reward for being closer to pellets
+    pellet_reward = pellet_weight * (1 / (1 + pellet_count))  # Increase the weight of pellet count
+    pellet_proximity_reward = proximity_weight / (1 + nearest_pellet_distance)  # Reward for being closer to pellets
 
     return pellet_reward + pellet_proximity_reward + ghost_penalty
 
 
 
-def display_board_with_score(board, pacman_pos, ghost_pos, score):
-    os.system('cls' if platform.system() == 'Windows' else 'clear')
-    temp_board = np.copy(board)
-    temp_board[pacman_pos] = PACMAN
-    for pos in ghost_pos:
-        temp_board[pos] = GHOST
-    for row in temp_board:
-        print(' '.join(row))
-    print(f"Score: {score}")
+# Vectorized evaluate() for every child of one node, as searched by alphabeta() at the last
+# ply: children are (move, pacman_pos, ghost_pos, key) tuples and pellets is the index at
+# their parent. A child that moves Pac-Man onto a pellet has eaten it. Returns a list with
+# the same scores evaluate() gives each child.
+# Siblings share at most four Pac-Man cells (all of them share one below a ghost move), so
+# the pellet terms are looked up once per cell and the ghost terms of all children are
+# computed together. weights are used as by evaluate().
+def evaluate_batch(children, pellets, distances=None, weights=None):
+    pellet_weight, proximity_weight, ghost_weight, each_ghost_weight, radius = weights or WEIGHTS
+    pellet_terms = {}
+    for child in children:
+        pos = child[1]
+        if pos not in pellet_terms:
+            eats = pos in pellets
+            if eats:
+                pellets.eat(pos)
+            nearest_pellet_distance = pellets.nearest_distance(pos, distances)
+            pellet_terms[pos] = (pellets.count, nearest_pellet_distance or 0)
+            if eats:
+                pellets.restore(pos)
+    pellet_count, nearest_pellet_distance = np.array([pellet_terms[child[1]] for child in children]).T
+
+    pacman = np.array([child[1] for child in children])  # (children, 2)
+    ghosts = np.array([child[2] for child in children])  # (children, ghosts, 2)
+    if distances is None:
+        ghost_distances = np.abs(ghosts - pacman[:, None, :]).sum(axis=2)  # (children, ghosts)
+    else:
+        pacman_ids = distances.cell_ids[pacman[:, 0], pacman[:, 1]]
+        ghost_ids = distances.cell_ids[ghosts[:, :, 0], ghosts[:, :, 1]]
+        ghost_distances = distances.matrix[pacman_ids[:, None], ghost_ids]
+
+    ghost_penalty = np.where(ghost_distances.min(axis=1) < radius, ghost_weight, 0)
+    if each_ghost_weight:
+        ghost_penalty = ghost_penalty + each_ghost_weight * (ghost_distances < radius).sum(axis=1)
+    pellet_reward = pellet_weight * (1 / (1 + pellet_count))
+    pellet_proximity_reward = proximity_weight / (1 + nearest_pellet_distance)
+    return (pellet_reward + pellet_proximity_reward + ghost_penalty).tolist()
+
 
 # Main game play function with AlphaBeta for Pac-Man and random movement for ghosts
-def play_game_with_alphabeta(board_width, board_height, num_ghosts, layout=None):
+# With render=False the game runs headless: no drawing and no pause between turns. Otherwise
+# the board is redrawn in place at fps frames per second (fps=None plays as fast as it can).
+# seed makes ghost placement and random moves reproducible, max_turns stops long games.
+# budget_ms replaces the fixed max_depth with iterative deepening under that many milliseconds
+# per search; the depth Pac-Man reached each turn is returned in 'depths'.
+# search='expectimax' makes Pac-Man search the ghosts as the random movers they are, with
+# expectimax() to max_depth, sampling samples joint ghost moves per chance node when given.
+# search='mcts' makes Pac-Man choose with Monte Carlo Tree Search (see MCTS) against random
+# ghosts, running simulations playouts per move, or playing for budget_ms milliseconds when
+# that is given; the depth its tree reached each turn goes into 'depths'.
+# With instrument, every search fills in a SearchStats and the game's result gets their dicts,
+# one per search in order, as 'stats'.
+# search_workers splits Pac-Man's fixed-depth alphabeta searches of max_depth 5 or more over
+# that many worker processes (see ParallelSearch); split searches are not instrumented.
+# trace appends every turn (positions, Pac-Man's move, score, search time and nodes) to that
+# trace file as game trace_game; see pacman_trace.
+# weights are Pac-Man's evaluate() weights (see WEIGHTS). MCTS does not evaluate positions and
+# ignores them.
+# pvs searches with principal variation search and tries the line the last search predicted
+# first (see alphabeta()). aspiration searches in an aspiration window of that half-width
+# around the last turn's score, or with iterative deepening around the last iteration's (see
+# aspiration_search()). Neither applies to expectimax or MCTS.
+# ponder, with a fixed-depth alphabeta search, starts a worker process searching Pac-Man's next
+# move from the ghosts' ponder most likely random steps while the board is drawn; when the
+# ghosts' real steps were among them, Pac-Man takes that move without searching (see
+# Ponderer). The result then counts those turns as 'ponder_hits'. The pondered searches use
+# pvs and batch_leaves as the game's own do, and hand back the line they predict.
+# cache_dir keeps the layout's compiled tables there and opens them from there in later games
+# (see pacman_layouts.compile_layout()), instead of working out the maze distances and moves
+# each game. Boards of more than pacman_layouts.MAX_DISTANCE_CELLS walkable cells get no
+# distance matrix and are searched with Manhattan distances.
+# batch_leaves scores the last ply of the serial alphabeta searches with evaluate_batch() (see
+# alphabeta()); the split searches score leaves one at a time.
+# Returns the game's result as a dict.
+def play_game_with_alphabeta(board_width, board_height, num_ghosts, layout=None, max_depth=3,
+                             render=True, seed=None, max_turns=None, budget_ms=None, search='alphabeta',
+                             samples=None, fps=1.0, instrument=False, search_workers=None, simulations=None,
+                             trace=None, trace_game=0, weights=None, pvs=False, aspiration=None, ponder=None,
+                             cache_dir=None, batch_leaves=False):
+    if seed is not None:
+        random.seed(seed)
     if layout:
         board, pacman_pos, ghost_pos = create_custom_layout(layout)
     else:
         board = create_board(board_width, board_height)
         pacman_pos = (board_height // 2, board_width // 2)
         ghost_pos = [(random.randint(1, board_height - 2), random.randint(1, board_width - 2)) for _ in range(num_ghosts)]
+    tt = TranspositionTable(board.shape, len(ghost_pos))  # Shared by every search of the game
+    pellets = PelletIndex(board)  # Kept in step with the board as pellets are eaten
+    # Maze distances between all walkable cells (None on boards too large for them) and legal
+    # moves of every walkable cell
+    distances, moves = layout_tables(board, layout, cache_dir)
+    renderer = make_renderer(render, fps)
+    tracer = TraceWriter(trace, board, len(ghost_pos), trace_game) if trace else None
+    if tracer is not None:
+        tracer.append(0, pacman_pos, ghost_pos, (0, 0), 0)  # Start positions
+    rng = random.Random(seed)  # Expectimax samples, kept apart from the ghosts' own moves
+    if search == 'mcts':
+        mcts = MCTS(moves, distances, simulations or 2000, budget_ms, ghost_greedy=0.0, seed=seed)
+    parallel = None
+    if search_workers and search == 'alphabeta' and budget_ms is None:
+        parallel = ParallelSearch(board, len(ghost_pos), 'alphabeta-random', search_workers, distances=distances,
+                                  moves=moves)
+    ponderer = None
+    if ponder and search == 'alphabeta' and budget_ms is None and parallel is None:
+        ponderer = Ponderer(board, len(ghost_pos), 'alphabeta-random', 'random', ponder, distances=distances,
+                            moves=moves)
+
     score = 0  # Initialize score
+    turns = 0
+    search_time = 0.0  # Seconds spent searching
+    search_stats = []  # SearchStats.as_dict() of each search when instrumented
+    depths = []  # Depth of Pac-Man's search each turn
+    pacman_score = None  # Score of Pac-Man's last search, the centre of the next aspiration window
+    pv = None  # Pac-Man's moves predicted by the last search, tried first by the next
 
     while True:
-        display_board_with_score(board, pacman_pos, ghost_pos, score)
+        status = [f"Score: {score}"]
+        if budget_ms is not None and depths:
+            status.append(f"Search depth: {depths[-1]}")
+        renderer.draw(board, pacman_pos, ghost_pos, status)
+        tt.new_search()
 
+        turn_start = search_time  # Search time before this turn, for the trace
         # Pac-Man's turn
-        pacman_move, _ = alphabeta(board, pacman_pos, ghost_pos, 0, True, 3)  # Fixed the number of arguments here
+        pacman_stats = SearchStats(turn=turns, side='pacman') if instrument else None
+        start = perf_counter()
+        pondered = ponderer.lookup(pacman_pos, ghost_pos) if ponderer is not None else None
+        if search == 'mcts':
+            pacman_move, _ = mcts.search(pacman_pos, ghost_pos, pellets)
+            search_depth = mcts.depth
+        elif pondered is not None:
+            pacman_move, pacman_score, pondered_pv = pondered
+            search_depth = max_depth
+        elif search == 'expectimax':
+            pacman_move, _ = expectimax(board, pacman_pos, ghost_pos, 0, True, max_depth, samples, rng, pellets,
+                                        distances, moves, weights)
+            search_depth = max_depth
+        elif parallel is not None:
+            pacman_move, _ = parallel.search_pacman(board, pacman_pos, ghost_pos, max_depth, pellets, tt, pacman_stats,
+                                                    weights)
+            search_depth = max_depth
+        elif budget_ms is None:
+            pacman_move, pacman_score = aspiration_search(board, pacman_pos, ghost_pos, True, max_depth, pacman_score,
+                                                          aspiration, pacman_stats, tt=tt, pellets=pellets,
+                                                          distances=distances, moves=moves, weights=weights, pvs=pvs,
+                                                          pv=pv, batch_leaves=batch_leaves)
+            search_depth = max_depth
+        else:
+            pacman_move, pacman_score, search_depth = iterative_deepening(
+                board, pacman_pos, ghost_pos, True, budget_ms, tt=tt, pellets=pellets, distances=distances,
+                moves=moves, stats=pacman_stats, weights=weights, pvs=pvs, aspiration=aspiration, pv=pv,
+                batch_leaves=batch_leaves)
+        if pondered is not None:
+            pv = pondered_pv  # Read from the worker's table, which the pondered search filled
+        elif pvs and search == 'alphabeta' and parallel is None:
+            pv = principal_variation(tt, tt.zobrist.hash(pacman_pos, ghost_pos, True), search_depth)[1:]
+        elapsed = perf_counter() - start
+        search_time += elapsed
+        record(search_stats, pacman_stats, elapsed)
+        depths.append(search_depth)
         if pacman_move is None:
             # Fallback strategy: choose a random safe move
             pacman_move = choice([move for move in DIRECTIONS if is_move_safe(pacman_pos, move, board, ghost_pos)])
 
-        new_pacman_pos = move_character(pacman_pos, pacman_move, board)
+        new_pacman_pos = moves.step(pacman_pos, pacman_move)
         if board[new_pacman_pos] == PELLET:
             board[new_pacman_pos] = EMPTY  # Pac-Man eats the pellet
+            tt.zobrist.eat_pellet(new_pacman_pos)
+            pellets.eat(new_pacman_pos)
             score += 10
         else:
             score -= 1  # Decrease score for moves without eating a pellet
 
         pacman_pos = new_pacman_pos
+        if ponderer is not None:
+            ponderer.start(pacman_pos, ghost_pos, max_depth, pellets, weights, pvs, pv, batch_leaves)
 
         # Ghosts' turn - Random movement
         new_ghost_pos = []
         for ghost in ghost_pos:
             ghost_move = choice(DIRECTIONS)
-            new_pos = move_character(ghost, ghost_move, board)
+            new_pos = moves.step(ghost, ghost_move)
             new_ghost_pos.append(new_pos)
         ghost_pos = new_ghost_pos
 
+        turns += 1
+        if tracer is not None:
+            nodes = sum(stats.total_nodes for stats in (pacman_stats,) if stats is not None)
+            tracer.append(turns, pacman_pos, ghost_pos, pacman_move or (0, 0), score, search_time - turn_start, nodes,
+                          search_depth)
         if is_game_over(pacman_pos, ghost_pos):
-            print(f"Game Over! Final Score: {score}")
+            renderer.message(f"Game Over! Final Score: {score}")
+            break
+        if pellets.count == 0:
+            renderer.message(f"You Win! Final Score: {score}")
+            break
+        if max_turns is not None and turns >= max_turns:
             break
 
-        sleep(1)
+        renderer.wait()
+
+    renderer.close()
+    if tracer is not None:
+        tracer.close()
+    if parallel is not None:
+        parallel.close()
+    if ponderer is not None:
+        ponderer.close()
+    caught = is_game_over(pacman_pos, ghost_pos)
+    result = {
+        'score': score,
+        'turns': turns,
+        'win': not caught and pellets.count == 0,
+        'caught': caught,
+        'pellets_left': pellets.count,
+        'search_time': search_time,
+        'depths': depths,
+    }
+    if instrument:
+        result['stats'] = search_stats
+    if ponderer is not None:
+        result['ponder_hits'] = ponderer.hits
+    return result
 
 
 
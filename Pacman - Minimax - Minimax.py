@@ -1,9 +1,16 @@
 import numpy as np
 import random
-import os
-import platform
-from time import sleep
+from time import perf_counter
 from random import choice
+from pacman_layouts import layout_tables, parse_layout
+from pacman_maze import maze_distance
+from pacman_parallel import ParallelSearch, Ponderer
+from pacman_pellets import PelletIndex
+from pacman_render import make_renderer
+from pacman_solver import TableAgent, load_policy, solve
+from pacman_stats import SearchStats, record
+from pacman_trace import TraceWriter
+from pacman_transposition import TranspositionTable, EXACT
 
 # Constants for the game
 WALL = '#'
@@ -22,23 +29,10 @@ DIRECTIONS = [UP, DOWN, LEFT, RIGHT]
 # Initial Game Board Setup
 def create_board(width, height):
     board = np.full((height, width), PELLET)
-    for i in range(height):
-        for j in range(width):
-            if i == 0 or i == height - 1 or j == 0 or j == width - 1:
-                board[i, j] = WALL
+    board[[0, -1], :] = WALL
+    board[:, [0, -1]] = WALL
     return board
 
-# Function to display the game board
-def display_board(board, pacman_pos, ghost_pos):
-    os.system('cls' if platform.system() == 'Windows' else 'clear')
-    temp_board = np.copy(board)
-    temp_board[pacman_pos] = PACMAN
-    for pos in ghost_pos:
-        temp_board[pos] = GHOST
-    for row in temp_board:
-        print(' '.join(row))
-
-
 # Function to count the number of pellets remaining
 def count_pellets(board):
     return np.sum(board == PELLET)
@@ -50,92 +44,211 @@ def move_character(position, direction, board):
         return new_position
     return position
 
+# Function to list the (move, new_pos) pairs that leave pos, from the layout's MoveTable when
+# one is given and by trying every direction on the board otherwise
+def legal_moves(pos, board, moves=None):
+    if moves is not None:
+        return moves.moves[pos]
+    legal = []
+    for move in DIRECTIONS:
+        new_pos = move_character(pos, move, board)
+        if new_pos != pos:
+            legal.append((move, new_pos))
+    return legal
+
 # Function to check game over conditions
 def is_game_over(pacman_pos, ghost_pos):
     return pacman_pos in ghost_pos
 
-# Function to create a custom layout
+# Function to create a custom layout (see parse_layout(); generate_layout() makes new ones)
 def create_custom_layout(layout):
-    height = len(layout)
-    width = len(layout[0])
-    board = np.full((height, width), EMPTY)
-    pacman_pos = None
-    ghost_pos = []
-
-    for i, row in enumerate(layout):
-        for j, cell in enumerate(row):
-            if cell == WALL:
-                board[i, j] = WALL
-            elif cell == PELLET:
-                board[i, j] = PELLET
-            elif cell == PACMAN:
-                pacman_pos = (i, j)
-            elif cell == GHOST:
-                ghost_pos.append((i, j))
-            # Empty space is already the default
-
-    return board, pacman_pos, ghost_pos
+    return parse_layout(layout)
 
 
 # Minimax algorithm implementation with fixed depth
-def minimax(board, pacman_pos, ghost_pos, depth, max_depth, is_max):
+# Positions already searched to the remaining depth are answered from the transposition table.
+# pellets is the PelletIndex of the board; Pac-Man eats from it while searching a line and
+# the pellets are put back when the search returns. One is built from the board if not given.
+# distances is the layout's DistanceTable; without it evaluate() falls back to Manhattan distance.
+# moves is the layout's MoveTable; without it successors are found with move_character().
+# stats is a SearchStats to count nodes and table hits and to time evaluate() and successor
+# generation; without one none of that is done.
+# weights are the evaluate() weights of the side searching, WEIGHTS when not given.
+def minimax(board, pacman_pos, ghost_pos, depth, max_depth, is_max, tt=None, key=None, pellets=None, distances=None,
+            moves=None, stats=None, weights=None):
+    if pellets is None:
+        pellets = PelletIndex(board)
+    if stats is not None:
+        stats.node(depth)
     if depth == max_depth or is_game_over(pacman_pos, ghost_pos):
-        return None, evaluate(pacman_pos, ghost_pos, board)
+        if stats is None:
+            return None, evaluate(pacman_pos, ghost_pos, board, pellets, distances, weights)
+        start = perf_counter()
+        score = evaluate(pacman_pos, ghost_pos, board, pellets, distances, weights)
+        stats.evaluate_time += perf_counter() - start
+        stats.leaves += 1
+        return None, score
+
+    if tt is not None:
+        if key is None:
+            key = tt.zobrist.hash(pacman_pos, ghost_pos, is_max)
+        entry = tt.probe(key)
+        if stats is not None:
+            stats.tt_probes += 1
+        if entry is not None and entry[1] >= max_depth - depth:
+            if stats is not None:
+                stats.tt_hits += 1
+            return entry[3], entry[0]
+
+    if stats is not None:
+        start = perf_counter()
+    if is_max:
+        successors = legal_moves(pacman_pos, board, moves)
+    else:
+        ghost_successors = [legal_moves(pos, board, moves) for pos in ghost_pos]
+    if stats is not None:
+        stats.successor_time += perf_counter() - start
 
+    child_key = None
     if is_max:
         best_move = None
         best_score = float('-inf')
-        for move in DIRECTIONS:
-            new_pos = move_character(pacman_pos, move, board)
-            if new_pos != pacman_pos and board[new_pos] != GHOST:  # Avoid moving onto a ghost
-                _, score = minimax(board, new_pos, ghost_pos, depth + 1, max_depth, False)
+        for move, new_pos in successors:
+            if board[new_pos] != GHOST:  # Avoid moving onto a ghost
+                eats = new_pos in pellets
+                if tt is not None:
+                    child_key = tt.zobrist.pacman_move(key, pacman_pos, new_pos)
+                    if eats:
+                        child_key = tt.zobrist.toggle_pellet(child_key, new_pos)
+                if eats:
+                    pellets.eat(new_pos)
+                _, score = minimax(board, new_pos, ghost_pos, depth + 1, max_depth, False, tt=tt, key=child_key,
+                                   pellets=pellets, distances=distances, moves=moves, stats=stats, weights=weights)
+                if eats:
+                    pellets.restore(new_pos)
                 if score > best_score:
                     best_score = score
                     best_move = move
-        return best_move, best_score
     else:
         best_move = None
         best_score = float('inf')
-        for pos in ghost_pos:
-            for move in DIRECTIONS:
-                new_pos = move_character(pos, move, board)
-                if new_pos != pos:
-                    _, score = minimax(board, pacman_pos, [new_pos if x == pos else x for x in ghost_pos], depth + 1, max_depth, True)
-                    if score < best_score:
-                        best_score = score
-                        best_move = move
-        return best_move, best_score
-
-def evaluate(pacman_pos, ghost_pos, board):
-    pellet_count = count_pellets(board)
+        for i, pos in enumerate(ghost_pos):
+            for move, new_pos in ghost_successors[i]:
+                new_ghost_pos = list(ghost_pos)
+                new_ghost_pos[i] = new_pos
+                if tt is not None:
+                    child_key = tt.zobrist.ghost_move(key, ghost_pos, pos, new_pos)
+                _, score = minimax(board, pacman_pos, new_ghost_pos, depth + 1, max_depth, True, tt=tt, key=child_key,
+                                   pellets=pellets, distances=distances, moves=moves, stats=stats, weights=weights)
+                if score < best_score:
+                    best_score = score
+                    best_move = move
+
+    if tt is not None:
+        tt.store(key, best_score, max_depth - depth, EXACT, best_move)
+    return best_move, best_score
+
+# Joint ghost decision: one search from the ghosts' side that picks a move for every ghost,
+# instead of one identical search per ghost. The root's children are grouped by the ghost
+# that moves and each ghost keeps its own best move.
+# Returns the list of each ghost's best move (None for a ghost that cannot move) and the list
+# of the scores those moves lead to. stats and weights are used as by minimax().
+def minimax_ghost_moves(board, pacman_pos, ghost_pos, max_depth, tt=None, pellets=None, distances=None, moves=None,
+                        stats=None, weights=None):
+    if pellets is None:
+        pellets = PelletIndex(board)
+    if stats is not None:
+        stats.node(0)
+    key = tt.zobrist.hash(pacman_pos, ghost_pos, False) if tt is not None else None
+
+    ghost_moves = []
+    ghost_scores = []
+    child_key = None
+    for i, pos in enumerate(ghost_pos):
+        best_move = None
+        best_score = float('inf')
+        if stats is not None:
+            start = perf_counter()
+        successors = legal_moves(pos, board, moves)
+        if stats is not None:
+            stats.successor_time += perf_counter() - start
+        for move, new_pos in successors:
+            new_ghost_pos = list(ghost_pos)
+            new_ghost_pos[i] = new_pos
+            if tt is not None:
+                child_key = tt.zobrist.ghost_move(key, ghost_pos, pos, new_pos)
+            _, score = minimax(board, pacman_pos, new_ghost_pos, 1, max_depth, True, tt=tt, key=child_key,
+                               pellets=pellets, distances=distances, moves=moves, stats=stats, weights=weights)
+            if score < best_score:
+                best_score = score
+                best_move = move
+        ghost_moves.append(best_move)
+        ghost_scores.append(best_score)
+    return ghost_moves, ghost_scores
+
+# Weights of evaluate(), in order: pellets (times 1 / (1 + pellets left)), proximity (times
+# 1 / (1 + distance to the nearest pellet)), penalty when the nearest ghost is closer than radius,
+# penalty for each ghost closer than radius, and radius. The same five weights in every script;
+# pacman_tuner searches them.
+WEIGHTS = (1000, 0, 0, -1000, 4)
+
+# pellets is the PelletIndex of the board, built from the board when not given.
+# Distances are maze distances when a DistanceTable is given, Manhattan distances otherwise.
+# weights are five weights as in WEIGHTS, WEIGHTS when not given.
+def evaluate(pacman_pos, ghost_pos, board, pellets=None, distances=None, weights=None):
+    if pellets is None:
+        pellets = PelletIndex(board)
+    pellet_weight, proximity_weight, ghost_weight, each_ghost_weight, radius = weights or WEIGHTS
+    pellet_count = pellets.count
 
     # Evaluation for Pac-Man: Focus on eating pellets
-    pellet_reward = 1000 / (1 + pellet_count)  # Reward for eating pellets
+    pellet_reward = pellet_weight / (1 + pellet_count)  # Reward for eating pellets
+    if proximity_weight:
+        nearest_pellet_distance = pellets.nearest_distance(pacman_pos, distances)
+        pellet_reward += proximity_weight / (1 + (nearest_pellet_distance or 0))
 
     # Evaluation for Ghosts: Focus on catching Pac-Man
     ghost_penalty = 0
     for ghost in ghost_pos:
-        distance = abs(ghost[0] - pacman_pos[0]) + abs(ghost[1] - pacman_pos[1])
-        if distance < 4:  # High penalty if a ghost is too close
-            ghost_penalty -= 1000
+        distance = maze_distance(ghost, pacman_pos, distances)
+        if distance < radius:  # High penalty if a ghost is too close
+            ghost_penalty += each_ghost_weight
+    if ghost_weight and min(maze_distance(ghost, pacman_pos, distances) for ghost in ghost_pos) < radius:
+        ghost_penalty += ghost_weight
 
     return pellet_reward + ghost_penalty
 
 
 
-def display_board_with_score(board, pacman_pos, ghost_pos, score):
-    os.system('cls' if platform.system() == 'Windows' else 'clear')
-    temp_board = np.copy(board)
-    temp_board[pacman_pos] = PACMAN
-    for pos in ghost_pos:
-        temp_board[pos] = GHOST
-    for row in temp_board:
-        print(' '.join(row))
-    print(f"Score: {score}")
-
 # Main game play function with Minimax for Pac-Man and random movement for ghosts
-def play_game_with_minimax(board_width, board_height, num_ghosts, layout=None):
-    max_depth = 3  # Fixed depth for Minimax algorithm
+# With render=False the game runs headless: no drawing and no pause between turns. Otherwise
+# the board is redrawn in place at fps frames per second (fps=None plays as fast as it can).
+# seed makes ghost placement and random moves reproducible, max_turns stops long games.
+# With instrument, every search fills in a SearchStats and the game's result gets their dicts,
+# one per search in order, as 'stats'.
+# search_workers splits searches of max_depth 5 or more over that many worker processes (see
+# ParallelSearch); split searches are not instrumented.
+# trace appends every turn (positions, Pac-Man's move, score, search time and nodes) to that
+# trace file as game trace_game; see pacman_trace.
+# search='table' makes Pac-Man play from a policy table solved offline by pacman_solver: policy
+# is the table or the file it was saved to, and the layout is solved here when it is None.
+# weights are Pac-Man's evaluate() weights (see WEIGHTS); the ghosts always search with the
+# defaults. The policy table does not evaluate positions and ignores them.
+# ponder, with an unsplit minimax search, starts a worker process searching Pac-Man's next move
+# from that many of the ghosts' likely replies while they search and the board is drawn; when
+# the ghosts' real reply was among them, Pac-Man takes that move without searching (see
+# Ponderer). The result then counts those turns as 'ponder_hits'.
+# cache_dir keeps the layout's compiled tables there and opens them from there in later games
+# (see pacman_layouts.compile_layout()), instead of working out the maze distances and moves
+# each game. Boards of more than pacman_layouts.MAX_DISTANCE_CELLS walkable cells get no
+# distance matrix and are searched with Manhattan distances.
+# Returns the game's result as a dict.
+def play_game_with_minimax(board_width, board_height, num_ghosts, layout=None, max_depth=3,
+                           render=True, seed=None, max_turns=None, fps=1.0, instrument=False, search_workers=None,
+                           trace=None, trace_game=0, search='minimax', policy=None, weights=None,
+                           ponder=None, cache_dir=None):
+    if seed is not None:
+        random.seed(seed)
     if layout:
         board, pacman_pos, ghost_pos = create_custom_layout(layout)
     else:
@@ -143,39 +256,130 @@ def play_game_with_minimax(board_width, board_height, num_ghosts, layout=None):
         pacman_pos = (board_height // 2, board_width // 2)
         ghost_pos = [(random.randint(1, board_height - 2), random.randint(1, board_width - 2)) for _ in range(num_ghosts)]
 
+    tt = TranspositionTable(board.shape, len(ghost_pos))  # Shared by every search of the game
+    # Pac-Man's own table when it scores positions with other weights than the ghosts
+    pacman_tt = TranspositionTable(board.shape, len(ghost_pos)) if weights is not None else tt
+    pellets = PelletIndex(board)  # Kept in step with the board as pellets are eaten
+    # Maze distances between all walkable cells (None on boards too large for them) and legal
+    # moves of every walkable cell
+    distances, moves = layout_tables(board, layout, cache_dir)
+    parallel = None
+    if search_workers:
+        parallel = ParallelSearch(board, len(ghost_pos), 'minimax', search_workers, distances=distances, moves=moves)
+    ponderer = None
+    if ponder and search == 'minimax' and parallel is None:
+        ponderer = Ponderer(board, len(ghost_pos), 'minimax', 'search', ponder, distances=distances, moves=moves)
+    renderer = make_renderer(render, fps)
+    tracer = TraceWriter(trace, board, len(ghost_pos), trace_game) if trace else None
+    if search == 'table':
+        table = load_policy(policy) if policy is not None else solve(board, len(ghost_pos), 'search')
+        agent = TableAgent(table, board, distances)
+    if tracer is not None:
+        tracer.append(0, pacman_pos, ghost_pos, (0, 0), 0)  # Start positions
+
     score = 0
+    turns = 0
+    search_time = 0.0  # Seconds spent searching
+    search_stats = []  # SearchStats.as_dict() of each search when instrumented
 
     while True:
-        display_board_with_score(board, pacman_pos, ghost_pos, score)
+        renderer.draw(board, pacman_pos, ghost_pos, [f"Score: {score}"])
+        tt.new_search()
+        if pacman_tt is not tt:
+            pacman_tt.new_search()
 
+        turn_start = search_time  # Search time before this turn, for the trace
         # Pac-Man's turn
-        pacman_move, pacman_score = minimax(board, pacman_pos, ghost_pos, 0, max_depth, True)
+        pacman_stats = SearchStats(turn=turns, side='pacman') if instrument else None
+        start = perf_counter()
+        pondered = ponderer.lookup(pacman_pos, ghost_pos) if ponderer is not None else None
+        if search == 'table':
+            pacman_move = agent.move(board, pacman_pos, ghost_pos, pellets)
+        elif pondered is not None:
+            pacman_move, pacman_score, _ = pondered
+        elif parallel is not None:
+            pacman_move, pacman_score = parallel.search_pacman(board, pacman_pos, ghost_pos, max_depth, pellets, pacman_tt,
+                                                               pacman_stats, weights)
+        else:
+            pacman_move, pacman_score = minimax(board, pacman_pos, ghost_pos, 0, max_depth, True, tt=pacman_tt,
+                                                pellets=pellets, distances=distances, moves=moves, stats=pacman_stats,
+                                                weights=weights)
+        elapsed = perf_counter() - start
+        search_time += elapsed
+        record(search_stats, pacman_stats, elapsed)
         if pacman_move is None:
             pacman_move = choice([move for move in DIRECTIONS if is_move_safe(pacman_pos, move, board, ghost_pos)])
 
-        new_pacman_pos = move_character(pacman_pos, pacman_move, board)
+        new_pacman_pos = moves.step(pacman_pos, pacman_move)
         if board[new_pacman_pos] == PELLET:
             board[new_pacman_pos] = EMPTY  # Pac-Man eats the pellet
+            tt.zobrist.eat_pellet(new_pacman_pos)
+            if pacman_tt is not tt:
+                pacman_tt.zobrist.eat_pellet(new_pacman_pos)
+            pellets.eat(new_pacman_pos)
             score += 10
 
         pacman_pos = new_pacman_pos
-
-        # Ghosts' turn
+        if ponderer is not None:
+            ponderer.start(pacman_pos, ghost_pos, max_depth, pellets, weights)
+
+        # Ghosts' turn: one joint search picks a move for every ghost
+        ghost_stats = SearchStats(turn=turns, side='ghosts') if instrument else None
+        start = perf_counter()
+        if parallel is not None:
+            ghost_moves, _ = parallel.search_ghosts(board, pacman_pos, ghost_pos, max_depth, pellets, tt, ghost_stats)
+        else:
+            ghost_moves, _ = minimax_ghost_moves(board, pacman_pos, ghost_pos, max_depth, tt=tt, pellets=pellets,
+                                                 distances=distances, moves=moves, stats=ghost_stats)
+        elapsed = perf_counter() - start
+        search_time += elapsed
+        record(search_stats, ghost_stats, elapsed)
         new_ghost_pos = []
-        for ghost in ghost_pos:
-            ghost_move, _ = minimax(board, pacman_pos, ghost_pos, 0, max_depth, False)
+        for ghost, ghost_move in zip(ghost_pos, ghost_moves):
             if ghost_move is None:
                 ghost_move = choice([move for move in DIRECTIONS if is_move_safe(ghost, move, board, [pacman_pos])])
 
-            new_pos = move_character(ghost, ghost_move, board)
+            new_pos = moves.step(ghost, ghost_move)
             new_ghost_pos.append(new_pos)
         ghost_pos = new_ghost_pos
 
+        turns += 1
+        if tracer is not None:
+            nodes = sum(stats.total_nodes for stats in (pacman_stats, ghost_stats) if stats is not None)
+            tracer.append(turns, pacman_pos, ghost_pos, pacman_move or (0, 0), score, search_time - turn_start, nodes,
+                          max_depth)
         if is_game_over(pacman_pos, ghost_pos):
-            print(f"Game Over! Final Score: {score}")
+            renderer.message(f"Game Over! Final Score: {score}")
+            break
+        if pellets.count == 0:
+            renderer.message(f"You Win! Final Score: {score}")
+            break
+        if max_turns is not None and turns >= max_turns:
             break
 
-        sleep(1)
+        renderer.wait()
+
+    renderer.close()
+    if tracer is not None:
+        tracer.close()
+    if parallel is not None:
+        parallel.close()
+    if ponderer is not None:
+        ponderer.close()
+    caught = is_game_over(pacman_pos, ghost_pos)
+    result = {
+        'score': score,
+        'turns': turns,
+        'win': not caught and pellets.count == 0,
+        'caught': caught,
+        'pellets_left': pellets.count,
+        'search_time': search_time,
+    }
+    if instrument:
+        result['stats'] = search_stats
+    if ponderer is not None:
+        result['ponder_hits'] = ponderer.hits
+    return result
 
 
 # Add a new function to check if a move is safe
@@ -1,8 +1,17 @@
 import numpy as np
 import random
-import os
-import platform
-from time import sleep
+from collections import Counter
+from itertools import product
+from time import perf_counter
+from pacman_layouts import layout_tables, parse_layout
+from pacman_maze import maze_distance
+from pacman_parallel import ParallelSearch, Ponderer
+from pacman_pellets import PelletIndex
+from pacman_render import make_renderer
+from pacman_solver import TableAgent, load_policy, solve
+from pacman_stats import SearchStats, record
+from pacman_trace import TraceWriter
+from pacman_transposition import TranspositionTable, EXACT
 
 # Constants for the game
 WALL = '#'
@@ -21,23 +30,10 @@ DIRECTIONS = [UP, DOWN, LEFT, RIGHT]
 # Initial Game Board Setup
 def create_board(width, height):
     board = np.full((height, width), PELLET)
-    for i in range(height):
-        for j in range(width):
-            if i == 0 or i == height - 1 or j == 0 or j == width - 1:
-                board[i, j] = WALL
+    board[[0, -1], :] = WALL
+    board[:, [0, -1]] = WALL
     return board
 
-# Function to display the game board
-def display_board(board, pacman_pos, ghost_pos):
-    os.system('cls' if platform.system() == 'Windows' else 'clear')
-    temp_board = np.copy(board)
-    temp_board[pacman_pos] = PACMAN
-    for pos in ghost_pos:
-        temp_board[pos] = GHOST
-    for row in temp_board:
-        print(' '.join(row))
-
-
 # Function to count the number of pellets remaining
 def count_pellets(board):
     return np.sum(board == PELLET)
@@ -49,96 +45,237 @@ def move_character(position, direction, board):
         return new_position
     return position
 
+# Function to list the (move, new_pos) pairs that leave pos, from the layout's MoveTable when
+# one is given and by trying every direction on the board otherwise
+def legal_moves(pos, board, moves=None):
+    if moves is not None:
+        return moves.moves[pos]
+    legal = []
+    for move in DIRECTIONS:
+        new_pos = move_character(pos, move, board)
+        if new_pos != pos:
+            legal.append((move, new_pos))
+    return legal
+
 # Function to check game over conditions
 def is_game_over(pacman_pos, ghost_pos):
     return pacman_pos in ghost_pos
 
-# Function to create a custom layout
+# Function to create a custom layout (see parse_layout(); generate_layout() makes new ones)
 def create_custom_layout(layout):
-    height = len(layout)
-    width = len(layout[0])
-    board = np.full((height, width), EMPTY)
-    pacman_pos = None
-    ghost_pos = []
-
-    for i, row in enumerate(layout):
-        for j, cell in enumerate(row):
-            if cell == WALL:
-                board[i, j] = WALL
-            elif cell == PELLET:
-                board[i, j] = PELLET
-            elif cell == PACMAN:
-                pacman_pos = (i, j)
-            elif cell == GHOST:
-                ghost_pos.append((i, j))
-            # Empty space is already the default
-
-    return board, pacman_pos, ghost_pos
+    return parse_layout(layout)
 
 
 # Minimax algorithm implementation
-def minimax(board, pacman_pos, ghost_pos, depth, is_max, max_depth=3):
+# Positions already searched to the remaining depth are answered from the transposition table.
+# pellets is the PelletIndex of the board; Pac-Man eats from it while searching a line and
+# the pellets are put back when the search returns. One is built from the board if not given.
+# distances is the layout's DistanceTable; without it evaluate() falls back to Manhattan distance.
+# moves is the layout's MoveTable; without it successors are found with move_character().
+# stats is a SearchStats to count nodes and table hits and to time evaluate() and successor
+# generation; without one none of that is done.
+# weights are the evaluate() weights of the side searching, WEIGHTS when not given.
+def minimax(board, pacman_pos, ghost_pos, depth, is_max, max_depth=3, tt=None, key=None, pellets=None, distances=None,
+            moves=None, stats=None, weights=None):
+    if pellets is None:
+        pellets = PelletIndex(board)
+    if stats is not None:
+        stats.node(depth)
     if depth == max_depth or is_game_over(pacman_pos, ghost_pos):
-        return None, evaluate(pacman_pos, ghost_pos, board)
+        if stats is None:
+            return None, evaluate(pacman_pos, ghost_pos, board, pellets, distances, weights)
+        start = perf_counter()
+        score = evaluate(pacman_pos, ghost_pos, board, pellets, distances, weights)
+        stats.evaluate_time += perf_counter() - start
+        stats.leaves += 1
+        return None, score
+
+    if tt is not None:
+        if key is None:
+            key = tt.zobrist.hash(pacman_pos, ghost_pos, is_max)
+        entry = tt.probe(key)
+        if stats is not None:
+            stats.tt_probes += 1
+        if entry is not None and entry[1] >= max_depth - depth:
+            if stats is not None:
+                stats.tt_hits += 1
+            return entry[3], entry[0]
+
+    if stats is not None:
+        start = perf_counter()
+    if is_max:
+        successors = legal_moves(pacman_pos, board, moves)
+    else:
+        ghost_successors = [legal_moves(pos, board, moves) for pos in ghost_pos]
+    if stats is not None:
+        stats.successor_time += perf_counter() - start
 
+    child_key = None
     if is_max:
         best_move = None
         best_score = float('-inf')
-        for move in DIRECTIONS:
-            new_pos = move_character(pacman_pos, move, board)
-            if new_pos != pacman_pos:
-                _, score = minimax(board, new_pos, ghost_pos, depth + 1, False)  # Corrected here
-                if score > best_score:
-                    best_score = score
-                    best_move = move
-        return best_move, best_score
+        for move, new_pos in successors:
+            eats = new_pos in pellets
+            if tt is not None:
+                child_key = tt.zobrist.pacman_move(key, pacman_pos, new_pos)
+                if eats:
+                    child_key = tt.zobrist.toggle_pellet(child_key, new_pos)
+            if eats:
+                pellets.eat(new_pos)
+            _, score = minimax(board, new_pos, ghost_pos, depth + 1, False, max_depth, tt=tt, key=child_key,
+                               pellets=pellets, distances=distances, moves=moves, stats=stats, weights=weights)
+            if eats:
+                pellets.restore(new_pos)
+            if score > best_score:
+                best_score = score
+                best_move = move
     else:
         best_move = None
         best_score = float('inf')
-        for pos in ghost_pos:
-            for move in DIRECTIONS:
-                new_pos = move_character(pos, move, board)
-                if new_pos != pos:
-                    _, score = minimax(board, pacman_pos, [new_pos if x == pos else x for x in ghost_pos], depth + 1, True)  # Corrected here
-                    if score < best_score:
-                        best_score = score
-                        best_move = move
+        for i, pos in enumerate(ghost_pos):
+            for move, new_pos in ghost_successors[i]:
+                new_ghost_pos = list(ghost_pos)
+                new_ghost_pos[i] = new_pos
+                if tt is not None:
+                    child_key = tt.zobrist.ghost_move(key, ghost_pos, pos, new_pos)
+                _, score = minimax(board, pacman_pos, new_ghost_pos, depth + 1, True, max_depth, tt=tt, key=child_key,
+                                   pellets=pellets, distances=distances, moves=moves, stats=stats, weights=weights)
+                if score < best_score:
+                    best_score = score
+                    best_move = move
+
+    if tt is not None:
+        tt.store(key, best_score, max_depth - depth, EXACT, best_move)
+    return best_move, best_score
+
+# Ghost positions one random move away from pos, with their probabilities. The ghosts of this
+# game pick one of the four directions uniformly and stay put when it runs into a wall.
+def ghost_outcomes(pos, board, moves=None):
+    legal = legal_moves(pos, board, moves)
+    outcomes = [(new_pos, 1 / len(DIRECTIONS)) for _, new_pos in legal]
+    if len(legal) < len(DIRECTIONS):
+        outcomes.append((pos, (len(DIRECTIONS) - len(legal)) / len(DIRECTIONS)))
+    return outcomes
+
+# Expectimax algorithm implementation for the random ghosts
+# Pac-Man's layer maximizes as in minimax. The ghosts' layer is a chance node: every ghost
+# moves at once, as in the game, and the node is worth the expected score over their joint
+# random moves, up to 4 ** ghosts outcomes. With samples the expectation is estimated from that
+# many joint moves drawn with rng (a random.Random, the random module if not given), so a
+# chance node costs at most samples searches whatever the number of ghosts.
+# pellets, distances, moves and weights are used as in minimax().
+def expectimax(board, pacman_pos, ghost_pos, depth, is_max, max_depth=3, samples=None, rng=None, pellets=None,
+               distances=None, moves=None, weights=None):
+    if pellets is None:
+        pellets = PelletIndex(board)
+    if depth == max_depth or is_game_over(pacman_pos, ghost_pos):
+        return None, evaluate(pacman_pos, ghost_pos, board, pellets, distances, weights)
+
+    if is_max:
+        best_move = None
+        best_score = float('-inf')
+        for move, new_pos in legal_moves(pacman_pos, board, moves):
+            eats = new_pos in pellets
+            if eats:
+                pellets.eat(new_pos)
+            _, score = expectimax(board, new_pos, ghost_pos, depth + 1, False, max_depth, samples, rng, pellets,
+                                  distances, moves, weights)
+            if eats:
+                pellets.restore(new_pos)
+            if score > best_score:
+                best_score = score
+                best_move = move
         return best_move, best_score
 
-def evaluate(pacman_pos, ghost_pos, board):
-    pellet_count = count_pellets(board)
-    ghost_distance = min(abs(pacman_pos[0] - pos[0]) + abs(pacman_pos[1] - pos[1]) for pos in ghost_pos)
-    
+    outcomes = [ghost_outcomes(pos, board, moves) for pos in ghost_pos]
+    if samples is None:
+        joint_moves = []
+        for combination in product(*outcomes):
+            probability = 1.0
+            for _, p in combination:
+                probability *= p
+            joint_moves.append(([pos for pos, _ in combination], probability))
+    else:
+        # Identical draws are searched once and weighted by how often they came up
+        rng = rng or random
+        population = [([pos for pos, _ in ghost], [p for _, p in ghost]) for ghost in outcomes]
+        draws = Counter(tuple(rng.choices(positions, odds)[0] for positions, odds in population)
+                        for _ in range(samples))
+        joint_moves = [(list(new_ghost_pos), count / samples) for new_ghost_pos, count in draws.items()]
+
+    expected_score = 0.0
+    for new_ghost_pos, probability in joint_moves:
+        _, score = expectimax(board, pacman_pos, new_ghost_pos, depth + 1, True, max_depth, samples, rng, pellets,
+                              distances, moves, weights)
+        expected_score += probability * score
+    return None, expected_score
+
+# Weights of evaluate(), in order: pellets (times 1 / (1 + pellets left)), proximity (times
+# 1 / (1 + distance to the nearest pellet)), penalty when the nearest ghost is closer than radius,
+# penalty for each ghost closer than radius, and radius. The same five weights in every script;
+# pacman_tuner searches them.
+WEIGHTS = (20, 10, -200, 0, 4)
+
+# pellets is the PelletIndex of the board, built from the board when not given.
+# Distances are maze distances when a DistanceTable is given, Manhattan distances otherwise.
+# weights are five weights as in WEIGHTS, WEIGHTS when not given.
+def evaluate(pacman_pos, ghost_pos, board, pellets=None, distances=None, weights=None):
+    if pellets is None:
+        pellets = PelletIndex(board)
+    pellet_weight, proximity_weight, ghost_weight, each_ghost_weight, radius = weights or WEIGHTS
+    pellet_count = pellets.count
+    ghost_distance = min(maze_distance(pacman_pos, pos, distances) for pos in ghost_pos)
+
     # Increase the penalty for being close to ghosts
-    ghost_penalty = -200 if ghost_distance < 4 else 0  # Larger penalty if a ghost is too close
+    ghost_penalty = ghost_weight if ghost_distance < radius else 0  # Larger penalty if a ghost is too close
+    if each_ghost_weight:
+        ghost_penalty += each_ghost_weight * sum(maze_distance(pacman_pos, pos, distances) < radius
+                                                 for pos in ghost_pos)
 
     # Find the distance to the nearest pellet
-    pellet_positions = np.argwhere(board == PELLET)
-    if pellet_positions.size > 0:
-        nearest_pellet_distance = min(np.sum(np.abs(pacman_pos - pellet_pos)) for pellet_pos in pellet_positions)
-    else:
+    nearest_pellet_distance = pellets.nearest_distance(pacman_pos, distances)
+    if nearest_pellet_distance is None:
         nearest_pellet_distance = 0
 
     # Reward for eating pellets and being close to the nearest pellet
-    pellet_reward = 20 * (1 / (1 + pellet_count))  # Increase the weight of pellet count
-    pellet_proximity_reward = 10 / (1 + nearest_pellet_distance)  # Reward for being closer to pellets
+    pellet_reward = pellet_weight * (1 / (1 + pellet_count))  # Increase the weight of pellet count
+    pellet_proximity_reward = proximity_weight / (1 + nearest_pellet_distance)  # Reward for being closer to pellets
 
     # Adjust the function to heavily penalize getting close to ghosts, and reward pellet eating and proximity to pellets more
     return pellet_reward + pellet_proximity_reward + ghost_penalty
 
-def display_board_with_score(board, pacman_pos, ghost_pos, score):
-    os.system('cls' if platform.system() == 'Windows' else 'clear')
-    temp_board = np.copy(board)
-    temp_board[pacman_pos] = PACMAN
-    for pos in ghost_pos:
-        temp_board[pos] = GHOST
-    for row in temp_board:
-        print(' '.join(row))
-    print(f"Score: {score}")
-
 # Main game play function with Minimax for Pac-Man and random movement for ghosts
 # Main game play function with Minimax for Pac-Man and random movement for ghosts
-def play_game_with_minimax(board_width, board_height, num_ghosts, layout=None):
+# With render=False the game runs headless: no drawing and no pause between turns. Otherwise
+# the board is redrawn in place at fps frames per second (fps=None plays as fast as it can).
+# seed makes ghost placement and random moves reproducible, max_turns stops long games.
+# search='expectimax' makes Pac-Man search the ghosts as the random movers they are, with
+# expectimax() to max_depth, sampling samples joint ghost moves per chance node when given.
+# With instrument, every search fills in a SearchStats and the game's result gets their dicts,
+# one per search in order, as 'stats'.
+# search_workers splits Pac-Man's minimax searches of max_depth 5 or more over that many worker
+# processes (see ParallelSearch); split searches are not instrumented.
+# trace appends every turn (positions, Pac-Man's move, score, search time and nodes) to that
+# trace file as game trace_game; see pacman_trace.
+# search='table' makes Pac-Man play from a policy table solved offline by pacman_solver: policy
+# is the table or the file it was saved to, and the layout is solved here when it is None.
+# weights are Pac-Man's evaluate() weights (see WEIGHTS); the policy table does not evaluate
+# positions and ignores them.
+# ponder, with the minimax search, starts a worker process searching Pac-Man's next move from
+# the ghosts' ponder most likely random steps while the board is drawn; when the ghosts' real
+# steps were among them, Pac-Man takes that move without searching (see Ponderer). The result
+# then counts those turns as 'ponder_hits'.
+# cache_dir keeps the layout's compiled tables there and opens them from there in later games
+# (see pacman_layouts.compile_layout()), instead of working out the maze distances and moves
+# each game. Boards of more than pacman_layouts.MAX_DISTANCE_CELLS walkable cells get no
+# distance matrix and are searched with Manhattan distances.
+# Returns the game's result as a dict.
+def play_game_with_minimax(board_width, board_height, num_ghosts, layout=None, max_depth=3,
+                           render=True, seed=None, max_turns=None, search='minimax', samples=None, fps=1.0,
+                           instrument=False, search_workers=None, trace=None, trace_game=0, policy=None,
+                           weights=None, ponder=None, cache_dir=None):
+    if seed is not None:
+        random.seed(seed)
     if layout:
         board, pacman_pos, ghost_pos = create_custom_layout(layout)
     else:
@@ -146,17 +283,63 @@ def play_game_with_minimax(board_width, board_height, num_ghosts, layout=None):
         pacman_pos = (board_height // 2, board_width // 2)
         ghost_pos = [(random.randint(1, board_height - 2), random.randint(1, board_width - 2)) for _ in range(num_ghosts)]
 
+    tt = TranspositionTable(board.shape, len(ghost_pos))  # Shared by every search of the game
+    pellets = PelletIndex(board)  # Kept in step with the board as pellets are eaten
+    # Maze distances between all walkable cells (None on boards too large for them) and legal
+    # moves of every walkable cell
+    distances, moves = layout_tables(board, layout, cache_dir)
+    renderer = make_renderer(render, fps)
+    tracer = TraceWriter(trace, board, len(ghost_pos), trace_game) if trace else None
+    if search == 'table':
+        table = load_policy(policy) if policy is not None else solve(board, len(ghost_pos), 'random')
+        agent = TableAgent(table, board, distances)
+    if tracer is not None:
+        tracer.append(0, pacman_pos, ghost_pos, (0, 0), 0)  # Start positions
+    rng = random.Random(seed)  # Expectimax samples, kept apart from the ghosts' own moves
+    parallel = None
+    if search_workers and search == 'minimax':
+        parallel = ParallelSearch(board, len(ghost_pos), 'minimax-random', search_workers, distances=distances,
+                                  moves=moves)
+    ponderer = None
+    if ponder and search == 'minimax' and parallel is None:
+        ponderer = Ponderer(board, len(ghost_pos), 'minimax-random', 'random', ponder, distances=distances,
+                            moves=moves)
+
     score = 0
     moves_without_pellet = 0
+    turns = 0
+    search_time = 0.0  # Seconds spent searching
+    search_stats = []  # SearchStats.as_dict() of each search when instrumented
 
     while True:
-        display_board_with_score(board, pacman_pos, ghost_pos, score)
-
-        move, _ = minimax(board, pacman_pos, ghost_pos, 0, True, max_depth=3)
+        renderer.draw(board, pacman_pos, ghost_pos, [f"Score: {score}"])
+        tt.new_search()
+
+        turn_start = search_time  # Search time before this turn, for the trace
+        pacman_stats = SearchStats(turn=turns, side='pacman') if instrument else None
+        start = perf_counter()
+        pondered = ponderer.lookup(pacman_pos, ghost_pos) if ponderer is not None else None
+        if search == 'table':
+            move = agent.move(board, pacman_pos, ghost_pos, pellets)
+        elif pondered is not None:
+            move, _, _ = pondered
+        elif search == 'expectimax':
+            move, _ = expectimax(board, pacman_pos, ghost_pos, 0, True, max_depth, samples, rng, pellets, distances,
+                                 moves, weights)
+        elif parallel is not None:
+            move, _ = parallel.search_pacman(board, pacman_pos, ghost_pos, max_depth, pellets, tt, pacman_stats, weights)
+        else:
+            move, _ = minimax(board, pacman_pos, ghost_pos, 0, True, max_depth=max_depth, tt=tt, pellets=pellets,
+                              distances=distances, moves=moves, stats=pacman_stats, weights=weights)
+        elapsed = perf_counter() - start
+        search_time += elapsed
+        record(search_stats, pacman_stats, elapsed)
         if move:
-            new_pos = move_character(pacman_pos, move, board)
+            new_pos = moves.step(pacman_pos, move)
             if board[new_pos] == PELLET:
                 board[new_pos] = EMPTY  # Erase the pellet
+                tt.zobrist.eat_pellet(new_pos)
+                pellets.eat(new_pos)
                 score += 10
                 moves_without_pellet = 0  # Reset the counter as Pac-Man ate a pellet
             else:
@@ -168,15 +351,50 @@ def play_game_with_minimax(board_width, board_height, num_ghosts, layout=None):
                 moves_without_pellet = 0  # Reset the counter to avoid continuous score deduction
 
             pacman_pos = new_pos
+        if ponderer is not None:
+            ponderer.start(pacman_pos, ghost_pos, max_depth, pellets, weights)
 
         # Random movement for ghosts
         for i in range(len(ghost_pos)):
-            ghost_pos[i] = move_character(ghost_pos[i], random.choice(DIRECTIONS), board)
+            ghost_pos[i] = moves.step(ghost_pos[i], random.choice(DIRECTIONS))
 
+        turns += 1
+        if tracer is not None:
+            nodes = sum(stats.total_nodes for stats in (pacman_stats,) if stats is not None)
+            tracer.append(turns, pacman_pos, ghost_pos, move or (0, 0), score, search_time - turn_start, nodes,
+                          max_depth)
         if is_game_over(pacman_pos, ghost_pos):
-            print(f"Game Over! Final Score: {score}")
+            renderer.message(f"Game Over! Final Score: {score}")
             break
-        sleep(1)
+        if pellets.count == 0:
+            renderer.message(f"You Win! Final Score: {score}")
+            break
+        if max_turns is not None and turns >= max_turns:
+            break
+
+        renderer.wait()
+
+    renderer.close()
+    if tracer is not None:
+        tracer.close()
+    if parallel is not None:
+        parallel.close()
+    if ponderer is not None:
+        ponderer.close()
+    caught = is_game_over(pacman_pos, ghost_pos)
+    result = {
+        'score': score,
+        'turns': turns,
+        'win': not caught and pellets.count == 0,
+        'caught': caught,
+        'pellets_left': pellets.count,
+        'search_time': search_time,
+    }
+    if instrument:
+        result['stats'] = search_stats
+    if ponderer is not None:
+        result['ponder_hits'] = ponderer.hits
+    return result
 
 
 
@@ -0,0 +1,245 @@
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import pacman_bitboard
+from pacman_maze import DistanceTable, MoveTable
+from pacman_pellets import PelletIndex
+from pacman_scripts import SCRIPT_DIR, load_script
+from pacman_stats import SearchStats
+from pacman_transposition import TranspositionTable
+
+ENGINES = ['minimax', 'alphabeta', 'alphabeta-batch', 'bitboard']
+SIZES = [(10, 7), (20, 11), (40, 21)]
+KEY_FIELDS = ('engine', 'position', 'ghosts', 'depth')
+
+
+# Fixed start positions: custom_layout as the scripts play it, then create_board() boards of
+# each size with 1..6 ghosts at seeded random cells and Pac-Man in the middle.
+# Returns (name, board, pacman_pos, ghost_pos) tuples.
+def make_positions(sizes=SIZES, ghost_counts=range(1, 7), seed=0):
+    game = load_script('alphabeta')
+    board, pacman_pos, ghost_pos = game.create_custom_layout(game.custom_layout)
+    positions = [('custom', board, pacman_pos, ghost_pos)]
+    for width, height in sizes:
+        for num_ghosts in ghost_counts:
+            rng = random.Random(seed * 1000 + width * 100 + num_ghosts)
+            pacman_pos = (height // 2, width // 2)
+            cells = [(i, j) for i in range(1, height - 1) for j in range(1, width - 1) if (i, j) != pacman_pos]
+            positions.append((f'open{width}x{height}', game.create_board(width, height), pacman_pos,
+                              rng.sample(cells, num_ghosts)))
+    return positions
+
+
+# One search engine on one position. search(depth, tt, stats) runs a complete search and
+# returns its score; each search gets a fresh transposition table from new_table() (None for
+# the bitboard engine, which has none), made outside the timed part. count(depth) runs the same
+# search with a SearchStats and returns the number of nodes it visited.
+# alphabeta-batch is alphabeta() with batch_leaves, so the suite times the two side by side. It
+# finds the same scores, but a batch scores every child of a node, including those past a
+# cutoff, so it can count more leaves.
+class Engine:
+    def __init__(self, name, board, pacman_pos, ghost_pos):
+        self.name = name
+        self.board = board.copy()  # Searches eat and restore pellets; keep the callers' board out of it
+        self.pacman_pos = pacman_pos
+        self.ghost_pos = list(ghost_pos)
+        self.pellets = PelletIndex(self.board)
+        self.distances = DistanceTable(self.board)
+        self.moves = MoveTable(self.board)
+        if name == 'minimax':
+            self.module = load_script('minimax')
+        elif name in ('alphabeta', 'alphabeta-batch'):
+            self.module = load_script('alphabeta')
+        else:
+            self.module = pacman_bitboard
+            self.layout = pacman_bitboard.BitboardLayout(self.board)
+
+    def new_table(self):
+        if self.name == 'bitboard':
+            return None
+        return TranspositionTable(self.board.shape, len(self.ghost_pos))
+
+    def search(self, depth, tt=None, stats=None):
+        if self.name == 'bitboard':
+            state = pacman_bitboard.BitState(self.layout, self.board, self.pacman_pos, self.ghost_pos)
+            return self.module.bb_alphabeta(self.layout, state, 0, True, depth, stats=stats)[1]
+        if self.name == 'minimax':
+            return self.module.minimax(self.board, self.pacman_pos, self.ghost_pos, 0, depth, True, tt=tt,
+                                       pellets=self.pellets, distances=self.distances, moves=self.moves,
+                                       stats=stats)[1]
+        return self.module.alphabeta(self.board, self.pacman_pos, self.ghost_pos, 0, True, depth, tt=tt,
+                                     pellets=self.pellets, distances=self.distances, moves=self.moves,
+                                     batch_leaves=self.name == 'alphabeta-batch', stats=stats)[1]
+
+    def count(self, depth):
+        stats = SearchStats()
+        self.search(depth, self.new_table(), stats)
+        return stats.total_nodes
+
+
+# Effective branching factor: the b for which a uniform tree of the given depth, 1 + b + ...
+# + b ** depth nodes, has as many nodes as the search visited
+def effective_branching_factor(nodes, depth):
+    if depth == 0 or nodes <= 1:
+        return 0.0
+    low, high = 0.0, float(nodes)
+    for _ in range(100):
+        b = (low + high) / 2
+        if sum(b ** d for d in range(depth + 1)) < nodes:
+            low = b
+        else:
+            high = b
+    return (low + high) / 2
+
+
+# Function to measure one engine on one position at one depth: best of repeat timed runs, then
+# one counted run for the node count and one traced run for the peak memory of the search
+def measure(engine, depth, repeat=3):
+    seconds = float('inf')
+    for _ in range(repeat):
+        tt = engine.new_table()
+        start = time.perf_counter()
+        score = engine.search(depth, tt)
+        seconds = min(seconds, time.perf_counter() - start)
+    nodes = engine.count(depth)
+    tracemalloc.start()
+    engine.search(depth, engine.new_table())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'nodes': nodes,
+        'seconds': seconds,
+        'nodes_per_sec': nodes / seconds if seconds > 0 else 0.0,
+        'peak_kb': peak / 1024,
+        'ebf': effective_branching_factor(nodes, depth),
+        'score': score,
+    }
+
+
+# Function to run the whole suite. Depths go up in order and an engine stops deepening on a
+# position once one search takes more than max_seconds, since the next depth costs several
+# times more. progress is called with each result as it comes in.
+def run_suite(engines=ENGINES, depths=range(1, 8), sizes=SIZES, ghost_counts=range(1, 7), repeat=3,
+              max_seconds=1.0, seed=0, progress=None):
+    results = []
+    for name, board, pacman_pos, ghost_pos in make_positions(sizes, ghost_counts, seed):
+        for engine_name in engines:
+            engine = Engine(engine_name, board, pacman_pos, ghost_pos)
+            for depth in depths:
+                result = dict(engine=engine_name, position=name, width=board.shape[1], height=board.shape[0],
+                              ghosts=len(ghost_pos), depth=depth, **measure(engine, depth, repeat))
+                results.append(result)
+                if progress is not None:
+                    progress(result)
+                if result['seconds'] > max_seconds:
+                    break
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRIPT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save(results, path):
+    with open(path, 'w') as f:
+        json.dump({
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': results,
+        }, f, indent=2)
+
+
+# Function to compare two saved runs result by result. A result regresses when its search
+# takes more than threshold (a fraction) longer, or visits more nodes, than in the baseline.
+# Searches faster than min_seconds in both runs are too noisy to time and only their node
+# counts are compared. Returns (rows, regressions) where rows are (key, old, new) triples.
+def compare(baseline, current, threshold=0.25, min_seconds=0.001):
+    old = {tuple(result[field] for field in KEY_FIELDS): result for result in baseline['results']}
+    rows = []
+    regressions = []
+    for result in current['results']:
+        key = tuple(result[field] for field in KEY_FIELDS)
+        if key not in old:
+            continue
+        rows.append((key, old[key], result))
+        slower = (max(old[key]['seconds'], result['seconds']) >= min_seconds
+                  and result['seconds'] > old[key]['seconds'] * (1 + threshold))
+        if slower or result['nodes'] > old[key]['nodes']:
+            regressions.append((key, old[key], result))
+    return rows, regressions
+
+
+def print_result(result):
+    print(f"{result['engine']:>15} {result['position']:>11} {result['ghosts']:>6} {result['depth']:>5} "
+          f"{result['nodes']:>9} {result['nodes_per_sec']:>11.0f} {1000 * result['seconds']:>10.2f} "
+          f"{result['peak_kb']:>9.1f} {result['ebf']:>6.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the search engines and compare runs.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help="run the suite and save it as JSON")
+    run.add_argument('--engines', nargs='+', choices=ENGINES, default=ENGINES)
+    run.add_argument('--depths', type=int, nargs='+', default=list(range(1, 8)))
+    run.add_argument('--ghosts', type=int, nargs='+', default=list(range(1, 7)),
+                     help="ghost counts for the open boards (custom_layout keeps its own)")
+    run.add_argument('--sizes', nargs='+', default=[f'{w}x{h}' for w, h in SIZES], help="open boards as WxH")
+    run.add_argument('--repeat', type=int, default=3, help="timed runs per search, the best one counts")
+    run.add_argument('--max-seconds', type=float, default=1.0,
+                     help="stop deepening an engine on a position after a search this slow")
+    run.add_argument('--seed', type=int, default=0)
+    run.add_argument('-o', '--output', default='benchmark.json')
+
+    diff = commands.add_parser('compare', help="compare two saved runs and flag regressions")
+    diff.add_argument('baseline')
+    diff.add_argument('current')
+    diff.add_argument('--threshold', type=float, default=0.25, help="allowed slowdown, as a fraction")
+    diff.add_argument('--min-ms', type=float, default=1.0, help="searches faster than this are not timed")
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        sizes = [tuple(int(n) for n in size.split('x')) for size in args.sizes]
+        print(f"{'engine':>15} {'position':>11} {'ghosts':>6} {'depth':>5} {'nodes':>9} {'nodes/s':>11} "
+              f"{'ms/move':>10} {'peak KiB':>9} {'ebf':>6}")
+        results = run_suite(args.engines, args.depths, sizes, args.ghosts, args.repeat, args.max_seconds,
+                            args.seed, progress=print_result)
+        save(results, args.output)
+        print(f"Results written to {args.output}")
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows, regressions = compare(baseline, current, args.threshold, args.min_ms / 1000)
+    print(f"{baseline.get('commit')} -> {current.get('commit')}: {len(rows)} searches in both runs")
+    print(f"{'engine':>15} {'position':>11} {'ghosts':>6} {'depth':>5} {'old ms':>9} {'new ms':>9} {'change':>7} "
+          f"{'old nodes':>9} {'new nodes':>9}")
+    flagged = {key for key, _, _ in regressions}
+    for key, old, new in rows:
+        change = new['seconds'] / old['seconds'] - 1 if old['seconds'] > 0 else 0.0
+        print(f"{key[0]:>15} {key[1]:>11} {key[2]:>6} {key[3]:>5} {1000 * old['seconds']:>9.2f} "
+              f"{1000 * new['seconds']:>9.2f} {change:>+7.0%} {old['nodes']:>9} {new['nodes']:>9}"
+              f"{'  REGRESSION' if key in flagged else ''}")
+    print(f"{len(regressions)} regression(s)")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+import time
+
+from pacman_maze import UNREACHABLE
+
+WALL = '#'
+PELLET = '.'
+
+# Weights of bb_evaluate(), as WEIGHTS in the AlphaBeta scripts
+WEIGHTS = (20, 10, -200, 0, 4)
+
+
+# Bitboard view of a layout for the search engine. Cell (row, col) is bit row * width + col
+# of a Python int; walls, open cells and pellets are each one int, and positions are plain
+# cell indices. Directions are indexed like DIRECTIONS in the game scripts: up, down, left,
+# right.
+class BitboardLayout:
+    def __init__(self, board):
+        height, width = board.shape
+        self.height = height
+        self.width = width
+        self.full = (1 << (height * width)) - 1
+        self.walls = self.bits(board == WALL)
+        self.open = self.full & ~self.walls
+        first_col = sum(1 << (row * width) for row in range(height))
+        last_col = first_col << (width - 1)
+        self.steps = [-width, width, -1, 1]
+        # can_move[d] has the bit of every open cell whose neighbour in direction d is open
+        self.can_move = [
+            self.open & (self.open << width),
+            self.open & (self.open >> width),
+            self.open & ~first_col & (self.open << 1),
+            self.open & ~last_col & (self.open >> 1),
+        ]
+        self.not_first_col = self.full & ~first_col
+        self.not_last_col = self.full & ~last_col
+
+    # Function to pack a boolean array of the board's shape into a bitboard
+    def bits(self, mask):
+        value = 0
+        for cell, flag in enumerate(mask.ravel()):
+            if flag:
+                value |= 1 << cell
+        return value
+
+    def cell(self, pos):
+        return pos[0] * self.width + pos[1]
+
+    def pos(self, cell):
+        return divmod(cell, self.width)
+
+    # Every open cell one step away from the cells of reach, plus reach itself
+    def expand(self, reach):
+        grown = reach | (reach << self.width) | (reach >> self.width)
+        grown |= ((reach & self.not_last_col) << 1) | ((reach & self.not_first_col) >> 1)
+        return grown & self.open
+
+
+# Search state with make/unmake moves: nothing is allocated while searching, moves are
+# applied in place and undone on the way back up.
+class BitState:
+    __slots__ = ('pacman', 'ghosts', 'pellets', 'pellet_count')
+
+    def __init__(self, layout, board, pacman_pos, ghost_pos):
+        self.pacman = layout.cell(pacman_pos)
+        self.ghosts = [layout.cell(pos) for pos in ghost_pos]
+        self.pellets = layout.bits(board == PELLET)
+        self.pellet_count = self.pellets.bit_count()
+
+    # Moves Pac-Man to cell and returns whether a pellet was eaten there
+    def make_pacman_move(self, cell):
+        self.pacman = cell
+        bit = 1 << cell
+        if self.pellets & bit:
+            self.pellets ^= bit
+            self.pellet_count -= 1
+            return True
+        return False
+
+    def unmake_pacman_move(self, cell, old_cell, eaten):
+        if eaten:
+            self.pellets |= 1 << cell
+            self.pellet_count += 1
+        self.pacman = old_cell
+
+    # Moves ghost i to cell and returns where it came from
+    def make_ghost_move(self, i, cell):
+        old_cell = self.ghosts[i]
+        self.ghosts[i] = cell
+        return old_cell
+
+    def unmake_ghost_move(self, i, old_cell):
+        self.ghosts[i] = old_cell
+
+
+# Bitboard equivalent of move_character, on a cell index and a direction index
+def bb_move_character(layout, cell, direction):
+    if (layout.can_move[direction] >> cell) & 1:
+        return cell + layout.steps[direction]
+    return cell
+
+
+def bb_is_game_over(state):
+    return state.pacman in state.ghosts
+
+
+def bb_count_pellets(state):
+    return state.pellet_count
+
+
+# Bitboard equivalent of evaluate() with maze distances. One flood fill from Pac-Man finds
+# both the ghosts within the penalty radius and the nearest pellet. weights are five weights
+# as in WEIGHTS, WEIGHTS when not given.
+def bb_evaluate(layout, state, weights=None):
+    pellet_weight, proximity_weight, ghost_weight, each_ghost_weight, radius = weights or WEIGHTS
+    ghosts = 0
+    for cell in state.ghosts:
+        ghosts |= 1 << cell
+    reach = 1 << state.pacman
+    near = 0  # Cells closer than radius
+    distance = 0
+    nearest_pellet_distance = 0 if not state.pellets else None
+    while True:
+        if distance < radius:
+            near = reach
+        if nearest_pellet_distance is None and reach & state.pellets:
+            nearest_pellet_distance = distance
+        # Past the radius only the nearest pellet is still looked for, and without a weight for
+        # each ghost one close ghost is enough
+        ghosts_done = distance >= radius - 1 or (near & ghosts and not each_ghost_weight)
+        if nearest_pellet_distance is not None and ghosts_done:
+            break
+        grown = layout.expand(reach)
+        if grown == reach:
+            if nearest_pellet_distance is None:
+                nearest_pellet_distance = UNREACHABLE
+            break
+        reach = grown
+        distance += 1
+
+    ghost_penalty = ghost_weight if near & ghosts else 0
+    if each_ghost_weight:
+        ghost_penalty += each_ghost_weight * sum((near >> cell) & 1 for cell in state.ghosts)
+    pellet_reward = pellet_weight * (1 / (1 + state.pellet_count))
+    pellet_proximity_reward = proximity_weight / (1 + nearest_pellet_distance)
+    return pellet_reward + pellet_proximity_reward + ghost_penalty
+
+
+# AlphaBeta search on a BitState. Children are generated in the same order as
+# generate_children() in the game scripts, and the result is (direction index, score).
+# weights are passed to bb_evaluate(). stats is a SearchStats to count nodes, leaves and
+# cutoffs in, as alphabeta() does; this search has no table and times nothing.
+def bb_alphabeta(layout, state, depth, is_max, max_depth=3, alpha=float('-inf'), beta=float('inf'), weights=None,
+                 stats=None):
+    if stats is not None:
+        stats.node(depth)
+    if depth == max_depth or bb_is_game_over(state):
+        if stats is not None:
+            stats.leaves += 1
+        return None, bb_evaluate(layout, state, weights)
+
+    best_move = None
+    if is_max:
+        best_score = float('-inf')
+        old_cell = state.pacman
+        for move in range(4):
+            cell = bb_move_character(layout, old_cell, move)
+            if cell == old_cell:
+                continue
+            eaten = state.make_pacman_move(cell)
+            _, score = bb_alphabeta(layout, state, depth + 1, False, max_depth, alpha, beta, weights, stats)
+            state.unmake_pacman_move(cell, old_cell, eaten)
+            if score > best_score:
+                best_score = score
+                best_move = move
+            alpha = max(alpha, best_score)
+            if alpha >= beta:
+                if stats is not None:
+                    stats.cutoff(depth)
+                break
+    else:
+        best_score = float('inf')
+        for i in range(len(state.ghosts)):
+            old_cell = state.ghosts[i]
+            for move in range(4):
+                cell = bb_move_character(layout, old_cell, move)
+                if cell == old_cell:
+                    continue
+                state.make_ghost_move(i, cell)
+                _, score = bb_alphabeta(layout, state, depth + 1, True, max_depth, alpha, beta, weights, stats)
+                state.unmake_ghost_move(i, old_cell)
+                if score < best_score:
+                    best_score = score
+                    best_move = move
+                beta = min(beta, best_score)
+                if alpha >= beta:
+                    if stats is not None:
+                        stats.cutoff(depth)
+                    break
+            if alpha >= beta:
+                break
+    return best_move, best_score
+
+
+# Benchmark: nodes per second of bb_alphabeta against alphabeta() of the AlphaBeta script on
+# the char-array board, from the start of custom_layout with the same tree (no move ordering).
+# Both search with weights, the scripts' WEIGHTS when not given. Each search is timed without
+# stats and run once more with a SearchStats to count its nodes.
+def benchmark(depths=(3, 4, 5, 6, 7), weights=None):
+    from pacman_maze import DistanceTable
+    from pacman_pellets import PelletIndex
+    from pacman_scripts import load_script
+    from pacman_stats import SearchStats
+
+    game = load_script('alphabeta')
+    board, pacman_pos, ghost_pos = game.create_custom_layout(game.custom_layout)
+    layout = BitboardLayout(board)
+    distances = DistanceTable(board)
+    pellets = PelletIndex(board)
+
+    def char_search(depth, stats=None):
+        return game.alphabeta(board, pacman_pos, ghost_pos, 0, True, depth, order_moves=None, pellets=pellets,
+                              distances=distances, weights=weights, stats=stats)[1]
+
+    def bit_search(depth, stats=None):
+        state = BitState(layout, board, pacman_pos, ghost_pos)
+        return bb_alphabeta(layout, state, 0, True, depth, weights=weights, stats=stats)[1]
+
+    results = []
+    for depth in depths:
+        start = time.perf_counter()
+        char_score = char_search(depth)
+        char_time = time.perf_counter() - start
+        char_stats = SearchStats()
+        char_search(depth, char_stats)
+
+        start = time.perf_counter()
+        bit_score = bit_search(depth)
+        bit_time = time.perf_counter() - start
+        bit_stats = SearchStats()
+        bit_search(depth, bit_stats)
+
+        char_nodes, bit_nodes = char_stats.total_nodes, bit_stats.total_nodes
+        results.append((depth, char_nodes, char_nodes / char_time, bit_nodes, bit_nodes / bit_time,
+                        abs(char_score - bit_score) < 1e-9))
+    return results
+
+
+if __name__ == "__main__":
+    print(f"{'depth':>5} {'char nodes':>10} {'char nodes/s':>12} {'bit nodes':>10} {'bit nodes/s':>12} same score")
+    for depth, char_nodes, char_rate, bit_nodes, bit_rate, same in benchmark():
+        print(f"{depth:>5} {char_nodes:>10} {char_rate:>12.0f} {bit_nodes:>10} {bit_rate:>12.0f} {same}")
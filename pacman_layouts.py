@@ -0,0 +1,328 @@
+import argparse
+import hashlib
+import os
+import struct
+import zipfile
+from time import perf_counter
+
+import numpy as np
+
+from pacman_maze import DistanceTable, MoveTable, step_table
+from pacman_symmetry import SymmetryTable, layout_symmetries, transform_indices, transform_symmetries
+
+# Layout characters, as in the game scripts
+WALL = '#'
+PELLET = '.'
+EMPTY = ' '
+PACMAN = 'P'
+GHOST = 'G'
+
+# Board character of every layout byte: walls and pellets are kept, anything else is empty
+_BOARD_CHARS = np.full(256, EMPTY)
+_BOARD_CHARS[ord(WALL)] = WALL
+_BOARD_CHARS[ord(PELLET)] = PELLET
+
+# Smallest layout generate_layout() can fit a ghost house and a maze around it into
+MIN_WIDTH = 15
+MIN_HEIGHT = 11
+
+# Version of the compiled layout files; part of their key, so older files are never read
+ARTIFACT_VERSION = 3
+
+# Most walkable cells a compiled layout keeps the distance matrix for (cells ** 2 int16s). A
+# 100x100 maze has about 5,600: its matrix takes some 10 s to build and 63 MB to keep, and both
+# grow with the square of the cells.
+MAX_DISTANCE_CELLS = 6_000
+
+
+# Function to parse a layout, a list of strings, into the board, Pac-Man's position and the
+# ghosts' positions (in reading order), as the scripts' create_custom_layout() does. Cells
+# under Pac-Man and the ghosts are empty; short rows are padded with empty cells. The layout is
+# read as one byte array, so a 1000x1000 layout parses in milliseconds.
+def parse_layout(layout):
+    return _parse_codes(_layout_codes(layout))
+
+
+# The layout as a (height, width) array of its ASCII bytes
+def _layout_codes(layout):
+    height = len(layout)
+    width = len(layout[0])
+    text = ''.join(row[:width].ljust(width) for row in layout)
+    return np.frombuffer(text.encode('ascii', 'replace'), dtype=np.uint8).reshape(height, width)
+
+
+def _parse_codes(codes):
+    board = _BOARD_CHARS[codes]
+    pacman = np.argwhere(codes == ord(PACMAN))
+    pacman_pos = (int(pacman[-1][0]), int(pacman[-1][1])) if len(pacman) else None
+    ghost_pos = [(int(i), int(j)) for i, j in np.argwhere(codes == ord(GHOST))]
+    return board, pacman_pos, ghost_pos
+
+
+# Ghost house size in maze cells (rows, columns spanned) for num_ghosts ghosts. The house has
+# 2 * rows - 3 rows and 2 * columns - 3 columns inside its walls: one row of 5 up to 5 ghosts,
+# then three rows, as wide as they need to be.
+def _house_size(num_ghosts):
+    rows = 2 if num_ghosts <= 5 else 3
+    inside = 2 * rows - 3
+    columns = max(4, (-(-num_ghosts // inside) + 4) // 2)
+    return rows, columns + columns % 2
+
+
+# Binary-tree maze of the left half of the layout, middle column included: every cell opens
+# north or towards the middle, the top row towards the middle and the middle column north, so
+# every cell reaches the top of the middle column. loops of the walls left are opened, then
+# every dead end opens one more of its walls. The right half is the mirror image, so the middle
+# column's east wall is its west wall. Returns the passages as (rows, half - 1) east and
+# (rows - 1, half) south masks.
+def _carve_half(rows, half, loops, rng):
+    north = rng.random((rows, half)) < 0.5
+    north[0] = False
+    north[1:, -1] = True
+    east = ~north[:, :-1]
+    south = north[1:].copy()
+    east |= rng.random(east.shape) < loops
+    south |= rng.random(south.shape) < loops
+
+    # Passages on each side of every cell: west E[:, j], east E[:, j + 1], north S[i], south S[i + 1]
+    sides_e = np.zeros((rows, half + 1), dtype=bool)
+    sides_e[:, 1:half] = east
+    sides_e[:, half] = east[:, -1]
+    sides_s = np.zeros((rows + 1, half), dtype=bool)
+    sides_s[1:rows] = south
+    west_open, east_open = sides_e[:, :-1], sides_e[:, 1:]
+    north_open, south_open = sides_s[:-1], sides_s[1:]
+    degree = west_open.astype(np.int8) + east_open + north_open + south_open
+
+    closed = np.stack([~west_open, ~east_open, ~north_open, ~south_open], axis=2)
+    closed[:, 0, 0] = False  # The left edge
+    closed[:, -1, 1] = False  # The middle column's east wall is its west wall
+    closed[0, :, 2] = False  # The top edge
+    closed[-1, :, 3] = False  # The bottom edge
+    pick = (rng.random(closed.shape) * closed).argmax(axis=2)
+    dead = (degree == 1) & closed.any(axis=2)
+    for side, (d_row, d_col, passages) in enumerate([(0, -1, east), (0, 0, east), (-1, 0, south), (0, 0, south)]):
+        i, j = np.nonzero(dead & (pick == side))
+        passages[i + d_row, j + d_col] = True
+    return east, south
+
+
+# Function to generate a Pac-Man-style maze as a layout, the list of strings parse_layout() and
+# the scripts' create_custom_layout() read. The maze has corridors one cell wide with loops and
+# no dead ends, is the mirror image of itself left to right like custom_layout, and has a ghost
+# house in the middle with num_ghosts ghosts inside and a door at the top; Pac-Man starts below
+# it. loops is the share of the binary-tree maze's walls knocked out to make more loops. The
+# same seed gives the same maze. Everything is built with whole-array NumPy operations, so a
+# 1000x1000 maze takes milliseconds.
+def generate_layout(width=28, height=31, num_ghosts=2, seed=None, loops=0.1):
+    if width < MIN_WIDTH or height < MIN_HEIGHT:
+        raise ValueError(f"layouts are at least {MIN_WIDTH}x{MIN_HEIGHT}, not {width}x{height}")
+    rng = np.random.default_rng(seed)
+    rows = (height - 1) // 2  # Maze cells, at odd board rows and columns
+    cols = (width - 1) // 2
+    cols -= 1 - cols % 2  # An odd number of columns, so the middle column is one of cells
+    middle = cols // 2
+    house_rows, house_cols = _house_size(num_ghosts)
+    top = (rows - house_rows) // 2
+    if house_cols // 2 >= middle or top < 1 or top + house_rows > rows - 2:
+        raise ValueError(f"{num_ghosts} ghosts do not fit in a {width}x{height} layout")
+
+    east, south = _carve_half(rows, middle + 1, loops, rng)
+    board = np.full((2 * rows + 1, 2 * cols + 1), ord(WALL), dtype=np.uint8)
+    board[1::2, 1::2] = ord(PELLET)
+    board[1::2, 2:-1:2][np.concatenate([east, east[:, ::-1]], axis=1)] = ord(PELLET)
+    board[2:-1:2, 1::2][np.concatenate([south, south[:, -2::-1]], axis=1)] = ord(PELLET)
+
+    # Ghost house: an empty ring of cells around a walled room with a door in the middle of its
+    # top wall. Every passage into the ring's cells stays open and the middle column runs north
+    # from it, so the maze stays connected.
+    r0, r1 = 2 * top + 1, 2 * (top + house_rows) + 1
+    c0, c1 = 2 * (middle - house_cols // 2) + 1, 2 * (middle + house_cols // 2) + 1
+    center = 2 * middle + 1
+    board[r0:r1 + 1, c0:c1 + 1] = ord(EMPTY)
+    board[r0 + 1:r1, c0 + 1:c1] = ord(WALL)
+    board[r0 + 2:r1 - 1, c0 + 2:c1 - 1] = ord(EMPTY)
+    board[r0 + 1, center] = ord(EMPTY)
+
+    # Up to the size asked for: the middle column is repeated (keeping the mirror) and the
+    # walls above the bottom row of cells are doubled
+    extra_cols, extra_rows = width - board.shape[1], height - board.shape[0]
+    repeats = np.ones(board.shape[1], dtype=np.int64)
+    repeats[center] += extra_cols
+    board = np.repeat(board, repeats, axis=1)
+    repeats = np.ones(board.shape[0], dtype=np.int64)
+    repeats[2 * rows - 2] += extra_rows
+    board = np.repeat(board, repeats, axis=0)
+
+    inside = np.argwhere(board[r0 + 2:r1 - 1, c0 + 2:c1 - 1 + extra_cols] == ord(EMPTY))[:num_ghosts]
+    board[inside[:, 0] + r0 + 2, inside[:, 1] + c0 + 2] = ord(GHOST)
+    pacman_row = 2 * (top + house_rows + 1) + 1
+    board[pacman_row + extra_rows * (pacman_row > 2 * rows - 2), center] = ord(PACMAN)
+    return [row.tobytes().decode('ascii') for row in board]
+
+
+# Function to read a layout from a text file, one row per line as in custom_layout. Blank
+# lines at the end are left out.
+def read_layout(path):
+    with open(path) as f:
+        layout = f.read().splitlines()
+    while layout and not layout[-1].strip():
+        layout.pop()
+    if not layout:
+        raise ValueError(f"{path} holds no layout")
+    return layout
+
+
+def write_layout(layout, path):
+    with open(path, 'w') as f:
+        f.write('\n'.join(layout) + '\n')
+
+
+# Content hash of a layout, the name of its compiled file
+def layout_key(layout):
+    text = f"{ARTIFACT_VERSION}\n" + '\n'.join(layout)
+    return hashlib.sha1(text.encode('ascii', 'replace')).hexdigest()
+
+
+# Function to open an uncompressed .npz file with every array memory-mapped (np.load() reads
+# .npz members whole): each member is a .npy file stored as it is, so its data starts right
+# after the zip and .npy headers.
+def _open_npz(path):
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                with np.load(path) as data:
+                    return dict(data)
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack('<HH', f.read(4))
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            name = info.filename[:-len('.npy')]
+            if int(np.prod(shape)) == 0:
+                arrays[name] = np.zeros(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                                         order='F' if fortran_order else 'C')
+    return arrays
+
+
+# A layout parsed and with its per-layout tables worked out, as arrays: codes (the layout's
+# bytes, which hold its walls, pellets and start positions), cell_ids and cells (the cell index
+# map of number_cells()), steps (step_table()), symmetries (the layout's symmetries, as indices
+# in pacman_symmetry.TRANSFORMS) and distances (the DistanceTable matrix, None on layouts of
+# more than MAX_DISTANCE_CELLS cells). Opened from a compiled file, the arrays are
+# memory-mapped, so only the parts used are ever read.
+class CompiledLayout:
+    def __init__(self, arrays, path=None):
+        self.path = path
+        self.codes = arrays['codes']
+        self.cell_ids = arrays['cell_ids']
+        self.cells = arrays['cells']
+        self.steps = arrays['steps']
+        self.symmetries = arrays['symmetries']
+        self.distances = arrays.get('distances')
+
+    # The board and start positions, as parse_layout() returns them
+    def parse(self):
+        return _parse_codes(self.codes)
+
+    # A DistanceTable of board, a board of this layout, from the stored matrix, or None when
+    # the layout is too large to have one
+    def distance_table(self, board=None):
+        if self.distances is None:
+            return None
+        board = board if board is not None else self.parse()[0]
+        return DistanceTable(board, self.distances)
+
+    # A MoveTable of board, a board of this layout, from the stored step table
+    def move_table(self, board=None):
+        board = board if board is not None else self.parse()[0]
+        return MoveTable(board, self.steps)
+
+    # A SymmetryTable of board, a board of this layout, with the stored symmetries
+    def symmetry_table(self, board=None):
+        board = board if board is not None else self.parse()[0]
+        return SymmetryTable(board, transform_symmetries(board.shape, self.symmetries.tolist()))
+
+
+# Function to compile a layout: parse it and work out its tables. With cache_dir, the result is
+# kept there as <layout_key()>.npz (uncompressed, so it can be memory-mapped) and later calls
+# for the same layout open that file instead of working anything out, which takes
+# milliseconds where the distance matrix of a large maze takes seconds. The file is written
+# under another name and renamed, so processes compiling the same layout at once never read a
+# partial one.
+def compile_layout(layout, cache_dir=None):
+    path = os.path.join(cache_dir, layout_key(layout) + '.npz') if cache_dir else None
+    if path is not None and os.path.exists(path):
+        return CompiledLayout(_open_npz(path), path)
+    codes = _layout_codes(layout)
+    board, _, _ = _parse_codes(codes)
+    moves = MoveTable(board)
+    arrays = {
+        'codes': codes,
+        'cell_ids': moves.cell_ids,
+        'cells': np.array(moves.cells, dtype=np.int32).reshape(-1, 2),
+        'steps': step_table(moves),
+        'symmetries': np.array(transform_indices(layout_symmetries(board)), dtype=np.int8),
+    }
+    if len(moves.cells) <= MAX_DISTANCE_CELLS:
+        arrays['distances'] = DistanceTable(board).matrix
+    if path is None:
+        return CompiledLayout(arrays)
+    os.makedirs(cache_dir, exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(temporary, path)
+    return CompiledLayout(_open_npz(path), path)
+
+
+# Function to get the DistanceTable and MoveTable of a game's board: from the layout's compiled
+# file in cache_dir when the game is played on a layout and a cache_dir is given, built from
+# the board otherwise. The DistanceTable is None on boards of more than MAX_DISTANCE_CELLS
+# cells, whose matrix would take minutes to build and too much memory to keep; the searches
+# then fall back to Manhattan distance.
+def layout_tables(board, layout=None, cache_dir=None):
+    if layout is None or cache_dir is None:
+        too_large = int((board != WALL).sum()) > MAX_DISTANCE_CELLS
+        return None if too_large else DistanceTable(board), MoveTable(board)
+    compiled = compile_layout(layout, cache_dir)
+    return compiled.distance_table(board), compiled.move_table(board)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate Pac-Man mazes and time building and parsing them.")
+    parser.add_argument('--width', type=int, nargs='+', default=[28, 100, 1000])
+    parser.add_argument('--height', type=int, nargs='+', default=None, help="default: the widths")
+    parser.add_argument('--num-ghosts', type=int, default=4)
+    parser.add_argument('--loops', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', default=None, help="write the (last) layout to this text file")
+    parser.add_argument('--show', action='store_true', help="print the (last) layout")
+    args = parser.parse_args()
+    heights = args.height or args.width
+    if len(heights) != len(args.width):
+        parser.error("give as many --height values as --width values")
+
+    print(f"{'size':>11} {'generate ms':>12} {'parse ms':>9} {'cells':>9} {'pellets':>9}")
+    for width, height in zip(args.width, heights):
+        start = perf_counter()
+        layout = generate_layout(width, height, args.num_ghosts, args.seed, args.loops)
+        generated = perf_counter()
+        board, _, _ = parse_layout(layout)
+        parsed = perf_counter()
+        print(f"{f'{width}x{height}':>11} {1000 * (generated - start):>12.1f} {1000 * (parsed - generated):>9.1f} "
+              f"{int((board != WALL).sum()):>9} {int((board == PELLET).sum()):>9}")
+    if args.output:
+        write_layout(layout, args.output)
+    if args.show:
+        print('\n'.join(layout))
+
+
+if __name__ == "__main__":
+    main()
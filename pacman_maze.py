@@ -0,0 +1,192 @@
+from collections import deque
+
+import numpy as np
+
+WALL = '#'
+DIRECTIONS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+
+# Stored for pairs of cells with no path between them
+UNREACHABLE = np.iinfo(np.int16).max
+
+
+# Function to number the walkable cells of a board row by row.
+# Returns a (height, width) array holding each cell's id (-1 on walls) and the list of
+# cell positions indexed by id.
+def number_cells(board):
+    walkable = board != WALL
+    ids = np.full(board.shape, -1, dtype=np.int32)
+    ids[walkable] = np.arange(int(walkable.sum()), dtype=np.int32)
+    cells = [(int(i), int(j)) for i, j in np.argwhere(walkable)]
+    return ids, cells
+
+
+# Function to list, for every cell id, the ids of the walkable cells next to it and the
+# index in DIRECTIONS of the step that reaches each one
+def cell_neighbors(board, cell_ids, cells):
+    height, width = board.shape
+    neighbors = [[] for _ in cells]
+    directions = [[] for _ in cells]
+    for i, (row, col) in enumerate(cells):
+        for d, (d_row, d_col) in enumerate(DIRECTIONS):
+            r, c = row + d_row, col + d_col
+            if 0 <= r < height and 0 <= c < width and cell_ids[r, c] >= 0:
+                neighbors[i].append(int(cell_ids[r, c]))
+                directions[i].append(d)
+    return neighbors, directions
+
+
+# Function to read the same lists as cell_neighbors() off a step table (see
+# step_table()), where a step into a wall stays on its cell
+def step_neighbors(steps):
+    steps = np.asarray(steps)
+    open_ = steps != np.arange(len(steps))[:, None]
+    ids = steps[open_].tolist()
+    directions = np.nonzero(open_)[1].tolist()
+    ends = np.cumsum(open_.sum(axis=1)).tolist()
+    starts = [0] + ends[:-1]
+    return ([ids[start:end] for start, end in zip(starts, ends)],
+            [directions[start:end] for start, end in zip(starts, ends)])
+
+
+# Legal moves of every walkable cell, worked out once per layout. moves[pos] is a tuple of
+# (direction, new_pos) pairs in DIRECTIONS order; moves into a wall are left out, so the
+# successors of a position are one dict lookup with no wall checks and no filtering.
+# neighbor_ids and neighbor_directions hold the same table by cell id, as int32 arrays.
+# steps, when given, is the step table of a board with the same walls worked out before (see
+# pacman_layouts.compile_layout()), and the moves are read off it instead of the board.
+class MoveTable:
+    def __init__(self, board, steps=None):
+        self.cell_ids, self.cells = number_cells(board)
+        if steps is None:
+            neighbors, directions = cell_neighbors(board, self.cell_ids, self.cells)
+        else:
+            neighbors, directions = step_neighbors(steps)
+        self.neighbor_ids = [np.array(ids, dtype=np.int32) for ids in neighbors]
+        self.neighbor_directions = [np.array(ds, dtype=np.int32) for ds in directions]
+        self.moves = {
+            pos: tuple((DIRECTIONS[d], self.cells[n]) for n, d in zip(neighbors[i], directions[i]))
+            for i, pos in enumerate(self.cells)
+        }
+
+    # Position reached by moving from pos in direction, pos itself when a wall is in the way
+    def step(self, pos, direction):
+        for move, new_pos in self.moves[pos]:
+            if move == direction:
+                return new_pos
+        return pos
+
+
+# Cell reached from every cell in each of the DIRECTIONS, as a (cells, 4) int32 array by cell
+# id. A move into a wall stays on the cell, as with MoveTable.step().
+def step_table(moves):
+    table = np.repeat(np.arange(len(moves.cells), dtype=np.int32)[:, None], len(DIRECTIONS), axis=1)
+    for cell, (ids, directions) in enumerate(zip(moves.neighbor_ids, moves.neighbor_directions)):
+        table[cell, directions] = ids
+    return table
+
+
+# Shortest path lengths between every pair of walkable cells, found with one BFS per
+# cell and kept in an int16 matrix indexed by cell id, so a maze distance inside the
+# search is one array read instead of a walk around the walls.
+# matrix, when given, is the matrix of a board with the same walls worked out before (see
+# pacman_layouts.compile_layout()) and is used as it is, memory-mapped or not.
+class DistanceTable:
+    def __init__(self, board, matrix=None):
+        self.cell_ids, self.cells = number_cells(board)
+        self.ids = {pos: i for i, pos in enumerate(self.cells)}
+        if matrix is not None:
+            self.matrix = matrix
+            return
+        neighbors, _ = cell_neighbors(board, self.cell_ids, self.cells)
+
+        count = len(self.cells)
+        self.matrix = np.full((count, count), UNREACHABLE, dtype=np.int16)
+        for source in range(count):
+            self.matrix[source] = self._bfs(source, neighbors, count)
+
+    @staticmethod
+    def _bfs(source, neighbors, count):
+        distances = [UNREACHABLE] * count
+        distances[source] = 0
+        queue = deque([source])
+        while queue:
+            cell = queue.popleft()
+            next_distance = distances[cell] + 1
+            for neighbor in neighbors[cell]:
+                if distances[neighbor] == UNREACHABLE:
+                    distances[neighbor] = next_distance
+                    queue.append(neighbor)
+        return distances
+
+    # Maze distance between two walkable positions
+    def distance(self, a, b):
+        return self.matrix.item(self.ids[a], self.ids[b])
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes
+
+
+# Maze distance between two positions when a DistanceTable is given, Manhattan distance otherwise
+def maze_distance(a, b, distances=None):
+    if distances is None:
+        return abs(a[0] - b[0]) + abs(a[1] - b[1])
+    return distances.distance(a, b)
+
+
+# Benchmark: seconds to build a DistanceTable and the bytes its matrix takes, for
+# custom_layout and for a size x size maze from pacman_layouts.generate_layout()
+def distance_benchmark(size=100, seed=0):
+    import time
+    from pacman_layouts import generate_layout, parse_layout
+    from pacman_scripts import load_script
+
+    game = load_script('alphabeta')
+    boards = [('custom_layout', game.create_custom_layout(game.custom_layout)[0]),
+              (f'maze{size}x{size}', parse_layout(generate_layout(size, size, seed=seed))[0])]
+    results = []
+    for name, board in boards:
+        start = time.perf_counter()
+        table = DistanceTable(board)
+        results.append((name, len(table.cells), time.perf_counter() - start, table.nbytes))
+    return results
+
+
+# Benchmark: microseconds per generate_children() call of the AlphaBeta script, finding
+# successors with move_character() against looking them up in a MoveTable, for Pac-Man and
+# ghost nodes at every walkable cell of custom_layout
+def benchmark(repeat=20, num_ghosts=4):
+    import time
+    from pacman_scripts import load_script
+
+    game = load_script('alphabeta')
+    board, _, _ = game.create_custom_layout(game.custom_layout)
+    moves = MoveTable(board)
+    cells = moves.cells
+    nodes = [(pos, [cells[(k + 7 * g) % len(cells)] for g in range(num_ghosts)])
+             for k, pos in enumerate(cells)]
+
+    results = []
+    for is_max in (True, False):
+        timings = []
+        for table in (None, moves):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                for pacman_pos, ghost_pos in nodes:
+                    game.generate_children(board, pacman_pos, ghost_pos, is_max, moves=table)
+            timings.append((time.perf_counter() - start) / (repeat * len(nodes)) * 1e6)
+        same = all(game.generate_children(board, pacman_pos, ghost_pos, is_max)
+                   == game.generate_children(board, pacman_pos, ghost_pos, is_max, moves=moves)
+                   for pacman_pos, ghost_pos in nodes)
+        results.append(('pacman' if is_max else 'ghosts', timings[0], timings[1], same))
+    return results
+
+
+if __name__ == "__main__":
+    print(f"{'layout':>13} {'cells':>6} {'build s':>8} {'matrix KiB':>10}")
+    for name, cells, seconds, nbytes in distance_benchmark():
+        print(f"{name:>13} {cells:>6} {seconds:>8.3f} {nbytes / 1024:>10,.1f}")
+    print()
+    print(f"{'node':>6} {'board us':>9} {'table us':>9} same children")
+    for node, board_time, table_time, same in benchmark():
+        print(f"{node:>6} {board_time:>9.2f} {table_time:>9.2f} {same}")
@@ -0,0 +1,235 @@
+import math
+from time import perf_counter
+
+import numpy as np
+
+from pacman_maze import DIRECTIONS, step_table
+
+# Rewards of a simulated turn: the game's own score for Pac-Man's move, plus a reward for how
+# the game ends, so that being caught costs the pellets Pac-Man will now never eat
+PELLET_REWARD = 10
+MOVE_REWARD = -1
+CAUGHT_REWARD = -500
+WIN_REWARD = 500
+
+# Cost the playout policy adds to a move next to a ghost, well above any pellet distance
+DANGER = 1000
+FAR = np.iinfo(np.int16).max  # Pellet distance of a playout with no pellet left, as in DistanceTable
+
+
+# A position in the tree, with Pac-Man to move. Positions are cell ids. pellets is the bool
+# mask of the pellets left, by cell id, shared with the parent unless the move here ate one.
+# reward is what the turn into this node earned; terminal nodes end the game.
+class Node:
+    __slots__ = ('pacman', 'ghosts', 'pellets', 'reward', 'terminal', 'visits', 'edges')
+
+    def __init__(self, pacman, ghosts, pellets, reward=0.0, terminal=False):
+        self.pacman = pacman
+        self.ghosts = ghosts
+        self.pellets = pellets
+        self.reward = reward
+        self.terminal = terminal
+        self.visits = 0
+        self.edges = None  # Pac-Man's moves, listed the first time the node is selected
+
+
+# One of Pac-Man's moves from a node. The ghosts' reply is sampled, so an edge leads to one
+# child per reply seen, keyed by the ghosts' cells. value is the sum of the returns backed up
+# through the edge, one per visit.
+class Edge:
+    __slots__ = ('direction', 'cell', 'visits', 'value', 'children')
+
+    def __init__(self, direction, cell):
+        self.direction = direction
+        self.cell = cell
+        self.visits = 0
+        self.value = 0.0
+        self.children = {}
+
+
+# Monte Carlo Tree Search for Pac-Man: UCT selection over Pac-Man's moves, with the ghosts'
+# replies sampled from a model of the ghosts. Each iteration walks down the tree, adds one
+# node and scores it with batch playouts run together as NumPy arrays (one row per playout),
+# so a playout step costs the same few array operations however many playouts there are.
+# The ghost model moves each ghost one step closer to Pac-Man with probability ghost_greedy
+# and in a random direction otherwise; ghost_greedy=0 is the random ghosts of the Random
+# scripts. In playouts Pac-Man heads for the nearest pellet away from the ghosts, taking a
+# random move with probability epsilon.
+# A search runs simulations playouts, or as many as fit in budget_ms milliseconds when that is
+# given. The tree is kept between turns: when the game reaches a position already in the tree,
+# its subtree becomes the new root. distances is the layout's DistanceTable, which the playouts
+# read as a matrix, so MCTS is not played on boards too large to have one.
+class MCTS:
+    def __init__(self, moves, distances, simulations=2000, budget_ms=None, batch=32, rollout_depth=40,
+                 exploration=1.4, gamma=0.97, ghost_greedy=0.5, epsilon=0.2, seed=None):
+        if distances is None:
+            raise ValueError("MCTS needs the maze distance matrix, which boards this large do not have")
+        self.cell_ids = moves.cell_ids
+        self.cells = moves.cells
+        self.steps = step_table(moves)
+        self.matrix = distances.matrix
+        self.simulations = simulations
+        self.budget_ms = budget_ms
+        self.batch = batch
+        self.rollout_depth = rollout_depth
+        self.exploration = exploration
+        self.gamma = gamma
+        self.ghost_greedy = ghost_greedy
+        self.epsilon = epsilon
+        self.rng = np.random.default_rng(seed)
+        self.root = None
+        self.low, self.high = float('inf'), float('-inf')  # Range of the mean returns this search, for UCT
+        self.depth = 0  # Deepest ply the last search reached in the tree
+
+    # Pac-Man's best (direction, mean return) from a position. pellets is the game's PelletIndex.
+    def search(self, pacman_pos, ghost_pos, pellets):
+        pacman = int(self.cell_ids[pacman_pos])
+        ghosts = tuple(int(self.cell_ids[pos]) for pos in ghost_pos)
+        mask = np.zeros(len(self.cells), dtype=bool)
+        mask[[self.cell_ids[pos] for pos in pellets.positions]] = True
+
+        root = self._reuse(pacman, ghosts, mask)
+        if root is None:
+            root = Node(pacman, ghosts, mask)
+        self.root = root
+        self.low, self.high = float('inf'), float('-inf')
+        self.depth = 0
+        deadline = perf_counter() + self.budget_ms / 1000 if self.budget_ms is not None else None
+        playouts = 0
+        while True:
+            self._iterate(root)
+            playouts += self.batch
+            if perf_counter() > deadline if deadline is not None else playouts >= self.simulations:
+                break
+        if not root.edges:
+            return None, 0.0
+        best = max(root.edges, key=lambda edge: edge.visits)
+        return best.direction, best.value / best.visits if best.visits else 0.0
+
+    # The node of the tree the game has reached: a grandchild of the last root, through the move
+    # Pac-Man made and the ghosts' reply, if that reply was sampled
+    def _reuse(self, pacman, ghosts, mask):
+        if self.root is None or not self.root.edges:
+            return None
+        for edge in self.root.edges:
+            child = edge.children.get(ghosts)
+            if child is not None and child.pacman == pacman and np.array_equal(child.pellets, mask):
+                return child
+        return None
+
+    # One iteration: select down to a new node, score it with a batch of playouts, back it up
+    def _iterate(self, root):
+        node = root
+        path = []
+        while not node.terminal:
+            if node.edges is None:
+                node.edges = self._expand(node)
+            edge = self._select(node)
+            child = self._child(node, edge)
+            path.append((node, edge, child))
+            node = child
+            if child.visits == 0:
+                break
+        self.depth = max(self.depth, len(path))
+
+        value = 0.0 if node.terminal else self.rollout(node)
+        node.visits += 1
+        for parent, edge, child in reversed(path):
+            value = child.reward + self.gamma * value
+            edge.visits += 1
+            edge.value += value
+            parent.visits += 1
+            mean = edge.value / edge.visits
+            self.low, self.high = min(self.low, mean), max(self.high, mean)
+
+    # Pac-Man's legal moves from a node, moves onto pellets first
+    def _expand(self, node):
+        edges = [Edge(direction, int(cell)) for direction, cell in zip(DIRECTIONS, self.steps[node.pacman])
+                 if cell != node.pacman]
+        edges.sort(key=lambda edge: not node.pellets[edge.cell])
+        return edges
+
+    # Untried moves first, then UCT on mean returns scaled to the range seen so far
+    def _select(self, node):
+        for edge in node.edges:
+            if edge.visits == 0:
+                return edge
+        span = self.high - self.low if self.high > self.low else 1.0
+        log_visits = math.log(node.visits)
+        return max(node.edges, key=lambda edge: (edge.value / edge.visits - self.low) / span
+                   + self.exploration * math.sqrt(log_visits / edge.visits))
+
+    # Samples the ghosts' reply to a move and returns the child it leads to, adding it if new
+    def _child(self, node, edge):
+        ghosts = self._move_ghosts(np.array([node.ghosts]), np.array([edge.cell]))[0]
+        key = tuple(int(cell) for cell in ghosts)
+        child = edge.children.get(key)
+        if child is None:
+            pellets = node.pellets
+            reward = MOVE_REWARD
+            if pellets[edge.cell]:
+                pellets = pellets.copy()
+                pellets[edge.cell] = False
+                reward = PELLET_REWARD
+            terminal = True
+            if edge.cell in key:
+                reward += CAUGHT_REWARD
+            elif not pellets.any():
+                reward += WIN_REWARD
+            else:
+                terminal = False
+            child = Node(edge.cell, key, pellets, reward, terminal)
+            edge.children[key] = child
+        return child
+
+    # One step of the ghost model for a batch: ghosts is (playouts, ghosts), pacman (playouts,)
+    def _move_ghosts(self, ghosts, pacman):
+        options = self.steps[ghosts].reshape(-1, len(DIRECTIONS))  # One row per ghost of every playout
+        choice = self.rng.integers(len(DIRECTIONS), size=len(options))
+        if self.ghost_greedy > 0:
+            targets = np.repeat(pacman, ghosts.shape[1])[:, None]
+            closeness = self.matrix[options, targets] + self.rng.random(options.shape)  # Random ties
+            greedy = self.rng.random(len(options)) < self.ghost_greedy
+            choice = np.where(greedy, closeness.argmin(axis=1), choice)
+        return options[np.arange(len(options)), choice].reshape(ghosts.shape)
+
+    # One step of the playout policy for a batch: the move towards the nearest pellet, or with
+    # probability epsilon a random one, avoiding moves that end next to a ghost. eaten is FAR
+    # on the cells without a pellet and 0 on the others, per playout, so the distance to the
+    # nearest pellet is one maximum() and min() over the distance rows of the moves.
+    def _move_pacman(self, pacman, ghosts, eaten):
+        options = self.steps[pacman]  # (playouts, 4)
+        pellet_distance = np.maximum(self.matrix[options], eaten[:, None, :]).min(axis=2)
+        explore = self.rng.random(len(pacman)) < self.epsilon
+        cost = np.where(explore[:, None], 0, pellet_distance) + self.rng.random(options.shape)
+        ghost_distance = self.matrix[options[:, :, None], ghosts[:, None, :]].min(axis=2)
+        cost += DANGER * (ghost_distance <= 1)
+        cost[options == pacman[:, None]] = np.inf
+        return options[np.arange(len(pacman)), cost.argmin(axis=1)]
+
+    # Mean discounted return of batch playouts from a node, all played together. Playouts that
+    # end early stop adding rewards; the batch stops when every playout has ended.
+    def rollout(self, node):
+        rows = np.arange(self.batch)
+        pacman = np.full(self.batch, node.pacman)
+        ghosts = np.tile(np.array(node.ghosts), (self.batch, 1))
+        eaten = np.tile(np.where(node.pellets, 0, FAR).astype(self.matrix.dtype), (self.batch, 1))
+        left = np.full(self.batch, np.count_nonzero(node.pellets))
+        returns = np.zeros(self.batch)
+        alive = np.ones(self.batch, dtype=bool)
+        discount = 1.0
+        for _ in range(self.rollout_depth):
+            pacman = self._move_pacman(pacman, ghosts, eaten)
+            eats = eaten[rows, pacman] == 0
+            eaten[rows, pacman] = FAR
+            left -= eats
+            ghosts = self._move_ghosts(ghosts, pacman)
+            caught = (ghosts == pacman[:, None]).any(axis=1)
+            won = ~caught & (left == 0)
+            reward = np.where(eats, PELLET_REWARD, MOVE_REWARD) + CAUGHT_REWARD * caught + WIN_REWARD * won
+            returns += discount * reward * alive
+            alive &= ~(caught | won)
+            if not alive.any():
+                break
+            discount *= self.gamma
+        return float(returns.mean())
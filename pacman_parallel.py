@@ -0,0 +1,386 @@
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+
+from pacman_maze import DIRECTIONS, DistanceTable, MoveTable, maze_distance
+from pacman_pellets import PelletIndex
+from pacman_scripts import load_script
+from pacman_transposition import TranspositionTable
+
+EMPTY = ' '
+
+# Engines that can be split at the root, by their SCRIPTS name. The Random scripts' ghosts do not
+# search, so only Pac-Man's searches are split there.
+ENGINES = ('alphabeta', 'minimax', 'alphabeta-random', 'minimax-random')
+
+# State of a worker process, set up once by _init_worker()
+_worker = {}
+
+
+# Worker process setup, run once per worker. The layout and its tables arrive here once (where
+# processes fork they are inherited, not pickled) and stay for every task; tasks only carry
+# positions and the pellets eaten so far. bounds is the shared best-bound array: bounds[0] is
+# the best score Pac-Man has found at the root, bounds[1 + i] the best found for ghost i
+# (None for Ponderer's worker, which does not split searches).
+# tables holds one transposition table per set of evaluate() weights the tasks search with
+# (None for the defaults), so scores from different weights never mix.
+def _init_worker(engine, board, num_ghosts, distances, moves, bounds):
+    _worker.update(
+        engine=engine,
+        game=load_script(engine),
+        board=board.copy(),
+        pellets=PelletIndex(board),
+        distances=distances,
+        moves=moves,
+        num_ghosts=num_ghosts,
+        tables={None: TranspositionTable(board.shape, num_ghosts)},
+        eaten=set(),
+        generation=None,
+        bounds=bounds,
+    )
+
+
+# Function to bring the worker's board, pellets and hash keys up to the pellets the game has
+# eaten. Pellets never come back in a game, so this only ever eats.
+def _sync(eaten, generation):
+    tables = _worker['tables'].values()
+    for pos in eaten - _worker['eaten']:
+        _worker['board'][pos] = EMPTY
+        _worker['pellets'].eat(pos)
+        for tt in tables:
+            tt.zobrist.eat_pellet(pos)
+    _worker['eaten'] = eaten
+    if generation != _worker['generation']:
+        for tt in tables:
+            tt.new_search()
+        _worker['generation'] = generation
+
+
+# The worker's transposition table for searches with these evaluate() weights, started on the
+# pellets eaten so far when they are new
+def _table(weights):
+    tables = _worker['tables']
+    if weights not in tables:
+        tt = TranspositionTable(_worker['board'].shape, _worker['num_ghosts'])
+        for pos in _worker['eaten']:
+            tt.zobrist.eat_pellet(pos)
+        tables[weights] = tt
+    return tables[weights]
+
+
+# Searches one child of the root in a worker and returns (ghost_index, move, score, bound).
+# Pac-Man's children (ghost_index None) start from the best score any worker has found for
+# Pac-Man so far as alpha, a ghost's children from the best found for that ghost as beta, and
+# each result tightens the shared bound for the children still to come. bound is the alpha
+# (Pac-Man) or beta (ghost) the child was searched with: a score at or past it only bounds the
+# child's value (see _exact()). With full_window the child is searched without the shared bound.
+def _search_child(task):
+    (is_max, pacman_pos, ghost_pos, ghost_index, move, new_pos, max_depth, eaten, weights, full_window,
+     generation) = task
+    _sync(eaten, generation)
+    game, board, pellets, tt = _worker['game'], _worker['board'], _worker['pellets'], _table(weights)
+    bounds = _worker['bounds']
+    key = tt.zobrist.hash(pacman_pos, ghost_pos, is_max)
+
+    if is_max:
+        new_pacman_pos, new_ghost_pos = new_pos, ghost_pos
+        key = tt.zobrist.pacman_move(key, pacman_pos, new_pos)
+        eats = new_pos in pellets
+        if eats:
+            key = tt.zobrist.toggle_pellet(key, new_pos)
+            pellets.eat(new_pos)
+        alpha, beta = float('-inf') if full_window else bounds[0], float('inf')
+    else:
+        new_pacman_pos, new_ghost_pos = pacman_pos, list(ghost_pos)
+        new_ghost_pos[ghost_index] = new_pos
+        key = tt.zobrist.ghost_move(key, ghost_pos, ghost_pos[ghost_index], new_pos)
+        eats = False
+        alpha, beta = float('-inf'), float('inf') if full_window else bounds[1 + ghost_index]
+
+    # By keyword: the Minimax scripts take max_depth and is_max in different orders
+    if _worker['engine'].startswith('alphabeta'):
+        _, score = game.alphabeta(board, new_pacman_pos, new_ghost_pos, 1, not is_max, max_depth, alpha, beta,
+                                  tt=tt, key=key, pellets=pellets, distances=_worker['distances'],
+                                  moves=_worker['moves'], weights=weights)
+    else:
+        _, score = game.minimax(board, new_pacman_pos, new_ghost_pos, 1, is_max=not is_max, max_depth=max_depth,
+                                tt=tt, key=key, pellets=pellets, distances=_worker['distances'],
+                                moves=_worker['moves'], weights=weights)
+        alpha, beta = float('-inf'), float('inf')  # minimax() takes no window: its scores are exact
+    if eats:
+        pellets.restore(new_pos)
+
+    with bounds.get_lock():
+        slot = 0 if is_max else 1 + ghost_index
+        if (score > bounds[slot]) if is_max else (score < bounds[slot]):
+            bounds[slot] = score
+    return ghost_index, move, score, alpha if is_max else beta
+
+
+# Whether a _search_child() result is the child's exact score. A Pac-Man child that fails low
+# (score <= alpha) only tells that its value is at most score, a ghost's child that fails high
+# (score >= beta) that it is at least score.
+def _exact(is_max, score, bound):
+    return score > bound if is_max else score < bound
+
+
+
+# Searches Pac-Man's move from one position in Ponderer's worker, as the game would, and
+# returns (move, score, pv). With pvs the alphabeta engines search with principal variation
+# search from the game's predicted line pv, and pv is the line this search predicts, read from
+# the worker's table as the game reads it from its own; it is None otherwise.
+def _search_root(task):
+    pacman_pos, ghost_pos, max_depth, eaten, weights, pvs, batch_leaves, pv, generation = task
+    _sync(eaten, generation)
+    game, board, pellets, tt = _worker['game'], _worker['board'], _worker['pellets'], _table(weights)
+    options = dict(tt=tt, pellets=pellets, distances=_worker['distances'], moves=_worker['moves'], weights=weights)
+    if not _worker['engine'].startswith('alphabeta'):
+        move, score = game.minimax(board, pacman_pos, ghost_pos, 0, is_max=True, max_depth=max_depth, **options)
+        return move, score, None
+    move, score = game.alphabeta(board, pacman_pos, ghost_pos, 0, True, max_depth, pvs=pvs, pv=pv,
+                                 batch_leaves=batch_leaves, **options)
+    if not pvs:
+        return move, score, None
+    return move, score, game.principal_variation(tt, tt.zobrist.hash(pacman_pos, ghost_pos, True), max_depth)[1:]
+
+# Root-splitting search over a process pool. Each child of the root (Pac-Man's moves, or every
+# move of every ghost) is one task; the workers share a best-bound per side so later children
+# are searched with a narrower window. Searches shallower than min_depth are not worth the
+# round trip and run serially in this process, with the caller's tables.
+# The split searches run in the workers with their own transposition tables, so tt and stats
+# are only used by the serial ones. The pool lives as long as the object; close it (or use it
+# in a with block) when the game is over. distances and moves are the layout's tables, handed
+# to the workers once; without distances the searches use Manhattan distances.
+class ParallelSearch:
+    def __init__(self, board, num_ghosts, engine='alphabeta', workers=None, min_depth=5, distances=None,
+                 moves=None):
+        self.engine = engine
+        self.game = load_script(engine)
+        self.min_depth = min_depth
+        self.initial_pellets = set(PelletIndex(board).slots)
+        self.distances = distances
+        self.moves = moves if moves is not None else MoveTable(board)
+        self.bounds = multiprocessing.Array('d', 1 + num_ghosts)
+        self.generation = 0
+        self.pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker,
+                                        initargs=(engine, board, num_ghosts, self.distances, self.moves, self.bounds))
+
+    def close(self):
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Searches the children in tasks and returns their (ghost_index, move, score) in task order,
+    # every score exact. Workers finish out of order, so a child can be searched with a bound set
+    # by a better child and fail past it. Such a child is dropped when its bound is already beaten
+    # by an exact score of its side; otherwise it could tie the best and is searched again with
+    # the full window.
+    def _run(self, tasks):
+        self.generation += 1
+        with self.bounds.get_lock():
+            self.bounds[0] = float('-inf')
+            for i in range(1, len(self.bounds)):
+                self.bounds[i] = float('inf')
+        results = list(self.pool.map(_search_child, [task + (False, self.generation) for task in tasks]))
+        best = {}  # The best exact score of each side, by ghost_index
+        for (is_max, *_), (ghost_index, _, score, bound) in zip(tasks, results):
+            if _exact(is_max, score, bound) and (ghost_index not in best or _exact(is_max, score, best[ghost_index])):
+                best[ghost_index] = score
+        exact, retry = [], []
+        for task, (ghost_index, move, score, bound) in zip(tasks, results):
+            is_max = task[0]
+            if _exact(is_max, score, bound):
+                exact.append((ghost_index, move, score))
+            elif ghost_index in best and _exact(not is_max, score, best[ghost_index]):
+                exact.append(None)  # Its value is worse than a child searched exactly
+            else:
+                exact.append(None)
+                retry.append((len(exact) - 1, task + (True, self.generation)))
+        for (i, _), (ghost_index, move, score, _) in zip(retry, self.pool.map(_search_child,
+                                                                               [task for _, task in retry])):
+            exact[i] = (ghost_index, move, score)
+        return [result for result in exact if result is not None]
+
+    # Pac-Man's best (move, score) at depth, searched like alphabeta()/minimax() from the root,
+    # with these evaluate() weights (the script's WEIGHTS when None)
+    def search_pacman(self, board, pacman_pos, ghost_pos, depth, pellets, tt=None, stats=None, weights=None):
+        if depth < self.min_depth:
+            if self.engine.startswith('alphabeta'):
+                return self.game.alphabeta(board, pacman_pos, ghost_pos, 0, True, depth, tt=tt, pellets=pellets,
+                                           distances=self.distances, moves=self.moves, stats=stats, weights=weights)
+            return self.game.minimax(board, pacman_pos, ghost_pos, 0, is_max=True, max_depth=depth, tt=tt,
+                                     pellets=pellets, distances=self.distances, moves=self.moves, stats=stats,
+                                     weights=weights)
+        eaten = frozenset(self.initial_pellets - pellets.slots.keys())
+        children = [(move, new_pos, ghost_pos, None) for move, new_pos in self.game.legal_moves(pacman_pos, board,
+                                                                                                  self.moves)]
+        if self.engine.startswith('alphabeta'):
+            children = self.game.order_pellet_first(board, children, True, pellets)  # Likely best first
+        weights = tuple(weights) if weights is not None else None
+        results = self._run([(True, pacman_pos, list(ghost_pos), None, move, new_pos, depth, eaten, weights)
+                             for move, new_pos, _, _ in children])
+        best_move, best_score = None, float('-inf')
+        for _, move, score in results:
+            if score > best_score:
+                best_move, best_score = move, score
+        return best_move, best_score
+
+    # Every ghost's best move at depth, like alphabeta_ghost_moves()/minimax_ghost_moves(); only
+    # for the engines whose ghosts search
+    def search_ghosts(self, board, pacman_pos, ghost_pos, depth, pellets, tt=None, stats=None):
+        if depth < self.min_depth:
+            if self.engine == 'alphabeta':
+                return self.game.alphabeta_ghost_moves(board, pacman_pos, ghost_pos, depth, tt=tt, pellets=pellets,
+                                                       distances=self.distances, moves=self.moves, stats=stats)
+            return self.game.minimax_ghost_moves(board, pacman_pos, ghost_pos, depth, tt=tt, pellets=pellets,
+                                                 distances=self.distances, moves=self.moves, stats=stats)
+        eaten = frozenset(self.initial_pellets - pellets.slots.keys())
+        tasks = []
+        for i, pos in enumerate(ghost_pos):
+            children = []
+            for move, new_pos in self.game.legal_moves(pos, board, self.moves):
+                new_ghost_pos = list(ghost_pos)
+                new_ghost_pos[i] = new_pos
+                children.append((move, pacman_pos, new_ghost_pos, None))
+            if self.engine == 'alphabeta':
+                children = self.game.order_pellet_first(board, children, False, pellets)
+            tasks.extend((False, pacman_pos, list(ghost_pos), i, move, new_ghost_pos[i], depth, eaten, None)
+                         for move, _, new_ghost_pos, _ in children)
+        ghost_moves = [None] * len(ghost_pos)
+        ghost_scores = [float('inf')] * len(ghost_pos)
+        for i, move, score in self._run(tasks):
+            if score < ghost_scores[i]:
+                ghost_moves[i], ghost_scores[i] = move, score
+        return ghost_moves, ghost_scores
+
+
+
+# Function to list the ghosts' likely replies to Pac-Man's move, most likely first, as lists
+# of ghost cells. Random ghosts ('random') step in each direction with probability 1/4 and stay
+# put when it is a wall, so replies are ranked by probability. Searching ghosts ('search') are
+# taken to close in on Pac-Man: replies are ranked by the ghosts' summed maze distance to Pac-Man
+# after them. Returns at most limit replies.
+def likely_replies(pacman_pos, ghost_pos, moves, distances=None, ghosts='search', limit=None):
+    if ghosts == 'random':
+        outcomes = []
+        for pos in ghost_pos:
+            chances = {}
+            for direction in DIRECTIONS:
+                new_pos = moves.step(pos, direction)
+                chances[new_pos] = chances.get(new_pos, 0) + 1 / len(DIRECTIONS)
+            outcomes.append(list(chances.items()))
+        replies = []
+        for combination in product(*outcomes):
+            probability = 1.0
+            for _, p in combination:
+                probability *= p
+            replies.append((-probability, [pos for pos, _ in combination]))
+    else:
+        outcomes = [[new_pos for _, new_pos in moves.moves[pos]] or [pos] for pos in ghost_pos]
+        replies = [(sum(maze_distance(pos, pacman_pos, distances) for pos in combination), list(combination))
+                   for combination in product(*outcomes)]
+    replies.sort(key=lambda reply: reply[0])
+    return [reply for _, reply in replies[:limit]]
+
+
+# Pondering: while the ghosts search and the board is drawn, a worker process searches Pac-Man's
+# next move from the positions the ghosts' reply is most likely to lead to.
+# start() is called right after Pac-Man commits a move and queues the searches of up to
+# positions likely replies, most likely first, each to depth as the game's own search would.
+# pvs, pv and batch_leaves are the game's options for that search (see _search_root()).
+# lookup() takes the position the ghosts really left and returns the pondered (move, score, pv),
+# waiting for its search when that is already under way, or None when the position was not
+# pondered (or not reached yet), and the caller searches as usual. The searches not needed are
+# cancelled. engine is the game's SCRIPTS name; ghosts is 'search' or 'random', as in
+# likely_replies(). Close the worker (or use a with block) when the game is over. distances and
+# moves are as in ParallelSearch.
+class Ponderer:
+    def __init__(self, board, num_ghosts, engine, ghosts='search', positions=8, distances=None, moves=None):
+        self.ghosts = ghosts
+        self.positions = positions
+        self.initial_pellets = set(PelletIndex(board).slots)
+        self.distances = distances
+        self.moves = moves if moves is not None else MoveTable(board)
+        self.generation = 0
+        self.futures = {}
+        self.hits = 0
+        self.misses = 0
+        # The worker starts at the first start(), after the game has eaten from board: give it the
+        # board as it is now, which initial_pellets describes
+        self.pool = ProcessPoolExecutor(max_workers=1, initializer=_init_worker,
+                                        initargs=(engine, board.copy(), num_ghosts, self.distances, self.moves,
+                                                  None))
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self, pacman_pos, ghost_pos, depth, pellets, weights=None, pvs=False, pv=None, batch_leaves=False):
+        self._cancel()
+        self.generation += 1
+        eaten = frozenset(self.initial_pellets - pellets.slots.keys())
+        weights = tuple(weights) if weights is not None else None
+        for reply in likely_replies(pacman_pos, ghost_pos, self.moves, self.distances, self.ghosts, self.positions):
+            if pacman_pos in reply:
+                continue  # Caught: the game ends there
+            task = (pacman_pos, reply, depth, eaten, weights, pvs, batch_leaves, pv, self.generation)
+            self.futures[(pacman_pos, tuple(reply))] = self.pool.submit(_search_root, task)
+
+    def lookup(self, pacman_pos, ghost_pos):
+        future = self.futures.pop((pacman_pos, tuple(ghost_pos)), None)
+        self._cancel()
+        if future is None or not future.running() and not future.done() and future.cancel():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return future.result()
+
+    def _cancel(self):
+        for future in self.futures.values():
+            future.cancel()
+        self.futures = {}
+
+# Benchmark: serial root search against ParallelSearch on an open 20x11 board, checking both
+# give the same move and score. Speedup needs as many free cores as workers.
+def benchmark(depths=(6, 7, 8), num_ghosts=4, workers=None, engine='alphabeta', seed=0):
+    game = load_script(engine)
+    rng = random.Random(seed)
+    board = game.create_board(20, 11)
+    pacman_pos = (5, 10)
+    ghost_pos = [(rng.randint(1, 9), rng.randint(1, 18)) for _ in range(num_ghosts)]
+    pellets = PelletIndex(board)
+    distances = DistanceTable(board)
+    results = []
+    with ParallelSearch(board, num_ghosts, engine, workers, min_depth=1, distances=distances) as parallel:
+        parallel.search_pacman(board, pacman_pos, ghost_pos, 1, pellets)  # Start the workers
+        for depth in depths:
+            parallel.min_depth = depth + 1  # Serial
+            start = time.perf_counter()
+            serial = parallel.search_pacman(board, pacman_pos, ghost_pos, depth, pellets,
+                                            TranspositionTable(board.shape, num_ghosts))
+            serial_time = time.perf_counter() - start
+            parallel.min_depth = depth
+            start = time.perf_counter()
+            split = parallel.search_pacman(board, pacman_pos, ghost_pos, depth, pellets)
+            parallel_time = time.perf_counter() - start
+            results.append((depth, serial_time, parallel_time, serial == split))
+    return results
+
+
+if __name__ == "__main__":
+    print(f"{os.cpu_count()} cores")
+    print(f"{'depth':>5} {'serial s':>9} {'parallel s':>10} {'speedup':>7} same result")
+    for depth, serial_time, parallel_time, same in benchmark():
+        print(f"{depth:>5} {serial_time:>9.3f} {parallel_time:>10.3f} {serial_time / parallel_time:>7.2f} {same}")
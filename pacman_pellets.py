@@ -0,0 +1,86 @@
+import numpy as np
+
+PELLET = '.'
+
+
+# Index of the pellets left on the board, kept next to the board instead of scanning it.
+# It holds the pellet count, the pellet positions (as a set for membership and a list for
+# iteration) and a grid of square buckets used to find the nearest pellet by looking at
+# nearby buckets only. Eating and restoring a pellet are O(1), so the search can eat
+# pellets on the way down and put them back on the way up.
+class PelletIndex:
+    def __init__(self, board, bucket_size=4):
+        height, width = board.shape
+        self.bucket_size = bucket_size
+        self.bucket_rows = (height + bucket_size - 1) // bucket_size
+        self.bucket_cols = (width + bucket_size - 1) // bucket_size
+        self.buckets = [[set() for _ in range(self.bucket_cols)] for _ in range(self.bucket_rows)]
+        self.positions = []  # Pellet positions in no particular order
+        self.slots = {}  # Position -> index in self.positions
+        for i, j in np.argwhere(board == PELLET):
+            self.restore((int(i), int(j)))
+
+    @property
+    def count(self):
+        return len(self.positions)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, pos):
+        return pos in self.slots
+
+    def eat(self, pos):
+        # Swap the last position into the freed slot to keep the list dense
+        index = self.slots.pop(pos)
+        last = self.positions.pop()
+        if last != pos:
+            self.positions[index] = last
+            self.slots[last] = index
+        self.buckets[pos[0] // self.bucket_size][pos[1] // self.bucket_size].discard(pos)
+
+    def restore(self, pos):
+        self.slots[pos] = len(self.positions)
+        self.positions.append(pos)
+        self.buckets[pos[0] // self.bucket_size][pos[1] // self.bucket_size].add(pos)
+
+    # Distance from pos to the nearest pellet, or None when no pellet is left. Distances are
+    # Manhattan, or maze distances read from a DistanceTable when one is given.
+    # Buckets are visited in rings around the bucket of pos; every pellet in ring r is at
+    # least (r - 1) * bucket_size + 1 steps away, so the search stops once that bound cannot
+    # beat the best distance found.
+    def nearest_distance(self, pos, distances=None):
+        if not self.positions:
+            return None
+        size = self.bucket_size
+        row, col = pos[0] // size, pos[1] // size
+        best = None
+        max_ring = max(row, col, self.bucket_rows - 1 - row, self.bucket_cols - 1 - col)
+        for ring in range(max_ring + 1):
+            if best is not None and ring > 0 and best <= (ring - 1) * size + 1:
+                break
+            for bucket in self._ring(row, col, ring):
+                for pellet in bucket:
+                    if distances is None:
+                        distance = abs(pos[0] - pellet[0]) + abs(pos[1] - pellet[1])
+                    else:
+                        distance = distances.distance(pos, pellet)
+                    if best is None or distance < best:
+                        best = distance
+        return best
+
+    # Buckets at Chebyshev distance ring from bucket (row, col)
+    def _ring(self, row, col, ring):
+        if ring == 0:
+            yield self.buckets[row][col]
+            return
+        top, bottom = row - ring, row + ring
+        left, right = max(col - ring, 0), min(col + ring, self.bucket_cols - 1)
+        for r in (top, bottom):
+            if 0 <= r < self.bucket_rows:
+                for c in range(left, right + 1):
+                    yield self.buckets[r][c]
+        for c in (col - ring, col + ring):
+            if 0 <= c < self.bucket_cols:
+                for r in range(max(top + 1, 0), min(bottom - 1, self.bucket_rows - 1) + 1):
+                    yield self.buckets[r][c]
@@ -0,0 +1,104 @@
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+PACMAN = 'P'
+GHOST = 'G'
+
+CLEAR = '\x1b[2J\x1b[H'
+CLEAR_LINE = '\x1b[K'
+HIDE_CURSOR = '\x1b[?25l'
+SHOW_CURSOR = '\x1b[?25h'
+
+
+# ANSI escape moving the cursor to a 0-based screen row and column
+def cursor(row, col):
+    return f'\x1b[{row + 1};{col + 1}H'
+
+
+# Terminal renderer that keeps the last frame on screen and only rewrites what changed.
+# The first frame clears the screen and draws the whole board; after that each frame sends
+# the cells whose character changed, positioned with ANSI escapes, plus the status lines
+# below the board. Every frame goes out in one write. wait() paces the game to fps frames
+# per second, counting the time spent since the last frame; fps=None does not wait at all.
+class TerminalRenderer:
+    def __init__(self, fps=1.0, stream=None):
+        self.fps = fps
+        self.stream = stream if stream is not None else sys.stdout
+        self.last_frame = None
+        self.last_status = []
+        self.last_time = None
+        if platform.system() == 'Windows':
+            os.system('')  # Turns on ANSI escape handling in the Windows console
+
+    def draw(self, board, pacman_pos, ghost_pos, status=()):
+        frame = board.copy()
+        frame[pacman_pos] = PACMAN
+        for pos in ghost_pos:
+            frame[pos] = GHOST
+
+        parts = []
+        if self.last_frame is None or self.last_frame.shape != frame.shape:
+            parts.append(HIDE_CURSOR + CLEAR)
+            parts.append('\n'.join(' '.join(row) for row in frame))
+            self.last_status = []
+        else:
+            for row, col in np.argwhere(frame != self.last_frame):
+                parts.append(cursor(row, 2 * col) + frame[row, col])
+        status = list(status)
+        for i, line in enumerate(status):
+            if i >= len(self.last_status) or self.last_status[i] != line:
+                parts.append(cursor(frame.shape[0] + i, 0) + line + CLEAR_LINE)
+        for i in range(len(status), len(self.last_status)):
+            parts.append(cursor(frame.shape[0] + i, 0) + CLEAR_LINE)
+
+        self.stream.write(''.join(parts))
+        self.stream.flush()
+        self.last_frame = frame
+        self.last_status = status
+        self.last_time = time.perf_counter()
+
+    # Prints text under the board and status lines
+    def message(self, text):
+        self.stream.write(cursor(self._bottom(), 0) + text + CLEAR_LINE)
+        self.stream.flush()
+        self.last_status.append(text)
+
+    # Leaves the cursor under everything drawn, so the shell prompt does not overwrite it
+    def close(self):
+        self.stream.write(cursor(self._bottom(), 0) + SHOW_CURSOR)
+        self.stream.flush()
+
+    def _bottom(self):
+        return len(self.last_status) if self.last_frame is None else self.last_frame.shape[0] + len(self.last_status)
+
+    def wait(self):
+        if not self.fps or self.last_time is None:
+            return
+        remaining = 1 / self.fps - (time.perf_counter() - self.last_time)
+        if remaining > 0:
+            time.sleep(remaining)
+
+
+# Renderer for headless runs: same interface, draws nothing and never waits
+class NullRenderer:
+    def draw(self, board, pacman_pos, ghost_pos, status=()):
+        pass
+
+    def message(self, text):
+        pass
+
+    def close(self):
+        pass
+
+    def wait(self):
+        pass
+
+
+# Function to pick the renderer of a game: the terminal at fps frames per second when
+# render is set, the null renderer otherwise
+def make_renderer(render=True, fps=1.0):
+    return TerminalRenderer(fps) if render else NullRenderer()
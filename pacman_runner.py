@@ -0,0 +1,288 @@
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from pacman_layouts import (MAX_DISTANCE_CELLS, MIN_HEIGHT, MIN_WIDTH, WALL, compile_layout, generate_layout,
+                             parse_layout, read_layout)
+from pacman_scripts import load_script
+from pacman_stats import write_stats
+from pacman_trace import create_trace
+
+# Game script and play function for each (agent, ghost policy) pair
+GAMES = {
+    ('alphabeta', 'search'): ('alphabeta', 'play_game_with_alphabeta'),
+    ('alphabeta', 'random'): ('alphabeta-random', 'play_game_with_alphabeta'),
+    ('minimax', 'search'): ('minimax', 'play_game_with_minimax'),
+    ('minimax', 'random'): ('minimax-random', 'play_game_with_minimax'),
+    ('expectimax', 'random'): ('minimax-random', 'play_game_with_minimax'),
+    ('mcts', 'search'): ('alphabeta', 'play_game_with_alphabeta'),
+    ('mcts', 'random'): ('alphabeta-random', 'play_game_with_alphabeta'),
+    ('table', 'search'): ('minimax', 'play_game_with_minimax'),
+    ('table', 'random'): ('minimax-random', 'play_game_with_minimax'),
+}
+
+RESULT_FIELDS = ['game', 'agent', 'ghosts', 'layout', 'layout_file', 'maze_seed', 'width', 'height', 'num_ghosts',
+                 'depth', 'seed', 'max_turns', 'budget_ms', 'samples', 'simulations', 'policy', 'weights', 'pvs',
+                 'aspiration', 'ponder', 'batch_leaves', 'score', 'turns', 'win', 'caught', 'pellets_left',
+                 'search_time', 'mean_depth', 'wall_time', 'ponder_hits']
+
+
+# Function to describe n games as dicts; game i is played with seed + i
+def make_games(n, agent='alphabeta', ghosts='search', layout='custom', width=20, height=10, num_ghosts=2,
+               depth=3, seed=0, max_turns=500, budget_ms=None, samples=None, instrument=False, simulations=None,
+               trace=None, policy=None, weights=None, pvs=False, aspiration=None, ponder=None, maze_seed=0,
+               layout_file=None, cache_dir=None, batch_leaves=False):
+    return [{
+        'game': i,
+        'agent': agent,
+        'ghosts': ghosts,
+        'layout': layout,
+        'maze_seed': maze_seed,
+        'layout_file': layout_file,
+        'width': width,
+        'height': height,
+        'num_ghosts': num_ghosts,
+        'depth': depth,
+        'seed': seed + i,
+        'max_turns': max_turns,
+        'budget_ms': budget_ms,
+        'samples': samples,
+        'simulations': simulations,
+        'instrument': instrument,
+        'trace': trace,
+        'policy': policy,
+        'weights': weights,
+        'pvs': pvs,
+        'aspiration': aspiration,
+        'ponder': ponder,
+        'cache_dir': cache_dir,
+        'batch_leaves': batch_leaves,
+    } for i in range(n)]
+
+
+# The layout a game is played on: the script's custom_layout, a maze generated for width,
+# height and num_ghosts from maze_seed (the same maze for every game of a run), the layout in
+# layout_file, or None for an open board
+def game_layout(module, game):
+    if game['layout'] == 'custom':
+        return module.custom_layout
+    if game['layout'] == 'file':
+        return read_layout(game['layout_file'])
+    if game['layout'] == 'maze':
+        return generate_layout(game['width'], game['height'], game['num_ghosts'], game.get('maze_seed', 0))
+    return None
+
+
+# Function to create the trace file the games append to, with the board they all start from
+def start_trace(path, games):
+    game = games[0]
+    module = load_script(GAMES[(game['agent'], game['ghosts'])][0])
+    layout = game_layout(module, game)
+    if layout is not None:
+        board, _, ghost_pos = module.create_custom_layout(layout)
+        num_ghosts = len(ghost_pos)
+    else:
+        board = module.create_board(game['width'], game['height'])
+        num_ghosts = game['num_ghosts']
+    create_trace(path, board, num_ghosts)
+
+
+# Function to play one game headless through the script's own play_game_with_* function.
+# Runs inside the worker processes, so it only takes and returns plain dicts.
+def play_one(game):
+    script, function = GAMES[(game['agent'], game['ghosts'])]
+    module = load_script(script)
+    layout = game_layout(module, game)
+    options = {}
+    if game.get('budget_ms') is not None:
+        options['budget_ms'] = game['budget_ms']  # Only the AlphaBeta scripts take a time budget
+    if game.get('instrument'):
+        options['instrument'] = True  # The result gets the stats of every search as 'stats'
+    if game.get('trace'):
+        options['trace'] = game['trace']
+        options['trace_game'] = game['game']
+    if game['agent'] == 'expectimax':
+        options['search'] = 'expectimax'
+        options['samples'] = game.get('samples')
+    if game['agent'] == 'mcts':
+        options['search'] = 'mcts'
+        options['simulations'] = game.get('simulations')
+    if game['agent'] == 'table':
+        options['search'] = 'table'
+        options['policy'] = game.get('policy')
+    if game.get('pvs'):
+        options['pvs'] = True  # Only the AlphaBeta scripts search with PVS and aspiration windows
+    if game.get('batch_leaves'):
+        options['batch_leaves'] = True  # Only the AlphaBeta scripts score leaves with evaluate_batch()
+    if game.get('aspiration') is not None:
+        options['aspiration'] = game['aspiration']
+    if game.get('ponder'):
+        options['ponder'] = game['ponder']  # Searched in one more process per game
+    if game.get('cache_dir'):
+        options['cache_dir'] = game['cache_dir']  # Compiled layout tables, see pacman_layouts
+    if game.get('weights') is not None:
+        options['weights'] = tuple(game['weights'])  # Pac-Man's evaluate() weights
+    start = time.perf_counter()
+    result = getattr(module, function)(game['width'], game['height'], game['num_ghosts'], layout=layout,
+                                       max_depth=game['depth'], render=False, seed=game['seed'],
+                                       max_turns=game['max_turns'], **options)
+    result = dict(game, **result, wall_time=time.perf_counter() - start)
+    depths = result.pop('depths', None)
+    if depths:
+        result['mean_depth'] = sum(depths) / len(depths)
+    return result
+
+
+# Function to play every game, spread over a process pool (all cores by default)
+def run_games(games, workers=None):
+    workers = workers or os.cpu_count()
+    if workers == 1:
+        return [play_one(game) for game in games]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(play_one, games))
+
+
+# Function to save results as JSON or CSV, picked by the file extension
+def write_results(results, path):
+    with open(path, 'w', newline='') as f:
+        if path.endswith('.json'):
+            json.dump(results, f, indent=2)
+        else:
+            writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(results)
+
+
+# argparse type for --weights: 'pellets,proximity,ghost,each_ghost,radius'
+def parse_weights(text):
+    weights = [float(value) for value in text.split(',')]
+    if len(weights) != 5:
+        raise argparse.ArgumentTypeError("expected five comma-separated numbers")
+    return weights
+
+
+def summarize(results):
+    games = len(results)
+    wins = sum(result['win'] for result in results)
+    turns = sum(result['turns'] for result in results)
+    search_time = sum(result['search_time'] for result in results)
+    return {
+        'games': games,
+        'wins': wins,
+        'win_rate': wins / games if games else 0.0,
+        'mean_score': sum(result['score'] for result in results) / games if games else 0.0,
+        'mean_turns': turns / games if games else 0.0,
+        'search_time': search_time,
+        'ms_per_move': 1000 * search_time / turns if turns else 0.0,  # Pac-Man's and the ghosts' searches
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play many headless Pac-Man games and save the results.")
+    parser.add_argument('-n', '--games', type=int, default=100)
+    parser.add_argument('--agent', choices=['alphabeta', 'minimax', 'expectimax', 'mcts', 'table'],
+                        default='alphabeta',
+                        help="expectimax plays the Minimax - Random game and needs --ghosts random; "
+                             "mcts plays the AlphaBeta games; table plays the Minimax games from --policy")
+    parser.add_argument('--ghosts', choices=['search', 'random'], default='search',
+                        help="ghosts search like Pac-Man or move at random")
+    parser.add_argument('--layout', choices=['custom', 'open', 'maze'], default='custom',
+                        help="the scripts' custom_layout, an open board of --width x --height, or a maze of that "
+                             "size generated from --maze-seed with --num-ghosts ghosts (see pacman_layouts.py)")
+    parser.add_argument('--maze-seed', type=int, default=0)
+    parser.add_argument('--layout-file', default=None,
+                        help="play on the layout in this text file instead (one row per line, as in custom_layout)")
+    parser.add_argument('--cache-dir', default=None,
+                        help="keep compiled layout tables here and memory-map them in later runs")
+    parser.add_argument('--width', type=int, default=20)
+    parser.add_argument('--height', type=int, default=10)
+    parser.add_argument('--num-ghosts', type=int, default=2, help="ghosts on an open board or a maze")
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-turns', type=int, default=500)
+    parser.add_argument('--budget-ms', type=float, default=None,
+                        help="alphabeta and mcts only: search each move for this many ms, with iterative "
+                             "deepening for alphabeta, instead of --depth or --simulations")
+    parser.add_argument('--samples', type=int, default=None,
+                        help="expectimax only: joint ghost moves sampled per chance node instead of all of them")
+    parser.add_argument('--simulations', type=int, default=None,
+                        help="mcts only: playouts per move (default 2000)")
+    parser.add_argument('--policy', default=None,
+                        help="table only: policy table saved by pacman_solver.py for the layout and ghosts")
+    parser.add_argument('--weights', type=parse_weights, default=None,
+                        help="Pac-Man's evaluate() weights as five comma-separated numbers (see pacman_tuner.py)")
+    parser.add_argument('--pvs', action='store_true',
+                        help="alphabeta only: principal variation search, trying the last turn's predicted line first")
+    parser.add_argument('--aspiration', type=float, default=None, metavar='DELTA',
+                        help="alphabeta only: search Pac-Man's moves in a window of +-DELTA around the last score")
+    parser.add_argument('--batch-leaves', action='store_true',
+                        help="alphabeta only: score the last ply of each search with one vectorized evaluate_batch()")
+    parser.add_argument('--ponder', type=int, default=None, metavar='N',
+                        help="alphabeta and minimax only: search Pac-Man's next move from the N likeliest ghost "
+                             "replies in a background process during the ghosts' turn")
+    parser.add_argument('--workers', type=int, default=None, help="processes to use (default: all cores)")
+    parser.add_argument('--stats', default=None,
+                        help="save node counts, cutoffs and timings of every search to this .jsonl file")
+    parser.add_argument('--trace', default=None,
+                        help="record every turn of every game in this binary trace file (see pacman_trace.py)")
+    parser.add_argument('-o', '--output', default='results.csv', help="a .csv or .json file")
+    args = parser.parse_args()
+    if args.layout_file is not None:
+        args.layout = 'file'
+    if args.layout == 'maze' and (args.width < MIN_WIDTH or args.height < MIN_HEIGHT):
+        parser.error(f"--layout maze needs at least --width {MIN_WIDTH} --height {MIN_HEIGHT}")
+    if args.budget_ms is not None and args.agent not in ('alphabeta', 'mcts'):
+        parser.error("--budget-ms needs --agent alphabeta or mcts")
+    if args.agent == 'expectimax' and args.ghosts != 'random':
+        parser.error("--agent expectimax needs --ghosts random")
+    if args.samples is not None and args.agent != 'expectimax':
+        parser.error("--samples needs --agent expectimax")
+    if args.simulations is not None and args.agent != 'mcts':
+        parser.error("--simulations needs --agent mcts")
+    if (args.policy is not None) != (args.agent == 'table'):
+        parser.error("--agent table and --policy go together")
+    if (args.pvs or args.aspiration is not None) and args.agent != 'alphabeta':
+        parser.error("--pvs and --aspiration need --agent alphabeta")
+    if args.batch_leaves and args.agent != 'alphabeta':
+        parser.error("--batch-leaves needs --agent alphabeta")
+    if args.ponder is not None and (args.agent not in ('alphabeta', 'minimax') or args.budget_ms is not None):
+        parser.error("--ponder needs --agent alphabeta or minimax and a fixed --depth")
+    if args.weights is not None and args.agent not in ('alphabeta', 'minimax', 'expectimax'):
+        parser.error("--weights needs --agent alphabeta, minimax or expectimax")
+
+    games = make_games(args.games, args.agent, args.ghosts, args.layout, args.width, args.height,
+                       args.num_ghosts, args.depth, args.seed, args.max_turns, args.budget_ms,
+                       args.samples, args.stats is not None, args.simulations, args.trace, args.policy,
+                       args.weights, args.pvs, args.aspiration, args.ponder, args.maze_seed, args.layout_file,
+                       args.cache_dir, args.batch_leaves)
+    layout = game_layout(load_script(GAMES[(args.agent, args.ghosts)][0]), games[0])
+    if layout is not None and args.cache_dir is not None:
+        compile_layout(layout, args.cache_dir)  # Once here, not in every worker at once
+    if layout is not None and args.agent == 'mcts' and (parse_layout(layout)[0] != WALL).sum() > MAX_DISTANCE_CELLS:
+        parser.error(f"--agent mcts needs a layout of at most {MAX_DISTANCE_CELLS} walkable cells")
+    if args.trace is not None:
+        start_trace(args.trace, games)
+    start = time.perf_counter()
+    results = run_games(games, args.workers)
+    elapsed = time.perf_counter() - start
+    if args.stats is not None:
+        write_stats([dict(game=result['game'], **entry) for result in results for entry in result.pop('stats')],
+                    args.stats)
+    write_results(results, args.output)
+
+    summary = summarize(results)
+    print(f"{summary['games']} games in {elapsed:.1f}s: {summary['wins']} wins ({summary['win_rate']:.0%}), "
+          f"mean score {summary['mean_score']:.1f}, mean turns {summary['mean_turns']:.1f}, "
+          f"{summary['ms_per_move']:.2f} ms per move")
+    print(f"Results written to {args.output}")
+    if args.stats is not None:
+        print(f"Search stats written to {args.stats}")
+    if args.trace is not None:
+        print(f"Turns recorded in {args.trace}")
+
+
+if __name__ == "__main__":
+    main()
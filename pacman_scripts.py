@@ -0,0 +1,29 @@
+import importlib.util
+import os
+import sys
+
+# The game scripts have spaces in their file names, so they cannot be imported by name.
+# Tools that reuse their code load them through load_script() instead.
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS = {
+    'alphabeta': 'Pacman - AlphaBeta - AlphaBeta.py',
+    'alphabeta-random': 'Pacman - AlphaBeta - Random.py',
+    'minimax': 'Pacman - Minimax - Minimax.py',
+    'minimax-random': 'Pacman - Minimax - Random.py',
+}
+
+_loaded = {}
+
+
+# Function to load one of the game scripts as a module, by its SCRIPTS name.
+# Each script is only executed once per process.
+def load_script(name):
+    if name not in _loaded:
+        path = os.path.join(SCRIPT_DIR, SCRIPTS[name])
+        module_name = 'pacman_' + name.replace('-', '_')
+        spec = importlib.util.spec_from_file_location(module_name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+        _loaded[name] = module
+    return _loaded[name]
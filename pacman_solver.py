@@ -0,0 +1,281 @@
+import argparse
+import os
+from time import perf_counter
+
+import numpy as np
+
+from pacman_layouts import compile_layout
+from pacman_maze import DIRECTIONS, WALL, DistanceTable, MoveTable, number_cells, step_table
+from pacman_pellets import PelletIndex
+from pacman_scripts import load_script
+from pacman_symmetry import SymmetryTable
+
+# Value of a position Pac-Man can keep out of the ghosts' reach forever (adversarial ghosts)
+ESCAPE = 255
+
+# Largest state table solve() builds: cells ** (1 + ghosts) entries
+MAX_STATES = 50_000_000
+
+
+# Legal moves of every cell for the max/min over moves: a (cells, 4) array of the cells reached,
+# with the slots of illegal moves filled by the first legal one, which a max or min over the
+# row ignores. The second array marks the legal slots.
+def move_options(moves):
+    steps = step_table(moves)
+    legal = steps != np.arange(len(moves.cells))[:, None]
+    first = steps[np.arange(len(steps)), legal.argmax(axis=1)]
+    return np.where(legal, steps, first[:, None]), legal
+
+
+# Solved layout. Positions are indexed by cell ids, Pac-Man's first and then each ghost's, so
+# values and policy have shape (cells,) * (1 + ghosts), with Pac-Man to move.
+# values: for adversarial ghosts ('search'), the number of turns Pac-Man survives when both sides
+# play perfectly, ESCAPE when the ghosts can never catch Pac-Man; for random ghosts ('random'), the
+# expected discounted number of turns survived, rounded. policy: a bitmask of the moves that
+# reach that value, bit d for DIRECTIONS[d].
+# A folded table (see fold()) keeps one entry per symmetry class of the layout: its first axis
+# runs over pacman_cells, the canonical Pac-Man cells, and other positions are looked up
+# through their mirror image.
+class PolicyTable:
+    def __init__(self, walls, ghosts, values, policy, pacman_cells=None, symmetries=None):
+        self.walls = walls
+        self.ghosts = ghosts
+        self.values = values
+        self.policy = policy
+        board = np.where(walls, WALL, ' ')
+        self.cell_ids, _ = number_cells(board)
+        self.pacman_cells = pacman_cells
+        if pacman_cells is not None:
+            self.symmetries = symmetries if symmetries is not None else SymmetryTable(board)
+            self.rows = np.full(int(self.cell_ids.max()) + 1, -1, dtype=np.int64)
+            self.rows[pacman_cells] = np.arange(len(pacman_cells))
+
+    @property
+    def num_ghosts(self):
+        return self.policy.ndim - 1
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.policy.nbytes
+
+    @property
+    def folded(self):
+        return self.pacman_cells is not None
+
+    def index(self, pacman_pos, ghost_pos):
+        pacman = self.cell_ids[pacman_pos]
+        return (self.rows[pacman] if self.folded else pacman,) + tuple(self.cell_ids[pos] for pos in ghost_pos)
+
+    # The best moves from a position, as DIRECTIONS entries: one table read (after mapping the
+    # position to its canonical image, and the moves back, when the table is folded)
+    def best_moves(self, pacman_pos, ghost_pos):
+        symmetry = None
+        if self.folded:
+            symmetry, pacman_pos = self.symmetries.canonical_pacman(pacman_pos)
+            ghost_pos = [symmetry(pos) for pos in ghost_pos]
+        mask = int(self.policy[self.index(pacman_pos, ghost_pos)])
+        if symmetry is not None:
+            mask = symmetry.move_mask(mask)
+        return [direction for d, direction in enumerate(DIRECTIONS) if mask >> d & 1]
+
+    # The table with only the rows of canonical Pac-Man cells (see SymmetryTable). Mirror images
+    # of a position have the same value and mirrored best moves, so nothing is lost; a layout
+    # mirrored one way halves the table, an open board (mirrored both ways) quarters it.
+    # symmetries is the layout's SymmetryTable when there is one already (see
+    # pacman_layouts.CompiledLayout.symmetry_table()), worked out from the walls otherwise.
+    def fold(self, symmetries=None):
+        if self.folded:
+            return self
+        if symmetries is None:
+            symmetries = SymmetryTable(np.where(self.walls, WALL, ' '))
+        cells = symmetries.canonical_cells
+        return PolicyTable(self.walls, self.ghosts, self.values[cells], self.policy[cells], cells, symmetries)
+
+    def save(self, path):
+        arrays = dict(walls=self.walls, ghosts=self.ghosts, values=self.values, policy=self.policy)
+        if self.folded:
+            arrays['pacman_cells'] = self.pacman_cells
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            pacman_cells = data['pacman_cells'] if 'pacman_cells' in data else None
+            return cls(data['walls'], str(data['ghosts']), data['values'], data['policy'], pacman_cells)
+
+
+# The ghosts' side of one value-iteration step: the value of each position after Pac-Man's move
+# (ghosts to move), from after_ghosts, the values once the ghosts have moved. Ghosts move
+# independently, so the min (or mean) over their joint moves is taken one ghost axis at a time.
+def ghost_step(after_ghosts, ghost_options, ghosts):
+    values = after_ghosts
+    for axis in range(1, after_ghosts.ndim):
+        taken = [values.take(ghost_options[:, j], axis=axis) for j in range(ghost_options.shape[1])]
+        values = np.minimum.reduce(taken) if ghosts == 'search' else sum(taken) / len(taken)
+    return values
+
+
+# Function to solve a layout by value iteration over every (Pac-Man cell, ghost cells) position.
+# Pellets are left out of the state (the pellets left would multiply it by 2 ** pellets): the
+# table answers how long Pac-Man can stay alive, and TableAgent picks among the moves that stay
+# alive longest. ghosts is 'search' for ghosts that chase perfectly and 'random' for the Random
+# scripts' ghosts, which step in a random direction and stay put when it is a wall.
+# Adversarial ghosts are solved as a retrograde analysis: after iteration k every position lost
+# in fewer than k turns has its exact value, and once an iteration labels no new ones the rest
+# are ESCAPE. Random ghosts are discounted by gamma and iterate until no value moves by tol.
+def solve(board, num_ghosts, ghosts='search', gamma=0.99, tol=1e-3, max_states=MAX_STATES):
+    moves = MoveTable(board)
+    count = len(moves.cells)
+    shape = (count,) * (1 + num_ghosts)
+    if count ** (1 + num_ghosts) > max_states:
+        raise ValueError(f"{count} cells and {num_ghosts} ghosts make {count ** (1 + num_ghosts)} positions, "
+                         f"more than max_states={max_states}")
+    pacman_options, legal = move_options(moves)
+    ghost_options = pacman_options if ghosts == 'search' else step_table(moves)
+
+    cells = np.arange(count).reshape((count,) + (1,) * num_ghosts)
+    caught = np.zeros(shape, dtype=bool)
+    for axis in range(1, 1 + num_ghosts):
+        caught |= np.arange(count).reshape([count if a == axis else 1 for a in range(1 + num_ghosts)]) == cells
+
+    if ghosts == 'search':
+        values = np.zeros(shape, dtype=np.int16)
+        for k in range(ESCAPE - 1):
+            after_ghosts = np.where(caught, 0, values + 1).astype(np.int16)
+            before_ghosts = ghost_step(after_ghosts, ghost_options, ghosts)
+            values = np.maximum.reduce([before_ghosts.take(pacman_options[:, d], axis=0) for d in range(4)])
+            if k > 0 and not (values == k).any():
+                break  # Nothing lost in exactly k turns, so nothing is lost in more
+        values[values == k + 1] = ESCAPE  # Never labelled
+        after_ghosts = np.where(caught, 0, values.astype(np.int16) + 1)
+        slack = 0
+    else:
+        values = np.zeros(shape, dtype=np.float32)
+        while True:
+            after_ghosts = np.where(caught, 0, 1 + gamma * values).astype(np.float32)
+            before_ghosts = ghost_step(after_ghosts, ghost_options, ghosts)
+            new_values = np.maximum.reduce([before_ghosts.take(pacman_options[:, d], axis=0) for d in range(4)])
+            change = np.abs(new_values - values).max()
+            values = new_values
+            if change < tol:
+                break
+        after_ghosts = np.where(caught, 0, 1 + gamma * values).astype(np.float32)
+        slack = tol
+
+    # Policy: the legal moves whose value is within slack of the best
+    before_ghosts = ghost_step(after_ghosts, ghost_options, ghosts)
+    best = np.maximum.reduce([before_ghosts.take(pacman_options[:, d], axis=0) for d in range(4)])
+    policy = np.zeros(shape, dtype=np.uint8)
+    for d in range(4):
+        good = before_ghosts.take(pacman_options[:, d], axis=0) >= best - slack
+        good &= legal[:, d].reshape((count,) + (1,) * num_ghosts)
+        policy |= good.astype(np.uint8) << d
+    values = np.minimum(np.rint(values), ESCAPE).astype(np.uint8)
+    return PolicyTable(board == WALL, ghosts, values, policy)
+
+
+# Pac-Man playing from a PolicyTable: the table gives the moves that stay alive longest, and of
+# those the agent takes the one closest to a pellet. Needs the layout the table was solved for.
+class TableAgent:
+    def __init__(self, table, board, distances=None):
+        if not np.array_equal(table.walls, board == WALL):
+            raise ValueError("the policy table was solved for another layout")
+        self.table = table
+        self.distances = distances
+
+    def move(self, board, pacman_pos, ghost_pos, pellets):
+        best = self.table.best_moves(pacman_pos, ghost_pos)
+        if not best:
+            return None  # Caught whatever the move
+        if len(best) == 1:
+            return best[0]
+
+        def pellet_distance(move):
+            new_pos = (pacman_pos[0] + move[0], pacman_pos[1] + move[1])
+            if new_pos in pellets:
+                return 0
+            distance = pellets.nearest_distance(new_pos, self.distances)
+            return distance if distance is not None else 0
+
+        return min(best, key=pellet_distance)
+
+
+# Function to open a policy table saved by save(), or pass a PolicyTable through
+def load_policy(policy):
+    return PolicyTable.load(policy) if isinstance(policy, (str, os.PathLike)) else policy
+
+
+# Function to solve the solver's --layout. Returns the table, the seconds solve() took and the
+# layout's SymmetryTable from its compiled tables, None on an open board, which has no layout.
+def solve_layout(layout, ghosts, width, height, num_ghosts):
+    game = load_script('minimax')
+    symmetries = None
+    if layout == 'custom':
+        compiled = compile_layout(game.custom_layout)
+        board, _, ghost_pos = compiled.parse()
+        symmetries = compiled.symmetry_table(board)
+        num_ghosts = len(ghost_pos)
+    else:
+        board = game.create_board(width, height)
+    start = perf_counter()
+    table = solve(board, num_ghosts, ghosts)
+    return table, perf_counter() - start, symmetries
+
+
+# Per-move latency of the table agent against depth-3 minimax(), on the positions of one
+# minimax game on custom_layout
+def benchmark(table, turns=100, depth=3):
+    game = load_script('minimax')
+    board, pacman_pos, ghost_pos = game.create_custom_layout(game.custom_layout)
+    distances = DistanceTable(board)
+    moves = MoveTable(board)
+    agent = TableAgent(table, board, distances)
+    pellets = PelletIndex(board)
+    table_time = minimax_time = 0.0
+    for _ in range(turns):
+        start = perf_counter()
+        agent.move(board, pacman_pos, ghost_pos, pellets)
+        table_time += perf_counter() - start
+        start = perf_counter()
+        move, _ = game.minimax(board, pacman_pos, ghost_pos, 0, depth, True, pellets=pellets, distances=distances,
+                               moves=moves)
+        minimax_time += perf_counter() - start
+        pacman_pos = moves.step(pacman_pos, move)
+        if pacman_pos in pellets:
+            board[pacman_pos] = ' '
+            pellets.eat(pacman_pos)
+        ghost_moves, _ = game.minimax_ghost_moves(board, pacman_pos, ghost_pos, depth, pellets=pellets,
+                                                  distances=distances, moves=moves)
+        ghost_pos = [moves.step(pos, move) for pos, move in zip(ghost_pos, ghost_moves)]
+        if game.is_game_over(pacman_pos, ghost_pos):
+            board, pacman_pos, ghost_pos = game.create_custom_layout(game.custom_layout)
+            pellets = PelletIndex(board)
+    return table_time / turns, minimax_time / turns
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve a layout offline into a policy table.")
+    parser.add_argument('--ghosts', choices=['search', 'random'], default='search',
+                        help="ghosts that chase perfectly, or the Random scripts' ghosts")
+    parser.add_argument('--layout', choices=['custom', 'open'], default='custom')
+    parser.add_argument('--width', type=int, default=10)
+    parser.add_argument('--height', type=int, default=7)
+    parser.add_argument('--num-ghosts', type=int, default=2, help="ghosts on an open board")
+    parser.add_argument('--full', action='store_true',
+                        help="save every position instead of one per symmetry class of the layout")
+    parser.add_argument('-o', '--output', default='policy.npz')
+    args = parser.parse_args()
+
+    table, seconds, symmetries = solve_layout(args.layout, args.ghosts, args.width, args.height, args.num_ghosts)
+    if not args.full:
+        table = table.fold(symmetries)
+    table.save(args.output)
+    print(f"Solved {table.policy.size} positions in {seconds:.1f}s: {table.nbytes / 1024:.0f} KiB in memory, "
+          f"{os.path.getsize(args.output) / 1024:.0f} KiB in {args.output}")
+    if args.layout == 'custom':
+        table_ms, minimax_ms = (1000 * seconds for seconds in benchmark(table))
+        print(f"Per move: {table_ms:.3f} ms from the table, {minimax_ms:.3f} ms for depth-3 minimax()")
+
+
+if __name__ == "__main__":
+    main()
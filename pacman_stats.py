@@ -0,0 +1,63 @@
+import json
+
+# Counters filled in by one search when it is given a SearchStats; searches given none skip
+# all of it. nodes and cutoffs are per ply (index 0 is the root). researches counts the
+# children searched again after a null window, and the roots searched again after an
+# aspiration window, that the real score fell outside of. evaluate_time and
+# successor_time are the seconds spent in evaluate() and in generating (and ordering) children;
+# search_time is the whole search, set by the caller. info holds whatever describes the search
+# (turn, side, ...) and is copied into as_dict().
+class SearchStats:
+    def __init__(self, **info):
+        self.info = info
+        self.nodes = []
+        self.cutoffs = []
+        self.leaves = 0
+        self.researches = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.evaluate_time = 0.0
+        self.successor_time = 0.0
+        self.search_time = 0.0
+
+    def node(self, ply):
+        while len(self.nodes) <= ply:
+            self.nodes.append(0)
+            self.cutoffs.append(0)
+        self.nodes[ply] += 1
+
+    def cutoff(self, ply):
+        self.cutoffs[ply] += 1
+
+    @property
+    def total_nodes(self):
+        return sum(self.nodes)
+
+    def as_dict(self):
+        return dict(self.info,
+                    nodes=self.total_nodes,
+                    nodes_per_ply=list(self.nodes),
+                    cutoffs=sum(self.cutoffs),
+                    cutoffs_per_ply=list(self.cutoffs),
+                    leaves=self.leaves,
+                    researches=self.researches,
+                    tt_probes=self.tt_probes,
+                    tt_hits=self.tt_hits,
+                    evaluate_time=self.evaluate_time,
+                    successor_time=self.successor_time,
+                    search_time=self.search_time)
+
+
+# Function to save per-search stats dicts as JSON lines, one search per line
+def write_stats(records, path):
+    with open(path, 'w') as f:
+        for entry in records:
+            f.write(json.dumps(entry) + '\n')
+
+
+# Function for the game loops: stores the time of a search they timed in its stats and adds
+# the stats to records. Does nothing for a search run without stats.
+def record(records, stats, search_time):
+    if stats is not None:
+        stats.search_time = search_time
+        records.append(stats.as_dict())
@@ -0,0 +1,121 @@
+import numpy as np
+
+from pacman_maze import DIRECTIONS, WALL, number_cells
+
+# The symmetries a layout is checked for, as (name, rows flipped, columns flipped)
+TRANSFORMS = (
+    ('identity', False, False),
+    ('mirror', False, True),  # Left-right mirror image
+    ('flip', True, False),  # Top-bottom mirror image
+    ('rotate', True, True),  # 180 degree rotation
+)
+
+
+# One symmetry of a board of shape (height, width). Calling it maps a position to its image;
+# move() maps a direction the same way. Each of these symmetries is its own inverse, so the
+# same calls map canonical positions and moves back to the real ones.
+class Symmetry:
+    def __init__(self, name, shape, flip_rows, flip_cols):
+        self.name = name
+        self.height, self.width = shape
+        self.flip_rows = flip_rows
+        self.flip_cols = flip_cols
+        self.directions = {(d_row, d_col): (-d_row if flip_rows else d_row, -d_col if flip_cols else d_col)
+                           for d_row, d_col in DIRECTIONS}
+        # Bit d of a DIRECTIONS bitmask moves to bit permutation[d]
+        self.permutation = [DIRECTIONS.index(self.directions[direction]) for direction in DIRECTIONS]
+
+    def __call__(self, pos):
+        return (self.height - 1 - pos[0] if self.flip_rows else pos[0],
+                self.width - 1 - pos[1] if self.flip_cols else pos[1])
+
+    def __repr__(self):
+        return f"Symmetry({self.name!r})"
+
+    def move(self, direction):
+        return self.directions[direction]
+
+    # A bitmask of DIRECTIONS indices, with every direction mapped
+    def move_mask(self, mask):
+        mapped = 0
+        for d, image in enumerate(self.permutation):
+            if mask >> d & 1:
+                mapped |= 1 << image
+        return mapped
+
+    # A (height, width) array seen through the symmetry
+    def apply(self, array):
+        return array[::-1 if self.flip_rows else 1, ::-1 if self.flip_cols else 1]
+
+
+# Function to find the symmetries of a board: the TRANSFORMS that map every wall onto a wall,
+# identity first. Pellets are left out, as they change during a game; canonical() maps them.
+def layout_symmetries(board):
+    walls = board == WALL
+    symmetries = []
+    for name, flip_rows, flip_cols in TRANSFORMS:
+        symmetry = Symmetry(name, board.shape, flip_rows, flip_cols)
+        if np.array_equal(symmetry.apply(walls), walls):
+            symmetries.append(symmetry)
+    return symmetries
+
+
+# Functions to turn symmetries into their indices in TRANSFORMS and back, the form compiled
+# layouts store them in (see pacman_layouts.compile_layout())
+def transform_indices(symmetries):
+    names = [name for name, _, _ in TRANSFORMS]
+    return [names.index(symmetry.name) for symmetry in symmetries]
+
+
+def transform_symmetries(shape, indices):
+    return [Symmetry(TRANSFORMS[i][0], shape, TRANSFORMS[i][1], TRANSFORMS[i][2]) for i in indices]
+
+
+# The symmetries of a layout and the canonical form of positions on it, worked out once per
+# layout. Of the images of a position under the symmetries, the canonical one has Pac-Man on
+# the first cell in reading order, then the first ghost cells, then the first pellets, so
+# positions that are mirror images of each other share one canonical form, and a table keyed
+# by canonical positions holds one entry per symmetry class. Ghosts are interchangeable, as in
+# the transposition table's hash, so canonical ghost positions are sorted.
+# images[k] maps each walkable cell id to the id of its image under symmetries[k].
+# symmetries, when given, are the board's symmetries found before (as compiled layouts keep
+# them) and are not looked for again.
+class SymmetryTable:
+    def __init__(self, board, symmetries=None):
+        self.symmetries = symmetries if symmetries is not None else layout_symmetries(board)
+        self.cell_ids, self.cells = number_cells(board)
+        self.images = np.array([[self.cell_ids[symmetry(pos)] for pos in self.cells] for symmetry in self.symmetries],
+                               dtype=np.int32).reshape(len(self.symmetries), len(self.cells))
+        # Pac-Man cells that are first of their images: canonical positions have Pac-Man on one
+        self.canonical_cells = np.flatnonzero((self.images >= np.arange(len(self.cells))).all(axis=0))
+
+    def __len__(self):
+        return len(self.symmetries)
+
+    # Function to map a position to its canonical form. pellets, a PelletIndex or a collection
+    # of positions, is only needed to tell apart images with the same Pac-Man and ghost cells;
+    # without it those are taken as the same. Returns (symmetry, pacman_pos, ghost_pos,
+    # pellets): the symmetry that gives the canonical form (its move() maps moves both ways),
+    # and the canonical positions, with the pellets as a frozenset (None when not given).
+    def canonical(self, pacman_pos, ghost_pos, pellets=None):
+        best = None
+        tied = []
+        for symmetry in self.symmetries:
+            key = (symmetry(pacman_pos), sorted(symmetry(pos) for pos in ghost_pos))
+            if best is None or key < best:
+                best, tied = key, [symmetry]
+            elif key == best:
+                tied.append(symmetry)
+        symmetry = tied[0]
+        if pellets is not None:
+            positions = getattr(pellets, 'positions', pellets)
+            images = [(sorted(symmetry(pos) for pos in positions), symmetry) for symmetry in tied]
+            symmetry = min(images, key=lambda image: image[0])[1]
+            pellets = frozenset(symmetry(pos) for pos in positions)
+        return symmetry, best[0], best[1], pellets
+
+    # The symmetry that maps Pac-Man's cell to a canonical cell, and that cell
+    def canonical_pacman(self, pacman_pos):
+        image, symmetry = min(((symmetry(pacman_pos), symmetry) for symmetry in self.symmetries),
+                              key=lambda image: image[0])
+        return symmetry, image
@@ -0,0 +1,167 @@
+import argparse
+import os
+import struct
+
+import numpy as np
+
+from pacman_render import make_renderer
+
+# File layout: a header, then fixed-width records, one per turn. The header holds the board the
+# games start from, so any record can be found by its index alone:
+#   MAGIC, version, ghosts per game, height, width (HEADER), the board as height * width ASCII
+#   bytes, zero padding to a multiple of 8 bytes, then record_dtype(ghosts) records.
+# Each game starts with a turn-0 record of the start positions; a record's positions, score and
+# search figures are those after its turn.
+MAGIC = b'PACTRACE'
+VERSION = 1
+HEADER = struct.Struct('<8sHHHH')
+EMPTY = ' '
+
+
+def record_dtype(num_ghosts):
+    return np.dtype([
+        ('game', '<u4'),
+        ('turn', '<u4'),
+        ('pacman', '<i2', (2,)),
+        ('ghosts', '<i2', (num_ghosts, 2)),
+        ('move', 'i1', (2,)),  # Pac-Man's move, (0, 0) on turn 0
+        ('score', '<i4'),
+        ('search_time', '<f4'),  # Seconds Pac-Man's and the ghosts' searches took this turn
+        ('nodes', '<u4'),  # Nodes those searches visited, 0 when they were not instrumented
+        ('depth', '<u2'),  # Depth of Pac-Man's search
+    ])
+
+
+def header_size(board):
+    size = HEADER.size + board.size
+    return size + (-size) % 8
+
+
+# Function to start a trace file for games on board with num_ghosts ghosts. The runner calls it
+# once before handing games to its workers, so they only ever append.
+def create_trace(path, board, num_ghosts):
+    height, width = board.shape
+    header = HEADER.pack(MAGIC, VERSION, num_ghosts, height, width) + ''.join(board.flat).encode('ascii')
+    with open(path, 'wb') as f:
+        f.write(header + bytes(header_size(board) - len(header)))
+
+
+def read_header(f):
+    magic, version, num_ghosts, height, width = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{f.name} is not a version {VERSION} trace file")
+    board = np.array(list(f.read(height * width).decode('ascii'))).reshape(height, width)
+    return board, num_ghosts
+
+
+# Appends the turns of one game to a trace file as they are played, one write() of one record
+# per turn on a descriptor opened with O_APPEND, so a game that crashes or is interrupted keeps
+# the turns it played, and games played at the same time by several processes never interleave
+# inside a record (their records do interleave; Trace sorts them out by game id).
+# The file is created when it does not exist; an existing one must be for the same board and
+# number of ghosts. When the file already holds a game with this id, the game is recorded as the
+# next free id instead, which is left in game.
+class TraceWriter:
+    def __init__(self, path, board, num_ghosts, game=0):
+        if not os.path.exists(path):
+            create_trace(path, board, num_ghosts)
+        trace = Trace(path)
+        if trace.num_ghosts != num_ghosts or not np.array_equal(trace.board, board):
+            raise ValueError(f"{path} holds games on another board or with another number of ghosts")
+        if game in trace.games:
+            game = max(trace.games) + 1
+        self.path = path
+        self.game = game
+        self.dtype = record_dtype(num_ghosts)
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+
+    def append(self, turn, pacman_pos, ghost_pos, move, score, search_time=0.0, nodes=0, depth=0):
+        record = np.array([(self.game, turn, pacman_pos, ghost_pos, move, score, search_time, nodes, depth)],
+                          dtype=self.dtype)
+        os.write(self.fd, record.tobytes())
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+# A trace file opened for reading. records is a read-only structured array memory-mapped onto
+# the file, so nothing is read until it is used and slices and field views are not copies.
+# Games played at the same time interleave in the file: order lists the record indices sorted
+# by game id, each game's turns in file order, and games holds the start and end of each game
+# in order, by game id. A file with two games of the same id is rejected.
+class Trace:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.board, self.num_ghosts = read_header(f)
+        dtype = record_dtype(self.num_ghosts)
+        offset = header_size(self.board)
+        count = (os.path.getsize(path) - offset) // dtype.itemsize
+        if count:
+            self.records = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=dtype)
+        self.order = np.argsort(self.records['game'], kind='stable')
+        ids = self.records['game'][self.order]
+        self.starts = np.flatnonzero(np.diff(ids, prepend=-1))
+        self.ends = np.append(self.starts[1:], count).astype(np.int64)[:len(self.starts)]
+        if count:
+            first_turns = np.add.reduceat(self.records['turn'][self.order] == 0, self.starts)
+            if (first_turns > 1).any():
+                duplicate = ids[self.starts[np.argmax(first_turns > 1)]]
+                raise ValueError(f"{path} holds more than one game with id {duplicate}")
+        self.games = {int(ids[start]): (int(start), int(end)) for start, end in zip(self.starts, self.ends)}
+
+    def game(self, game):
+        start, end = self.games[game]
+        return self.records[self.order[start:end]]
+
+    # One row per game, by game id: final score, turns and total search time, worked out on
+    # whole columns
+    def summary(self):
+        last = self.order[self.ends - 1]
+        ids = self.records['game'][last]
+        time = np.add.reduceat(self.records['search_time'][self.order], self.starts) if len(self.starts) else []
+        return [{'game': int(game), 'turns': int(turns), 'score': int(score), 'search_time': float(seconds)}
+                for game, turns, score, seconds in zip(ids, self.records['turn'][last], self.records['score'][last],
+                                                       time)]
+
+
+# Function to play one recorded game back through a renderer. Pellets are cleared from the
+# board as Pac-Man moves over them, as in the game (the start cell keeps its pellet).
+def replay(trace, game, render=True, fps=10.0):
+    board = trace.board.copy()
+    renderer = make_renderer(render, fps)
+    for record in trace.game(game):
+        pacman_pos = tuple(int(x) for x in record['pacman'])
+        ghost_pos = [tuple(int(x) for x in pos) for pos in record['ghosts']]
+        if record['turn'] > 0:
+            board[pacman_pos] = EMPTY
+        renderer.draw(board, pacman_pos, ghost_pos, [f"Game {game}, turn {record['turn']}",
+                                                     f"Score: {record['score']}"])
+        renderer.wait()
+    renderer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize or replay the games in a trace file.")
+    parser.add_argument('trace')
+    parser.add_argument('--replay', type=int, default=None, metavar='GAME', help="play this game back")
+    parser.add_argument('--fps', type=float, default=10.0)
+    args = parser.parse_args()
+
+    trace = Trace(args.trace)
+    if args.replay is not None:
+        if args.replay not in trace.games:
+            parser.error(f"no game {args.replay} in {args.trace}")
+        replay(trace, args.replay, fps=args.fps)
+        return
+    print(f"{len(trace.games)} games, {len(trace.records)} turns")
+    print(f"{'game':>6} {'turns':>6} {'score':>7} {'search s':>9}")
+    for row in trace.summary():
+        print(f"{row['game']:>6} {row['turns']:>6} {row['score']:>7} {row['search_time']:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
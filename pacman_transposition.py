@@ -0,0 +1,114 @@
+import random
+
+# Bound types stored with each transposition table entry
+EXACT = 0
+LOWER = 1  # The real value is at least the stored one (search failed high)
+UPPER = 2  # The real value is at most the stored one (search failed low)
+
+
+# Zobrist hashing of a search position: Pac-Man cell, the multiset of ghost cells, the
+# pellets eaten so far and the side to move. Every component has its own random 64 bit
+# key and a position hashes to the XOR of the keys of its components, so a move only
+# XORs out what changed and XORs in the replacement.
+class ZobristHasher:
+    def __init__(self, shape, num_ghosts, seed=0):
+        rng = random.Random(seed)
+        height, width = shape
+        self.width = width
+        cells = height * width
+        self.pacman_keys = [rng.getrandbits(64) for _ in range(cells)]
+        # Ghosts are interchangeable, so a cell is keyed by how many ghosts stand on it.
+        # This keeps two ghosts on one cell from cancelling out like a plain XOR would.
+        self.ghost_keys = [[0] + [rng.getrandbits(64) for _ in range(num_ghosts)] for _ in range(cells)]
+        self.pellet_keys = [rng.getrandbits(64) for _ in range(cells)]
+        self.side_key = rng.getrandbits(64)
+        self.eaten_key = 0  # XOR of the pellets eaten in the real game so far
+
+    def cell(self, pos):
+        return pos[0] * self.width + pos[1]
+
+    # Full hash of a position, used once at the root of each search
+    def hash(self, pacman_pos, ghost_pos, is_max):
+        key = self.pacman_keys[self.cell(pacman_pos)] ^ self.eaten_key
+        counts = {}
+        for pos in ghost_pos:
+            counts[pos] = counts.get(pos, 0) + 1
+        for pos, count in counts.items():
+            key ^= self.ghost_keys[self.cell(pos)][count]
+        if not is_max:
+            key ^= self.side_key
+        return key
+
+    # Key of the position after Pac-Man moves from old_pos to new_pos
+    def pacman_move(self, key, old_pos, new_pos):
+        return key ^ self.pacman_keys[self.cell(old_pos)] ^ self.pacman_keys[self.cell(new_pos)] ^ self.side_key
+
+    # Key of the position after one ghost of ghost_pos moves from old_pos to new_pos
+    def ghost_move(self, key, ghost_pos, old_pos, new_pos):
+        old_keys = self.ghost_keys[self.cell(old_pos)]
+        new_keys = self.ghost_keys[self.cell(new_pos)]
+        old_count = ghost_pos.count(old_pos)
+        new_count = ghost_pos.count(new_pos)
+        key ^= old_keys[old_count] ^ old_keys[old_count - 1]
+        key ^= new_keys[new_count] ^ new_keys[new_count + 1]
+        return key ^ self.side_key
+
+    # Key with the pellet at pos toggled between present and eaten
+    def toggle_pellet(self, key, pos):
+        return key ^ self.pellet_keys[self.cell(pos)]
+
+    # Record a pellet eaten in the real game so later root hashes include it
+    def eat_pellet(self, pos):
+        self.eaten_key ^= self.pellet_keys[self.cell(pos)]
+
+
+# Fixed size transposition table. Each key maps to one slot; a slot is overwritten when
+# it is empty, holds the same position, was written during an older search (turn), or
+# holds a shallower search than the new entry. Deep results from the current turn are
+# kept over shallow ones.
+class TranspositionTable:
+    def __init__(self, shape, num_ghosts, size_bits=16, seed=0):
+        self.zobrist = ZobristHasher(shape, num_ghosts, seed)
+        self.mask = (1 << size_bits) - 1
+        self.slots = [None] * (1 << size_bits)
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.entries = 0
+
+    # Start a new search; entries from earlier searches become replaceable
+    def new_search(self):
+        self.generation += 1
+
+    # Returns (value, depth, flag, best_move, best_child_key) or None
+    def probe(self, key):
+        entry = self.slots[key & self.mask]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1:6]
+        self.misses += 1
+        return None
+
+    def store(self, key, value, depth, flag, best_move=None, best_child_key=None):
+        index = key & self.mask
+        entry = self.slots[index]
+        if entry is not None and entry[0] != key:
+            if entry[6] == self.generation and entry[2] > depth:
+                return  # Keep the deeper result from this turn
+            self.evictions += 1
+        elif entry is None:
+            self.entries += 1
+        self.slots[index] = (key, value, depth, flag, best_move, best_child_key, self.generation)
+        self.stores += 1
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'evictions': self.evictions,
+            'entries': self.entries,
+            'capacity': len(self.slots),
+        }
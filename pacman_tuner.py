@@ -0,0 +1,206 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from pacman_runner import GAMES, make_games, play_one
+from pacman_scripts import load_script
+
+# The five evaluate() weights, in the order of the scripts' WEIGHTS
+NAMES = ('pellets', 'proximity', 'ghost', 'each_ghost', 'radius')
+
+# Sign each term keeps while tuning: pellets are rewarded, ghosts penalized
+SIGNS = (1, 1, -1, -1)
+
+# Agents whose searches score positions with evaluate()
+AGENTS = ('alphabeta', 'minimax', 'expectimax')
+
+# Fields of a game that decide its result, and so make up its cache key
+KEY_FIELDS = ('agent', 'ghosts', 'layout', 'width', 'height', 'num_ghosts', 'depth', 'seed', 'max_turns',
+              'samples', 'weights')
+
+# Fields of a result kept in the cache
+RESULT_KEEP = ('score', 'turns', 'win', 'caught', 'pellets_left')
+
+
+# The weights a game script plays with by default
+def default_weights(agent, ghosts):
+    return tuple(load_script(GAMES[(agent, ghosts)][0]).WEIGHTS)
+
+
+def game_key(game):
+    text = json.dumps([game.get(field) for field in KEY_FIELDS])
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+# Results of games already played, kept in a JSON-lines file, one game per line. Each result
+# is appended as soon as its game finishes, so a tuning run that is stopped loses only the
+# games that were being played. The key covers the game settings and weights, not the code:
+# delete the file after changing the game scripts.
+class ResultCache:
+    def __init__(self, path):
+        self.path = path
+        self.results = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.results[entry['key']] = entry['result']
+
+    def __contains__(self, game):
+        return game_key(game) in self.results
+
+    def get(self, game):
+        return self.results[game_key(game)]
+
+    def add(self, game, result):
+        key = game_key(game)
+        self.results[key] = {field: result[field] for field in RESULT_KEEP}
+        if self.path is not None:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps({'key': key, 'result': self.results[key]}) + '\n')
+
+
+# Plays every game the cache does not have, over a process pool, and returns the results of
+# all of them, in order
+def play_games(games, cache, workers=None):
+    todo = {}
+    for game in games:
+        if game not in cache:
+            todo.setdefault(game_key(game), game)  # Identical games (same seed and weights) once
+    workers = workers or os.cpu_count()
+    if workers == 1:
+        for game in todo.values():
+            cache.add(game, play_one(game))
+    elif todo:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(play_one, game): game for game in todo.values()}
+            for future in as_completed(futures):
+                cache.add(futures[future], future.result())
+    return [cache.get(game) for game in games], len(todo)
+
+
+# Round weights so that candidates, and the cache keys made from them, are reproducible:
+# three significant figures for the terms, a whole number of cells for the radius
+def round_weights(weights):
+    terms = [float(f"{w:.3g}") for w in weights[:4]]
+    return tuple(terms) + (max(1, int(round(weights[4]))),)
+
+
+# Function to draw n candidate weights around start. Each term is scaled by exp(spread * N(0, 1))
+# and keeps its sign; a term that is 0 in start is left out half the time and otherwise
+# started at a tenth of the largest term. The radius moves by up to two cells.
+def sample_candidates(start, n, rng, spread=1.0):
+    scale = max(abs(w) for w in start[:4]) / 10
+    candidates = []
+    for _ in range(n):
+        weights = []
+        for sign, w in zip(SIGNS, start[:4]):
+            if w == 0:
+                w = 0.0 if rng.random() < 0.5 else sign * scale
+            weights.append(w * math.exp(spread * rng.standard_normal()))
+        weights.append(start[4] + rng.integers(-2, 3))
+        candidates.append(round_weights(weights))
+    return candidates
+
+
+# Successive halving: every candidate plays games games, the better half (1 / eta) plays eta
+# times as many, and so on until one is left or the rung would need more than max_games games.
+# Every candidate plays the same seeds, 0, 1, 2, ..., so they are compared on the same
+# games, and a rung only plays the games its candidates have not played in the rungs before.
+# keep, when given, goes on to every rung whatever its score, as the reference the others
+# must beat. Returns the rungs as lists of (mean score, weights), best first.
+def successive_halving(candidates, base_game, cache, games=4, eta=2, max_games=64, workers=None, keep=None,
+                       log=print):
+    rungs = []
+    while candidates:
+        runs = []
+        for weights in candidates:
+            runs.extend(make_games(games, **dict(base_game, weights=list(weights))))
+        start = time.perf_counter()
+        results, played = play_games(runs, cache, workers)
+        means = [float(np.mean([result['score'] for result in results[i * games:(i + 1) * games]]))
+                 for i in range(len(candidates))]
+        ranked = sorted(zip(means, candidates), key=lambda entry: -entry[0])
+        rungs.append(ranked)
+        log(f"{len(candidates)} candidates x {games} games ({played} played, {len(runs) - played} cached) "
+            f"in {time.perf_counter() - start:.1f}s: best mean score {ranked[0][0]:.1f} with {ranked[0][1]}")
+        if len(candidates) <= (1 if keep is None else 2) or games * eta > max_games:
+            break
+        candidates = [weights for _, weights in ranked[:max(1, len(candidates) // eta)]]
+        if keep is not None and keep not in candidates:
+            candidates.append(keep)
+        games *= eta
+    return rungs
+
+
+# Function to tune Pac-Man's weights for one game setup: start (the script's WEIGHTS by
+# default) and candidates - 1 samples around it are raced with successive_halving(), start
+# kept to the end. Returns the best weights and their mean score, and start's mean score on
+# the same games.
+def tune(agent='alphabeta', ghosts='random', candidates=16, games=4, eta=2, max_games=64, spread=1.0,
+         start=None, cache=None, workers=None, seed=0, log=print, **game):
+    start = round_weights(start if start is not None else default_weights(agent, ghosts))
+    cache = cache if cache is not None else ResultCache(None)
+    rng = np.random.default_rng(seed)
+    pool = [start] + sample_candidates(start, candidates - 1, rng, spread)
+    base_game = dict(game, agent=agent, ghosts=ghosts)
+    rungs = successive_halving(list(dict.fromkeys(pool)), base_game, cache, games, eta, max_games, workers, start,
+                               log)
+    best_score, best = rungs[-1][0]
+    start_score = next(mean for mean, weights in rungs[-1] if weights == start)
+    return best, best_score, start, start_score
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune Pac-Man's evaluate() weights with successive halving "
+                                                 "over seeded headless games.")
+    parser.add_argument('--agent', choices=AGENTS, default='alphabeta')
+    parser.add_argument('--ghosts', choices=['search', 'random'], default='random',
+                        help="search ghosts on the custom layout play the same game whatever the seed; "
+                             "use --layout open to vary them")
+    parser.add_argument('--layout', choices=['custom', 'open'], default='custom')
+    parser.add_argument('--width', type=int, default=20)
+    parser.add_argument('--height', type=int, default=10)
+    parser.add_argument('--num-ghosts', type=int, default=2)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--max-turns', type=int, default=300)
+    parser.add_argument('--samples', type=int, default=None, help="expectimax only")
+    parser.add_argument('--candidates', type=int, default=16, help="weights raced, the start weights included")
+    parser.add_argument('--games', type=int, default=4, help="games per candidate in the first rung")
+    parser.add_argument('--eta', type=int, default=2, help="keep 1/eta of the candidates per rung")
+    parser.add_argument('--max-games', type=int, default=64, help="most games per candidate")
+    parser.add_argument('--spread', type=float, default=1.0, help="log-scale spread of the sampled weights")
+    parser.add_argument('--start', default=None,
+                        help="weights to start from, five comma-separated numbers (default: the script's WEIGHTS)")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the candidates; games use seeds 0, 1, ...")
+    parser.add_argument('--cache', default='tuning_cache.jsonl',
+                        help="finished games are kept here, so a stopped run picks up where it was")
+    parser.add_argument('--workers', type=int, default=None, help="processes to use (default: all cores)")
+    args = parser.parse_args()
+    if args.agent == 'expectimax' and args.ghosts != 'random':
+        parser.error("--agent expectimax needs --ghosts random")
+    if args.samples is not None and args.agent != 'expectimax':
+        parser.error("--samples needs --agent expectimax")
+    start = [float(value) for value in args.start.split(',')] if args.start else None
+    if start is not None and len(start) != 5:
+        parser.error("--start needs five comma-separated numbers")
+
+    best, best_score, start, start_score = tune(
+        args.agent, args.ghosts, args.candidates, args.games, args.eta, args.max_games, args.spread, start,
+        ResultCache(args.cache), args.workers, args.seed, layout=args.layout, width=args.width,
+        height=args.height, num_ghosts=args.num_ghosts, depth=args.depth, max_turns=args.max_turns,
+        samples=args.samples)
+    print(f"Best weights: {dict(zip(NAMES, best))}, mean score {best_score:.1f}")
+    print(f"Start weights: {dict(zip(NAMES, start))}, mean score {start_score:.1f} on the same games")
+    print(f"WEIGHTS = {best}")
+
+
+if __name__ == "__main__":
+    main()
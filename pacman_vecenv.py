@@ -0,0 +1,189 @@
+import argparse
+from time import perf_counter
+
+import numpy as np
+
+from pacman_layouts import compile_layout
+from pacman_maze import DIRECTIONS, MoveTable
+from pacman_scripts import load_script
+
+PELLET = '.'
+
+# Score of a turn, as in the games: a pellet eaten or a move without one
+PELLET_REWARD = 10
+MOVE_REWARD = -1
+
+FAR = np.iinfo(np.int16).max  # Pellet distance of a game with no pellet left, as in DistanceTable
+
+
+# batch games of one layout played in lockstep, held as NumPy arrays with one row per game:
+# pacman (batch,) and ghosts (batch, ghosts) are cell ids, pellets (batch, cells) is the mask of
+# the pellets left, and score, turns and left (pellets left) are per game. step() applies one
+# action per game, DIRECTIONS indices, with the rules of the Random scripts: Pac-Man moves (a
+# move into a wall stays put) and eats, then every ghost steps in a random direction, and a
+# game ends when a ghost is on Pac-Man's cell, the pellets are gone or max_turns is reached.
+# A catch is only checked after the ghosts move, as the scripts check is_game_over(): a ghost
+# and Pac-Man swapping cells, or Pac-Man stepping onto a ghost that then steps away, is not one.
+# With ghost_greedy each ghost steps towards Pac-Man with that probability instead, as in MCTS.
+# Finished games start over within the same step(); their results are left in final_score,
+# final_turns, final_win and final_caught.
+# The layout (custom_layout by default) is compiled by pacman_layouts.compile_layout(), so with
+# cache_dir its tables are memory-mapped from the compiled file after the first run. Layouts of
+# more than MAX_DISTANCE_CELLS cells have no distance matrix: play them with random actions
+# and without ghost_greedy.
+class VecEnv:
+    def __init__(self, batch=1024, layout=None, max_turns=500, ghost_greedy=0.0, seed=None, cache_dir=None):
+        game = load_script('alphabeta-random')
+        compiled = compile_layout(layout or game.custom_layout, cache_dir)
+        board, pacman_pos, ghost_pos = compiled.parse()
+        self.board = board
+        self.cell_ids = compiled.cell_ids
+        self.cells = compiled.cells  # (cells, 2) rows and columns by cell id
+        self.steps = compiled.steps
+        self.matrix = compiled.distances
+        self.batch = batch
+        self.num_ghosts = len(ghost_pos)
+        self.max_turns = max_turns
+        self.ghost_greedy = ghost_greedy
+        self.rng = np.random.default_rng(seed)
+
+        self.start_pacman = int(self.cell_ids[pacman_pos])
+        self.start_ghosts = np.array([self.cell_ids[pos] for pos in ghost_pos], dtype=np.int32)
+        self.start_pellets = board[self.cells[:, 0], self.cells[:, 1]] == PELLET
+        self.start_left = int(self.start_pellets.sum())
+
+        self.rows = np.arange(batch)
+        self.pacman = np.empty(batch, dtype=np.int32)
+        self.ghosts = np.empty((batch, self.num_ghosts), dtype=np.int32)
+        self.pellets = np.empty((batch, len(self.cells)), dtype=bool)
+        self.left = np.empty(batch, dtype=np.int32)
+        self.score = np.empty(batch, dtype=np.int32)
+        self.turns = np.empty(batch, dtype=np.int32)
+        self.final_score = np.zeros(batch, dtype=np.int32)
+        self.final_turns = np.zeros(batch, dtype=np.int32)
+        self.final_win = np.zeros(batch, dtype=bool)
+        self.final_caught = np.zeros(batch, dtype=bool)
+        self.games_played = 0  # Games finished since the environment was made
+        self.reset()
+
+    # Puts the games where done is True (all of them when None) back at the start
+    def reset(self, done=None):
+        games = slice(None) if done is None else done
+        self.pacman[games] = self.start_pacman
+        self.ghosts[games] = self.start_ghosts
+        self.pellets[games] = self.start_pellets
+        self.left[games] = self.start_left
+        self.score[games] = 0
+        self.turns[games] = 0
+
+    # Plays one turn of every game. actions is a (batch,) array of DIRECTIONS indices.
+    # Returns each game's reward (its score change) and the mask of the games that ended.
+    def step(self, actions):
+        rows = self.rows
+        self.pacman = self.steps[self.pacman, actions]
+        eats = self.pellets[rows, self.pacman]
+        self.pellets[rows, self.pacman] = False
+        self.left -= eats
+        reward = np.where(eats, PELLET_REWARD, MOVE_REWARD)
+        self.score += reward
+
+        self.ghosts = self._move_ghosts()
+        self.turns += 1
+        caught = (self.ghosts == self.pacman[:, None]).any(axis=1)  # After the ghosts' move only, as in the scripts
+        won = ~caught & (self.left == 0)
+        done = caught | won | (self.turns >= self.max_turns)
+        if done.any():
+            np.copyto(self.final_score, self.score, where=done)
+            np.copyto(self.final_turns, self.turns, where=done)
+            np.copyto(self.final_win, won, where=done)
+            np.copyto(self.final_caught, caught, where=done)
+            self.games_played += int(done.sum())
+            self.reset(done)
+        return reward, done
+
+    def _move_ghosts(self):
+        options = self.steps[self.ghosts]  # (batch, ghosts, 4)
+        choice = self.rng.integers(len(DIRECTIONS), size=self.ghosts.shape)
+        if self.ghost_greedy > 0:
+            closeness = self.matrix[options, self.pacman[:, None, None]] + self.rng.random(options.shape)
+            greedy = self.rng.random(self.ghosts.shape) < self.ghost_greedy
+            choice = np.where(greedy, closeness.argmin(axis=2), choice)
+        return np.take_along_axis(options, choice[:, :, None], axis=2)[:, :, 0]
+
+    # (batch, 2) and (batch, ghosts, 2) board positions of Pac-Man and the ghosts
+    def positions(self):
+        return self.cells[self.pacman], self.cells[self.ghosts]
+
+
+# Batch policies, one action per game from the environment's arrays
+
+def random_actions(env):
+    return env.rng.integers(len(DIRECTIONS), size=env.batch)
+
+
+# The move towards the nearest pellet, leaving out moves into walls and onto a cell next to a
+# ghost (when another move is left), with random ties
+def greedy_actions(env):
+    options = env.steps[env.pacman]  # (batch, 4)
+    distance = np.where(env.pellets[:, None, :], env.matrix[options], FAR).min(axis=2)
+    cost = distance + env.rng.random(options.shape)
+    ghost_distance = env.matrix[options[:, :, None], env.ghosts[:, None, :]].min(axis=2)
+    cost += 2 * FAR * (ghost_distance <= 1)
+    cost[options == env.pacman[:, None]] = np.inf
+    return cost.argmin(axis=1)
+
+
+POLICIES = {'random': random_actions, 'greedy': greedy_actions}
+
+
+# Function to measure game-steps per second: steps turns of batch games with a policy.
+# Returns (game-steps per second, games finished, their mean score).
+def benchmark(batch, policy='random', steps=1000, ghost_greedy=0.0, seed=0):
+    env = VecEnv(batch, ghost_greedy=ghost_greedy, seed=seed)
+    choose = POLICIES[policy]
+    scores = []
+    start = perf_counter()
+    for _ in range(steps):
+        _, done = env.step(choose(env))
+        if done.any():
+            scores.append(env.final_score[done])
+    elapsed = perf_counter() - start
+    scores = np.concatenate(scores) if scores else np.zeros(0)
+    return batch * steps / elapsed, len(scores), float(scores.mean()) if len(scores) else 0.0
+
+
+# The same turns played one game at a time with MoveTable.step(), for comparison
+def benchmark_scalar(steps=20000, seed=0):
+    game = load_script('alphabeta-random')
+    board, pacman_pos, ghost_pos = game.create_custom_layout(game.custom_layout)
+    moves = MoveTable(board)
+    rng = np.random.default_rng(seed)
+    start_board, start_pacman, start_ghosts = board.copy(), pacman_pos, list(ghost_pos)
+    start = perf_counter()
+    for action, ghost_actions in zip(rng.integers(4, size=steps), rng.integers(4, size=(steps, len(ghost_pos)))):
+        pacman_pos = moves.step(pacman_pos, DIRECTIONS[action])
+        if board[pacman_pos] == PELLET:
+            board[pacman_pos] = ' '
+        ghost_pos = [moves.step(pos, DIRECTIONS[d]) for pos, d in zip(ghost_pos, ghost_actions)]
+        if game.is_game_over(pacman_pos, ghost_pos):
+            board, pacman_pos, ghost_pos = start_board.copy(), start_pacman, list(start_ghosts)
+    return steps / (perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Game-steps per second of the vectorized environment.")
+    parser.add_argument('--batch', type=int, nargs='+', default=[1, 64, 1024, 4096])
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='random')
+    parser.add_argument('--steps', type=int, default=500)
+    parser.add_argument('--ghost-greedy', type=float, default=0.0)
+    args = parser.parse_args()
+
+    print(f"One game at a time: {benchmark_scalar():,.0f} steps/s")
+    print(f"{'batch':>6} {'steps/s':>12} {'games':>7} {'mean score':>10}")
+    for batch in args.batch:
+        rate, games, mean_score = benchmark(batch, args.policy, args.steps, args.ghost_greedy)
+        print(f"{batch:>6} {rate:>12,.0f} {games:>7} {mean_score:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import pytest
+
+from pacman_maze import DistanceTable, MoveTable
+from pacman_pellets import PelletIndex
+from pacman_scripts import load_script
+
+GAMES = {name: load_script(name) for name in ('alphabeta', 'alphabeta-random')}
+BOARD, PACMAN_POS, GHOST_POS = GAMES['alphabeta'].create_custom_layout(GAMES['alphabeta'].custom_layout)
+MOVES = MoveTable(BOARD)
+
+# Pac-Man on every free cell, with the ghosts where they start and where Pac-Man started
+NODES = [(pos, ghost_pos) for ghost_pos in (GHOST_POS, [PACMAN_POS] + GHOST_POS[1:])
+         for pos in MOVES.cells if pos not in ghost_pos]
+
+
+# Scores each child with evaluate(), eating the pellet Pac-Man moved onto as alphabeta() does
+def evaluate_children(game, children, pellets, distances, weights):
+    scores = []
+    for _, pacman_pos, ghost_pos, _ in children:
+        eats = pacman_pos in pellets
+        if eats:
+            pellets.eat(pacman_pos)
+        scores.append(game.evaluate(pacman_pos, ghost_pos, BOARD, pellets, distances, weights))
+        if eats:
+            pellets.restore(pacman_pos)
+    return scores
+
+
+@pytest.mark.parametrize('weights', [None, (1720, 143, 0, -2190, 2)])
+@pytest.mark.parametrize('distances', [None, DistanceTable(BOARD)])
+@pytest.mark.parametrize('is_max', [True, False])
+@pytest.mark.parametrize('name', GAMES)
+def test_evaluate_batch_matches_evaluate(name, is_max, distances, weights):
+    game = GAMES[name]
+    pellets = PelletIndex(BOARD)
+    # Half the pellets eaten, so that the nearest pellet is not always next door
+    for pos in list(pellets.slots)[::2]:
+        pellets.eat(pos)
+    for pacman_pos, ghost_pos in NODES:
+        # Pac-Man has eaten the pellet of the cell it is on
+        eaten = pacman_pos in pellets
+        if eaten:
+            pellets.eat(pacman_pos)
+        children = game.generate_children(BOARD, pacman_pos, ghost_pos, is_max, pellets=pellets, moves=MOVES)
+        expected = evaluate_children(game, children, pellets, distances, weights)
+        assert game.evaluate_batch(children, pellets, distances, weights) == pytest.approx(expected)
+        if eaten:
+            pellets.restore(pacman_pos)
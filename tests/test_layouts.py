@@ -0,0 +1,74 @@
+import os
+
+import numpy as np
+import pytest
+
+import pacman_layouts
+from pacman_layouts import compile_layout, generate_layout, layout_key, layout_tables, parse_layout
+from pacman_maze import DistanceTable, MoveTable
+from pacman_scripts import load_script
+from pacman_symmetry import SymmetryTable
+
+LAYOUTS = {
+    'custom': load_script('alphabeta').custom_layout,
+    'maze': generate_layout(41, 31, 4, seed=0),
+}
+ARRAYS = ['codes', 'cell_ids', 'cells', 'steps', 'symmetries', 'distances']
+
+
+# A layout compiled into cache_dir and opened again from there gives the arrays it was compiled to
+@pytest.mark.parametrize('name', LAYOUTS)
+def test_compiled_file_round_trip(tmp_path, name):
+    layout = LAYOUTS[name]
+    built = compile_layout(layout)
+    written = compile_layout(layout, tmp_path)
+    assert os.listdir(tmp_path) == [layout_key(layout) + '.npz']
+    opened = compile_layout(layout, tmp_path)
+    assert opened.path == written.path
+    for compiled in (written, opened):
+        for array in ARRAYS:
+            assert isinstance(getattr(compiled, array), np.memmap)
+            assert np.array_equal(getattr(compiled, array), getattr(built, array))
+
+
+# The tables made from a compiled file are those made from the board
+@pytest.mark.parametrize('name', LAYOUTS)
+def test_compiled_tables(tmp_path, name):
+    layout = LAYOUTS[name]
+    compile_layout(layout, tmp_path)
+    compiled = compile_layout(layout, tmp_path)
+    board, pacman_pos, ghost_pos = parse_layout(layout)
+    parsed_board, parsed_pacman_pos, parsed_ghost_pos = compiled.parse()
+    assert np.array_equal(parsed_board, board)
+    assert (parsed_pacman_pos, parsed_ghost_pos) == (pacman_pos, ghost_pos)
+
+    moves, distances = MoveTable(board), DistanceTable(board)
+    assert compiled.move_table(board).moves == moves.moves
+    assert np.array_equal(compiled.distance_table(board).matrix, distances.matrix)
+    table_distances, table_moves = layout_tables(board, layout, tmp_path)
+    assert np.array_equal(table_distances.matrix, distances.matrix)
+    assert table_moves.moves == moves.moves
+
+    symmetries = SymmetryTable(board)
+    assert np.array_equal(compiled.symmetry_table(board).images, symmetries.images)
+
+
+# Layouts with more than MAX_DISTANCE_CELLS cells are stored without a distance matrix
+def test_large_layout_has_no_distances(tmp_path, monkeypatch):
+    monkeypatch.setattr(pacman_layouts, 'MAX_DISTANCE_CELLS', 10)
+    layout = LAYOUTS['custom']
+    compile_layout(layout, tmp_path)
+    compiled = compile_layout(layout, tmp_path)
+    assert compiled.distances is None
+    assert compiled.distance_table() is None
+    assert layout_tables(parse_layout(layout)[0])[0] is None
+
+
+# Any change to the layout or to the file format makes another file
+def test_layout_key(monkeypatch):
+    layout = LAYOUTS['custom']
+    key = layout_key(layout)
+    changed = [layout[0]] + [layout[1][:1] + ('#' if layout[1][1] != '#' else '.') + layout[1][2:]] + layout[2:]
+    assert layout_key(changed) != key
+    monkeypatch.setattr(pacman_layouts, 'ARTIFACT_VERSION', pacman_layouts.ARTIFACT_VERSION + 1)
+    assert layout_key(layout) != key
@@ -0,0 +1,85 @@
+import pytest
+
+from pacman_maze import DistanceTable, MoveTable
+from pacman_pellets import PelletIndex
+from pacman_scripts import load_script
+from pacman_transposition import TranspositionTable
+
+alphabeta_game = load_script('alphabeta')
+minimax_game = load_script('minimax')
+BOARD, PACMAN_POS, GHOST_POS = alphabeta_game.create_custom_layout(alphabeta_game.custom_layout)
+DISTANCES = DistanceTable(BOARD)
+MOVES = MoveTable(BOARD)
+
+# Pac-Man on every free cell of custom_layout, with the ghosts where they start
+POSITIONS = [pos for pos in MOVES.cells if pos not in GHOST_POS]
+
+
+# The Minimax script has WEIGHTS of its own; search with the AlphaBeta script's
+def minimax_score(pacman_pos, is_max, depth, **options):
+    return minimax_game.minimax(BOARD.copy(), pacman_pos, GHOST_POS, 0, depth, is_max, pellets=PelletIndex(BOARD),
+                                distances=DISTANCES, moves=MOVES, weights=alphabeta_game.WEIGHTS, **options)[1]
+
+
+def alphabeta_score(pacman_pos, is_max, depth, **options):
+    return alphabeta_game.alphabeta(BOARD.copy(), pacman_pos, GHOST_POS, 0, is_max, depth,
+                                    pellets=PelletIndex(BOARD), distances=DISTANCES, moves=MOVES, **options)[1]
+
+
+@pytest.mark.parametrize('is_max', [True, False])
+@pytest.mark.parametrize('depth', [1, 2, 3, 4])
+def test_alphabeta_finds_the_minimax_value(depth, is_max):
+    wrong = [pos for pos in POSITIONS
+             if alphabeta_score(pos, is_max, depth) != pytest.approx(minimax_score(pos, is_max, depth))]
+    assert wrong == []
+
+
+
+
+# One table for searches 1 to 6 plies deep, as iterative_deepening() shares it, with and
+# without null windows (pvs) and aspiration windows; the bounds these store must not change
+# the value any search finds
+@pytest.mark.parametrize('pvs, aspiration', [(False, None), (True, None), (False, 1), (True, 1)])
+@pytest.mark.parametrize('is_max', [True, False])
+def test_transposition_table_keeps_the_value(is_max, pvs, aspiration):
+    wrong = []
+    for pos in POSITIONS:
+        tt = TranspositionTable(BOARD.shape, len(GHOST_POS))
+        score = None
+        for depth in range(1, 7):
+            _, score = alphabeta_game.aspiration_search(BOARD.copy(), pos, GHOST_POS, is_max, depth, score, aspiration,
+                                                        tt=tt, pellets=PelletIndex(BOARD), distances=DISTANCES,
+                                                        moves=MOVES, pvs=pvs)
+            if score != pytest.approx(alphabeta_score(pos, is_max, depth)):
+                wrong.append((pos, depth))
+    assert wrong == []
+
+
+
+# Four ghosts spread over the board, so that ghost nodes have BATCH_MIN_CHILDREN children or more
+SPREAD_GHOSTS = MOVES.cells[10::len(MOVES.cells) // 4]
+
+
+# The pellets of the board once Pac-Man has come to pacman_pos, which eats the pellet there
+def pellets_at(pacman_pos):
+    pellets = PelletIndex(BOARD)
+    if pacman_pos in pellets:
+        pellets.eat(pacman_pos)
+    return pellets
+
+
+# Scoring the last ply with evaluate_batch() must not change the value
+@pytest.mark.parametrize('is_max', [True, False])
+@pytest.mark.parametrize('depth', [1, 2, 3, 4])
+def test_batch_leaves_keep_the_value(depth, is_max):
+    wrong = []
+    for pos in MOVES.cells:
+        if pos in SPREAD_GHOSTS:
+            continue
+        batched, plain = (alphabeta_game.alphabeta(BOARD.copy(), pos, SPREAD_GHOSTS, 0, is_max, depth,
+                                                   pellets=pellets_at(pos), distances=DISTANCES, moves=MOVES,
+                                                   batch_leaves=batch_leaves)[1]
+                          for batch_leaves in (True, False))
+        if batched != pytest.approx(plain):
+            wrong.append(pos)
+    assert wrong == []
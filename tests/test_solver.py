@@ -0,0 +1,59 @@
+from itertools import product
+
+import numpy as np
+import pytest
+
+from pacman_maze import number_cells
+from pacman_scripts import load_script
+from pacman_solver import PolicyTable, load_policy, solve
+
+game = load_script('minimax')
+CUSTOM_BOARD, _, _ = game.create_custom_layout(game.custom_layout)
+BOARDS = {
+    'open': (game.create_board(7, 6), 2),  # Mirrored both ways
+    'custom': (CUSTOM_BOARD, 1),  # Mirrored left to right
+}
+
+
+def positions(board, num_ghosts):
+    _, cells = number_cells(board)
+    for pacman_pos, *ghost_pos in product(cells, repeat=1 + num_ghosts):
+        yield pacman_pos, ghost_pos
+
+
+@pytest.fixture(scope='module', params=[(name, ghosts) for name in BOARDS for ghosts in ('search', 'random')],
+                ids='-'.join)
+def solved(request):
+    name, ghosts = request.param
+    board, num_ghosts = BOARDS[name]
+    return board, num_ghosts, solve(board, num_ghosts, ghosts)
+
+
+# A saved table, folded or not, loads back with the same arrays and gives the same moves everywhere
+@pytest.mark.parametrize('folded', [False, True])
+def test_save_load_round_trip(tmp_path, solved, folded):
+    board, num_ghosts, table = solved
+    if folded:
+        table = table.fold()
+    path = tmp_path / 'policy.npz'
+    table.save(path)
+    loaded = load_policy(path)
+    assert isinstance(loaded, PolicyTable)
+    assert loaded.ghosts == table.ghosts
+    assert loaded.folded == folded
+    assert loaded.num_ghosts == num_ghosts
+    for array in ('walls', 'values', 'policy'):
+        assert np.array_equal(getattr(loaded, array), getattr(table, array))
+    if folded:
+        assert np.array_equal(loaded.pacman_cells, table.pacman_cells)
+    for pacman_pos, ghost_pos in positions(board, num_ghosts):
+        assert loaded.best_moves(pacman_pos, ghost_pos) == table.best_moves(pacman_pos, ghost_pos)
+
+
+# Folding keeps every position's best moves and drops the rows of mirror images
+def test_fold_keeps_best_moves(solved):
+    board, num_ghosts, table = solved
+    folded = table.fold()
+    assert folded.nbytes < table.nbytes
+    for pacman_pos, ghost_pos in positions(board, num_ghosts):
+        assert sorted(folded.best_moves(pacman_pos, ghost_pos)) == sorted(table.best_moves(pacman_pos, ghost_pos))
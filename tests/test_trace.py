@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from pacman_scripts import load_script
+from pacman_trace import Trace, TraceWriter
+
+game = load_script('alphabeta')
+BOARD, PACMAN_POS, GHOST_POS = game.create_custom_layout(game.custom_layout)
+
+
+# The records of a short game: turn, Pac-Man, ghosts, move, score, search time, nodes, depth
+def turns(seed, count=5):
+    rng = np.random.default_rng(seed)
+    records = [(0, PACMAN_POS, GHOST_POS, (0, 0), 0, 0.0, 0, 0)]
+    for turn in range(1, count):
+        cells = [tuple(int(x) for x in rng.integers(0, BOARD.shape)) for _ in range(1 + len(GHOST_POS))]
+        records.append((turn, cells[0], cells[1:], (0, 1), int(rng.integers(-500, 500)), float(rng.random()),
+                        int(rng.integers(0, 10_000)), 3))
+    return records
+
+
+def check_game(trace, game_id, records):
+    read = trace.game(game_id)
+    assert len(read) == len(records)
+    for row, (turn, pacman_pos, ghost_pos, move, score, search_time, nodes, depth) in zip(read, records):
+        assert row['game'] == game_id
+        assert row['turn'] == turn
+        assert tuple(row['pacman']) == pacman_pos
+        assert [tuple(pos) for pos in row['ghosts']] == ghost_pos
+        assert tuple(row['move']) == move
+        assert row['score'] == score
+        assert row['search_time'] == pytest.approx(search_time)
+        assert row['nodes'] == nodes
+        assert row['depth'] == depth
+
+
+# Two games appended turn by turn at the same time come back apart, each in turn order
+def test_round_trip(tmp_path):
+    path = tmp_path / 'games.trace'
+    games = {3: turns(0), 1: turns(1, count=7)}
+    writers = {game_id: TraceWriter(path, BOARD, len(GHOST_POS), game_id) for game_id in games}
+    for turn in range(7):
+        for game_id, records in games.items():
+            if turn < len(records):
+                writers[game_id].append(*records[turn])
+    for writer in writers.values():
+        writer.close()
+
+    trace = Trace(path)
+    assert np.array_equal(trace.board, BOARD)
+    assert trace.num_ghosts == len(GHOST_POS)
+    assert list(trace.games) == [1, 3]
+    for game_id, records in games.items():
+        check_game(trace, game_id, records)
+    assert trace.summary() == [
+        {'game': game_id, 'turns': records[-1][0], 'score': records[-1][4],
+         'search_time': pytest.approx(sum(record[5] for record in records), rel=1e-6)}
+        for game_id, records in sorted(games.items())]
+
+
+# A game recorded again under an id the file holds gets the next free id
+def test_taken_id_gets_the_next_free_one(tmp_path):
+    path = tmp_path / 'games.trace'
+    for seed, expected_id in [(0, 0), (1, 1), (2, 2)]:
+        writer = TraceWriter(path, BOARD, len(GHOST_POS), 0)
+        assert writer.game == expected_id
+        for record in turns(seed):
+            writer.append(*record)
+        writer.close()
+    trace = Trace(path)
+    for seed in range(3):
+        check_game(trace, seed, turns(seed))
+
+
+def test_duplicate_ids_are_rejected(tmp_path):
+    path = tmp_path / 'games.trace'
+    # Both writers open the file before either has written, so both keep id 0
+    writers = [TraceWriter(path, BOARD, len(GHOST_POS), 0) for _ in range(2)]
+    for seed, writer in enumerate(writers):
+        for record in turns(seed):
+            writer.append(*record)
+        writer.close()
+    with pytest.raises(ValueError, match="more than one game with id 0"):
+        Trace(path)
+
+
+def test_other_board_is_rejected(tmp_path):
+    path = tmp_path / 'games.trace'
+    TraceWriter(path, BOARD, len(GHOST_POS)).close()
+    with pytest.raises(ValueError):
+        TraceWriter(path, BOARD, len(GHOST_POS) + 1)
+    with pytest.raises(ValueError):
+        TraceWriter(path, BOARD[:, ::-1].copy(), len(GHOST_POS))